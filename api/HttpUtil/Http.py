@@ -1,25 +1,131 @@
+"""Http 请求封装：
+    使用长连接池替代每次请求都新建 TCP（及 TLS）连接的 requests.get/post
+    - 默认基于 requests.Session + HTTPAdapter，连接池大小、keep-alive、连接超时与读取超时可配置
+    - 可选 HTTP/2（httpx + h2），单个连接上多路复用多个请求，未安装 h2 时回退为 requests
+    - stats() 返回请求数、已建立的连接数与空闲连接数，用于观察连接复用情况
+    - 请求数、延迟与新建连接数同时记录到 Metrics（<metrics_prefix>.requests / latency / connections_opened），
+      工作进程中的连接池情况由此汇总到主进程的 /system_manager/dialogue_stats
+"""
+import logging
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, Any, Optional
 
+from utils.metrics import Metrics
+
+logger = logging.getLogger("Http")
+
+
+def http2_available() -> bool:
+    """httpx 的 HTTP/2 支持依赖 h2，未安装时记录警告"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("未安装 h2，HTTP/2 不可用，回退为 HTTP/1.1 连接池（pip install httpx[http2]）")
+        return False
+
+
+def _counting_pool(pool_cls, name: str):
+    """连接池建立新连接时计数（requests 模式）"""
+    class CountingPool(pool_cls):
+        def _new_conn(self):
+            Metrics.incr(name)
+            return super()._new_conn()
+    CountingPool.__name__ = pool_cls.__name__
+    return CountingPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    """新建连接时记录 <metrics_prefix>.connections_opened，而不是每次请求后遍历连接池"""
+    __attrs__ = HTTPAdapter.__attrs__ + ['metrics_prefix']
+
+    def __init__(self, metrics_prefix: str, **kwargs):
+        self.metrics_prefix = metrics_prefix
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        name = f'{self.metrics_prefix}.connections_opened'
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: _counting_pool(pool_cls, name)
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
 class Http:
-    def __init__(self, base_url: str, headers: Optional[Dict[str, str]] = None):
+    def __init__(self, base_url: str, headers: Optional[Dict[str, str]] = None, pool_size: int = 10,
+                 keep_alive: bool = True, connect_timeout: float = 5, read_timeout: float = 30, http2: bool = False,
+                 metrics_prefix: str = 'http'):
+        """
+        Args:
+            base_url: 服务地址
+            headers: 默认请求头
+            pool_size: 连接池大小（同一服务同时保持的最大连接数）
+            keep_alive: 是否复用连接，关闭后每次请求结束即断开
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应的超时时间（秒）
+            http2: 是否使用 HTTP/2（需要安装 h2）
+            metrics_prefix: 记录到 Metrics 的指标名前缀
+        """
         self.base_url = base_url
         self.headers = headers or {}
-        self.timeout = 30  # 默认超时时间
+        self.pool_size = max(1, int(pool_size))
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.timeout = read_timeout  # 默认超时时间
+        self.metrics_prefix = metrics_prefix
+        self._requests = 0
+        self._lock = threading.Lock()
+        if not keep_alive:
+            self.headers.setdefault('Connection', 'close')
+        self.client = self._create_http2_client() if http2 else None
+        self.session = requests.Session()
+        adapter = _CountingAdapter(metrics_prefix, pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _create_http2_client(self):
+        if not http2_available():
+            return None
+        import httpx
+        return httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=self.pool_size,
+                                max_keepalive_connections=self.pool_size if self.keep_alive else 0),
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+        )
+
+    @property
+    def backend(self) -> str:
+        return 'httpx-http2' if self.client is not None else 'requests'
+
+    def _request(self, method: str, address: str, **kwargs):
+        start = time.monotonic()
+        try:
+            if self.client is not None:
+                response = self.client.request(method, self.base_url + address, headers=self.headers, **kwargs)
+            else:
+                response = self.session.request(method, self.base_url + address, headers=self.headers,
+                                                timeout=(self.connect_timeout, self.timeout), **kwargs)
+        finally:
+            with self._lock:
+                self._requests += 1
+            Metrics.observe(f'{self.metrics_prefix}.latency', time.monotonic() - start)
+            Metrics.incr(f'{self.metrics_prefix}.requests')
+        return response
 
     def get(self, address: str, params: Optional[Dict[str, Any]] = None) -> requests.Response:
         """发送 GET 请求"""
         try:
             if hasattr(params, '__dict__'):
-                json = params.__dict__
+                params = params.__dict__
 
-            return requests.get(
-                self.base_url + address,
-                params=params,
-                headers=self.headers,
-                timeout=self.timeout
-            )
-        except requests.RequestException as e:
+            return self._request('GET', address, params=params)
+        except Exception as e:
             print(f"GET 请求失败: {str(e)}")
             raise
 
@@ -29,14 +135,25 @@ class Http:
             # 如果是对象，转换为字典
             if hasattr(json, '__dict__'):
                 json = json.__dict__
-            
-            return requests.post(
-                self.base_url + address,
-                json=json,
-                headers=self.headers,
-                timeout=self.timeout
-            )
-        except requests.RequestException as e:
+
+            return self._request('POST', address, json=json)
+        except Exception as e:
+            print(f"POST 请求失败: {str(e)}")
+            raise
+
+    def post_stream(self, address: str, json: Optional[Dict[str, Any]] = None):
+        """发送 POST 请求并流式读取响应（SSE / 分块传输），调用方读取完毕后需调用 response.close()
+
+        读取超时作用于相邻两次收到数据之间，而不是整个响应
+        """
+        try:
+            if hasattr(json, '__dict__'):
+                json = json.__dict__
+            if self.client is not None:
+                request = self.client.build_request('POST', self.base_url + address, headers=self.headers, json=json)
+                return self.client.send(request, stream=True)
+            return self._request('POST', address, json=json, stream=True)
+        except Exception as e:
             print(f"POST 请求失败: {str(e)}")
             raise
 
@@ -45,25 +162,16 @@ class Http:
         try:
             if hasattr(data, '__dict__'):
                 data = data.__dict__
-            return requests.put(
-                self.base_url + address,
-                data=data,
-                headers=self.headers,
-                timeout=self.timeout
-            )
-        except requests.RequestException as e:
+            return self._request('PUT', address, data=data)
+        except Exception as e:
             print(f"PUT 请求失败: {str(e)}")
             raise
 
     def delete(self, address: str) -> requests.Response:
         """发送 DELETE 请求"""
         try:
-            return requests.delete(
-                self.base_url + address,
-                headers=self.headers,
-                timeout=self.timeout
-            )
-        except requests.RequestException as e:
+            return self._request('DELETE', address)
+        except Exception as e:
             print(f"DELETE 请求失败: {str(e)}")
             raise
 
@@ -78,11 +186,11 @@ class Http:
     def download_file(self, address: str, save_path: str) -> bool:
         """下载文件"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 self.base_url + address,
                 headers=self.headers,
                 stream=True,
-                timeout=self.timeout
+                timeout=(self.connect_timeout, self.timeout)
             )
             response.raise_for_status()
             
@@ -93,4 +201,35 @@ class Http:
             return True
         except Exception as e:
             print(f"文件下载失败: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池使用情况
+
+        Returns:
+            backend: requests 或 httpx-http2
+            requests: 已发送的请求数
+            connections_opened: 已建立的连接数（requests 模式），远小于 requests 说明连接被复用
+            idle_connections: 当前空闲可复用的连接数（requests 模式）
+        """
+        stats = {'backend': self.backend, 'pool_size': self.pool_size, 'keep_alive': self.keep_alive,
+                 'requests': self._requests}
+        if self.client is None:
+            opened = idle = 0
+            for adapter in set(self.session.adapters.values()):
+                for key in list(adapter.poolmanager.pools.keys()):
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    opened += pool.num_connections
+                    if pool.pool is not None:
+                        # urllib3 用 None 占位未建立的连接
+                        idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            stats['connections_opened'] = opened
+            stats['idle_connections'] = idle
+        return stats
+
+    def close(self) -> None:
+        self.session.close()
+        if self.client is not None:
+            self.client.close()
\ No newline at end of file
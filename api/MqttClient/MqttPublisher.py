@@ -0,0 +1,203 @@
+"""MQTT 长连接发布器：
+    每个进程维护一个长连接，替代「每条回复新建一次 mqtt.Client 并 connect」的方式
+    - 只在首次使用时连接一次，由 paho 的网络线程（loop_start）负责收发与断线重连
+    - publish 不等待 PUBACK，QoS 1 消息可以同时有多条在途（max_inflight）
+    - broker 不可用时消息先进入内存缓冲区，重新连上后按顺序补发
+    - 可传入 on_ack 回调，QoS 1 消息收到 PUBACK 后调用（持久化队列据此确认消息）
+    - 可传入 on_drop 回调，消息因缓冲区已满被丢弃时调用（对话处理器据此安排重试）
+"""
+import logging
+import os
+import threading
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from globals.global_variable import GlobalVariable
+from utils.metrics import Metrics
+
+logger = logging.getLogger("MqttPublisher")
+
+
+class MqttPublisher(object):
+    _instance = None
+    _pid = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, host: str, port: int = 1883, keepalive: int = 60, buffer_size: int = 10000,
+                 max_inflight: int = 100, reconnect_max_delay: int = 30, client_id: str = ""):
+        """
+        Args:
+            host: broker 地址
+            port: broker 端口
+            keepalive: 心跳间隔（秒）
+            buffer_size: 断线期间内存缓冲区最多保留的消息数，超出时丢弃最旧的消息
+            max_inflight: 同时在途（已发送未收到 PUBACK）的 QoS 1 消息数量上限
+            reconnect_max_delay: 断线重连的最大退避时间（秒）
+            client_id: 客户端ID，为空时由 broker 分配
+        """
+        self.host = host
+        self.port = int(port)
+        self.keepalive = int(keepalive)
+        self.buffer = deque()
+        self.buffer_size = max(0, int(buffer_size))
+        self._lock = threading.Lock()
+        self._ack_lock = threading.Lock()
+        self._ack_callbacks = {}  # mid -> on_ack
+        self._acked_early = set()  # 注册回调前就已收到 PUBACK 的 mid
+        self._connected = False
+        self._started = False
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        self.client.max_inflight_messages_set(max(1, int(max_inflight)))
+        self.client.reconnect_delay_set(min_delay=1, max_delay=max(1, int(reconnect_max_delay)))
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+
+    @classmethod
+    def get_instance(cls) -> 'MqttPublisher':
+        """获取当前进程的发布器，首次调用时根据 mqtt_setting 创建并连接
+
+        fork 出的子进程会继承父进程的实例，但 socket 与网络线程不能跨进程复用，因此按 pid 区分
+        启动失败（如 mqtt_setting 未配置 ip）时抛出异常且不缓存实例，下次调用重新创建
+        """
+        with cls._instance_lock:
+            if cls._instance is None or cls._pid != os.getpid():
+                setting = GlobalVariable.get_setting('mqtt_setting', default={})
+                instance = cls(
+                    host=setting.get('ip'),
+                    port=setting.get('port') or 1883,
+                    keepalive=setting.get('keepalive', 60),
+                    buffer_size=setting.get('buffer_size', 10000),
+                    max_inflight=setting.get('max_inflight', 100),
+                    reconnect_max_delay=setting.get('reconnect_max_delay', 30),
+                )
+                instance.start()
+                cls._instance = instance
+                cls._pid = os.getpid()
+            return cls._instance
+
+    def start(self) -> None:
+        """异步连接并启动网络线程，broker 暂时不可用时由网络线程自动重试"""
+        if self._started:
+            return
+        self.client.connect_async(self.host, self.port, self.keepalive)
+        self.client.loop_start()
+        self._started = True
+
+    def stop(self) -> None:
+        """断开连接并停止网络线程"""
+        if not self._started:
+            return
+        self._started = False
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def publish(self, topic: str, payload: str, qos: int = 1, on_ack=None, on_drop=None) -> bool:
+        """发布消息，不阻塞等待 PUBACK
+
+        Args:
+            on_ack: 可选，broker 确认收到后在网络线程中调用（QoS 0 在发送后即视为确认）
+            on_drop: 可选，该消息在缓冲区中被丢弃时调用
+        Returns:
+            bool: 已发送或已进入缓冲区返回 True，缓冲区已满导致丢弃返回 False
+        """
+        with self._lock:
+            if self._connected and not self.buffer:
+                info = self.client.publish(topic, payload, qos=qos)
+                if self._accepted(info, qos):
+                    Metrics.incr('mqtt.published')
+                    self._register_ack(info.mid, on_ack)
+                    return True
+            return self._buffer(topic, payload, qos, on_ack, on_drop)
+
+    @staticmethod
+    def _accepted(info, qos: int) -> bool:
+        """paho 是否已接管该消息
+
+        QoS > 0 的消息在连接刚断开时返回 MQTT_ERR_NO_CONN，但 paho 已将其保存在 _out_messages 中，
+        重连后会自动重发，此时不能再放入缓冲区，否则会重复发送
+        """
+        return info.rc == mqtt.MQTT_ERR_SUCCESS or (qos > 0 and info.rc == mqtt.MQTT_ERR_NO_CONN)
+
+    def _register_ack(self, mid: int, on_ack) -> None:
+        """登记 mid 对应的回调，PUBACK 可能先于登记到达"""
+        with self._ack_lock:
+            if mid in self._acked_early:
+                self._acked_early.discard(mid)
+            else:
+                self._ack_callbacks[mid] = on_ack
+                return
+        self._run_ack(on_ack)
+
+    @staticmethod
+    def _run_ack(callback) -> None:
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"MQTT 回调异常: {e}", exc_info=True)
+
+    def _buffer(self, topic: str, payload: str, qos: int, on_ack=None, on_drop=None) -> bool:
+        """写入内存缓冲区（调用方需持有 _lock）"""
+        dropped = False
+        if self.buffer_size and len(self.buffer) >= self.buffer_size:
+            self._run_ack(self.buffer.popleft()[4])
+            Metrics.incr('mqtt.dropped')
+            dropped = True
+        if self.buffer_size:
+            self.buffer.append((topic, payload, qos, on_ack, on_drop))
+            Metrics.incr('mqtt.buffered')
+        else:
+            self._run_ack(on_drop)
+            Metrics.incr('mqtt.dropped')
+            dropped = True
+        Metrics.gauge('mqtt.buffer_depth', len(self.buffer))
+        return not dropped
+
+    def _flush_buffer(self) -> None:
+        """连接恢复后按顺序补发缓冲区中的消息（调用方需持有 _lock）"""
+        while self.buffer and self._connected:
+            topic, payload, qos, on_ack, _ = self.buffer[0]
+            info = self.client.publish(topic, payload, qos=qos)
+            if not self._accepted(info, qos):
+                break
+            self.buffer.popleft()
+            Metrics.incr('mqtt.published')
+            self._register_ack(info.mid, on_ack)
+        Metrics.gauge('mqtt.buffer_depth', len(self.buffer))
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logger.error(f"MQTT 连接被拒绝: {reason_code}")
+            return
+        logger.info(f"MQTT 已连接 {self.host}:{self.port}")
+        with self._lock:
+            self._connected = True
+            Metrics.gauge('mqtt.connected', True)
+            self._flush_buffer()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        with self._lock:
+            self._connected = False
+        Metrics.gauge('mqtt.connected', False)
+        if self._started:
+            logger.warning(f"MQTT 连接断开({reason_code})，等待自动重连")
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        Metrics.incr('mqtt.acked')
+        with self._ack_lock:
+            if mid not in self._ack_callbacks:
+                self._acked_early.add(mid)
+                return
+            on_ack = self._ack_callbacks.pop(mid)
+        self._run_ack(on_ack)
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def pending(self) -> int:
+        """缓冲区中等待发送的消息数量"""
+        return len(self.buffer)
@@ -0,0 +1,5 @@
+"""提供进程级长连接的 MQTT 发布器"""
+
+from .MqttPublisher import MqttPublisher
+
+__all__ = ['MqttPublisher']
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import httpx
+
+from api.HttpUtil.Http import http2_available
+from api.RagClient.BackendPool import Backend
+from api.RagClient.CircuitBreaker import CircuitOpenError, healthy_response
+from api.RagClient.RagClient import (RagClient, STREAM_DONE, conversation_id_of, is_stream, limiter_outcome,
+                                     parse_stream_line, stream_request, text_of)
+from api.RagClient.models import ChatList, ChatMessage, CreateChat
+from globals.global_variable import GlobalVariable
+from utils.metrics import Metrics
+
+logger = logging.getLogger("AsyncRagClient")
+
+
+class AsyncRagClient(object):
+    """RagClient 的异步版本，供异步对话引擎使用
+
+    基于 httpx.AsyncClient，等待 RAG 生成回复时不占用线程，单个进程可以同时等待多个会话
+    - 同一进程、同一事件循环内的所有请求共用一个连接池（连接池参数读取 rag_setting）
+    - 每次调用可指定 timeout（相对时间）或 deadline（time.monotonic() 绝对时间），超时后放弃请求并返回 None
+    - 取消调用所在的任务时请求随之中止，连接归还连接池，asyncio.CancelledError 继续向上抛出
+    - stream_chat 以异步生成器逐段返回生成的文本（SSE / 分块传输）
+    - 与 RagClient 共用后端列表与各后端的熔断器，熔断器打开时直接返回 None；list_chats 可按 p95 耗时发送对冲请求（只对冲幂等的读请求，post_chat 不对冲）
+    - 开启 adaptive_concurrency 时与 RagClient 共用各后端的并发限制器，排队时间计入调用的 timeout / deadline
+    - 各方法的 backend 参数指定对话所在的后端（粘性路由），为空时发往默认后端
+    """
+    _client: Optional[httpx.AsyncClient] = None
+    _owner = None  # (进程ID, 事件循环)，httpx.AsyncClient 不能跨事件循环或 fork 复用
+    timeout = 30  # 默认超时时间
+
+    @classmethod
+    def _get_client(cls) -> httpx.AsyncClient:
+        owner = (os.getpid(), asyncio.get_running_loop())
+        if cls._client is None or cls._owner != owner:
+            setting = GlobalVariable.config['categories']['rag_setting']
+            # 连接数上限对所有后端合计，按后端数量放大，使每个后端可用的连接数与 pool_size 一致
+            pool_size = setting.get('pool_size', 10) * len(RagClient.pool().backends)
+            cls.timeout = setting.get('read_timeout', cls.timeout)
+            cls._client = httpx.AsyncClient(
+                http2=bool(setting.get('http2', False)) and http2_available(),
+                limits=httpx.Limits(max_connections=pool_size,
+                                    max_keepalive_connections=pool_size if setting.get('keep_alive', True) else 0),
+                # 等待连接池空闲连接的时间不单独限制，由调用的 deadline 控制
+                timeout=httpx.Timeout(cls.timeout, connect=setting.get('connect_timeout', 5), pool=None),
+            )
+            cls._owner = owner
+        return cls._client
+
+    @classmethod
+    async def _request(cls, method: str, address: str, timeout: Optional[float] = None,
+                       deadline: Optional[float] = None, hedge: bool = False, backend: Optional[str] = None,
+                       **kwargs) -> Optional[httpx.Response]:
+        """发送请求，超时、失败或熔断器打开时返回 None
+
+        Args:
+            timeout: 本次调用的最长等待时间（秒），默认为 read_timeout
+            deadline: 绝对截止时间（time.monotonic()），与 timeout 同时指定时取较早者
+            hedge: 开启对冲时，超过近期 p95 耗时仍未返回则再发送一次，取先成功返回的结果（只能用于幂等的读请求）
+            backend: 后端名称，为空时为默认后端
+        """
+        client = cls._get_client()
+        target = RagClient.pool().get(backend)
+        breaker = target.breaker
+        start = time.monotonic()
+        remaining = cls._remaining(timeout, deadline)
+        if remaining <= 0:
+            Metrics.incr('rag.deadline_exceeded')
+            logger.warning(f"{method} {address} 已超过截止时间，不再发送")
+            return None
+        if not breaker.allow():
+            logger.warning(f"rag 后端 {target.name} 熔断器已打开，{method} {address} 未发送")
+            return None
+        send = lambda: cls._attempt(target, client.request(method, target.url + address, **kwargs))
+        try:
+            if hedge and RagClient.hedge_enabled():
+                return await asyncio.wait_for(cls._hedged(target, send), remaining)
+            return await asyncio.wait_for(send(), remaining)
+        except asyncio.TimeoutError:
+            breaker.record(False, time.monotonic() - start)
+            Metrics.incr('rag.deadline_exceeded')
+            logger.error(f"{method} 请求超时（{remaining:.1f} 秒）: {address}")
+            return None
+        except asyncio.CancelledError:
+            Metrics.incr('rag.cancelled')
+            raise
+        except Exception as e:
+            logger.error(f"{method} 请求失败: {e}")
+            return None
+        finally:
+            Metrics.observe('rag.latency', time.monotonic() - start)
+
+    @classmethod
+    async def _attempt(cls, backend: Backend, request) -> httpx.Response:
+        """等待一次请求并计入熔断器与并发限制器统计，被取消时不计入"""
+        limiter = backend.limiter
+        try:
+            permit = await limiter.acquire_async() if limiter is not None else None
+        except BaseException:
+            request.close()
+            raise
+        start = time.monotonic()
+        try:
+            with backend.track():
+                res = await request
+        except asyncio.CancelledError:
+            backend.breaker.release()
+            if permit is not None:
+                limiter.release(permit, None)
+            raise
+        except Exception as e:
+            backend.breaker.record(False, time.monotonic() - start)
+            if permit is not None:
+                limiter.release(permit, limiter_outcome(error=e))
+            raise
+        backend.breaker.record(healthy_response(res), time.monotonic() - start)
+        if permit is not None:
+            limiter.release(permit, limiter_outcome(res))
+        return res
+
+    @classmethod
+    async def _hedged(cls, backend: Backend, send) -> httpx.Response:
+        """第一个请求超过 p95 耗时后发送对冲请求，返回先成功的结果并取消另一个"""
+        breaker = backend.breaker
+        delay = breaker.p95()
+        tasks = {asyncio.ensure_future(send())}
+        first = next(iter(tasks))
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and breaker.allow():
+                    Metrics.incr('rag.hedged')
+                    tasks.add(asyncio.ensure_future(send()))
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and healthy_response(task.result()):
+                        if task is not first:
+                            Metrics.incr('rag.hedge_won')
+                        return task.result()
+            return first.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @classmethod
+    def _remaining(cls, timeout: Optional[float], deadline: Optional[float]) -> float:
+        remaining = cls.timeout if timeout is None else timeout
+        if deadline is not None:
+            remaining = min(remaining, deadline - time.monotonic())
+        return remaining
+
+    @classmethod
+    async def _wait(cls, awaitable, timeout: Optional[float], deadline: Optional[float]):
+        """等待流式响应的下一步，超时抛出 asyncio.TimeoutError"""
+        try:
+            return await asyncio.wait_for(awaitable, max(cls._remaining(timeout, deadline), 0))
+        except asyncio.TimeoutError:
+            Metrics.incr('rag.deadline_exceeded')
+            raise
+        except asyncio.CancelledError:
+            Metrics.incr('rag.cancelled')
+            raise
+
+    """发送chat消息"""
+    @classmethod
+    async def post_chat(cls, chatMessage: ChatMessage, timeout: Optional[float] = None,
+                        deadline: Optional[float] = None, backend: Optional[str] = None):
+        return await cls._request('POST', '/api/chat/conversation_chat', timeout, deadline, backend=backend,
+                                  json=chatMessage.__dict__)
+
+    """流式发送chat消息，逐段返回生成的文本"""
+    @classmethod
+    async def stream_chat(cls, chatMessage: ChatMessage, timeout: Optional[float] = None,
+                          deadline: Optional[float] = None, backend: Optional[str] = None):
+        """timeout 限制相邻两段文本之间的等待时间，deadline 限制整个回复；超时或请求失败时抛出异常
+
+        rag 不支持流式而返回完整 JSON 时，整段文本作为一段返回
+        """
+        client = cls._get_client()
+        target = RagClient.pool().get(backend)
+        breaker = target.breaker
+        if not breaker.allow():
+            raise CircuitOpenError(f"rag 后端 {target.name} 熔断器已打开，请求未发送")
+        request = client.build_request('POST', target.url + '/api/chat/conversation_chat', json=stream_request(chatMessage))
+        # 熔断器按收到响应头的耗时统计，生成全文的耗时取决于回复长度
+        start = time.monotonic()
+        try:
+            res = await cls._wait(cls._attempt(target, client.send(request, stream=True)), timeout, deadline)
+        except asyncio.TimeoutError:
+            breaker.record(False, time.monotonic() - start)
+            raise
+        try:
+            res.raise_for_status()
+            if not is_stream(res):
+                await cls._wait(res.aread(), timeout, deadline)
+                yield text_of(res.json())
+                return
+            event_stream = 'text/event-stream' in res.headers.get('content-type', '')
+            lines = res.aiter_lines()
+            while True:
+                try:
+                    line = await cls._wait(lines.__anext__(), timeout, deadline)
+                except StopAsyncIteration:
+                    return
+                delta = parse_stream_line(line, event_stream)
+                if delta is STREAM_DONE:
+                    return
+                if delta:
+                    yield delta
+        finally:
+            await res.aclose()
+
+    """获取chat列表"""
+    @classmethod
+    async def list_chats(cls, chatList: ChatList | None = None, timeout: Optional[float] = None,
+                         deadline: Optional[float] = None, backend: Optional[str] = None):
+        if chatList is None:
+            chatList = ChatList()
+        return await cls._request('GET', '/api/conversation/conversations', timeout, deadline, hedge=True,
+                                  backend=backend, params=chatList.__dict__)
+
+    """创建chat"""
+    @classmethod
+    async def create_chat(cls, createChat: CreateChat, timeout: Optional[float] = None,
+                          deadline: Optional[float] = None, backend: Optional[str] = None):
+        return await cls._request('POST', '/api/conversation', timeout, deadline, backend=backend,
+                                  json=createChat.__dict__)
+
+    """创建chat，返回 (新对话ID, 所在后端)"""
+    @classmethod
+    async def create_conversation(cls, createChat: CreateChat, timeout: Optional[float] = None,
+                                  deadline: Optional[float] = None):
+        backend = RagClient.pool().pick().name
+        conversation_id = conversation_id_of(await cls.create_chat(createChat, timeout, deadline, backend))
+        return None if conversation_id is None else (conversation_id, backend)
+
+    @classmethod
+    async def close(cls):
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+            cls._owner = None
@@ -0,0 +1,150 @@
+"""rag 多后端负载均衡：
+    rag_setting.backends 配置多个 rag 节点及权重，为空时只使用 rag_setting.url
+    - 新对话分配给 (在途请求数 + 1) / 权重 最小的可用后端（最少在途请求）
+    - 对话创建在哪个后端，之后该对话的所有请求都发往该后端（会话映射中记录后端名称）
+    - 后台线程定期请求 health_check_path 检查后端是否可达，不可达或熔断器打开的后端不再分配新对话
+    - 每个后端有独立的连接池、熔断器与自适应并发限制器（adaptive_concurrency 开启时）
+    旧版本会话映射中没有记录后端的对话视为属于第一个后端
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from api.HttpUtil import Http
+from api.RagClient.CircuitBreaker import CircuitBreaker
+from utils.concurrency_limiter import AdaptiveLimiter
+from utils.metrics import Metrics
+
+logger = logging.getLogger("BackendPool")
+
+
+class Backend:
+    """单个 rag 后端"""
+
+    def __init__(self, name: str, url: str, weight: float, http: Http, breaker: CircuitBreaker,
+                 limiter: Optional[AdaptiveLimiter] = None):
+        self.name = name
+        self.url = url.rstrip('/')
+        self.weight = max(float(weight), 0.01)
+        self.http = http
+        self.breaker = breaker
+        self.limiter = limiter  # 未开启自适应并发时为 None
+        self.healthy = True
+        self.outstanding = 0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """是否可以分配新对话"""
+        return self.healthy and self.breaker.available()
+
+    @contextmanager
+    def track(self):
+        """统计在途请求数"""
+        with self._lock:
+            self.outstanding += 1
+            Metrics.gauge(f'rag.backend.{self.name}.outstanding', self.outstanding)
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.outstanding -= 1
+                Metrics.gauge(f'rag.backend.{self.name}.outstanding', self.outstanding)
+
+
+class BackendPool:
+
+    def __init__(self, backends: List[Backend], health_check_interval: float = 10, health_check_path: str = '/'):
+        """
+        Args:
+            backends: 后端列表，第一个为默认后端
+            health_check_interval: 健康检查间隔（秒），0 表示不检查
+            health_check_path: 健康检查请求的路径，返回非 5xx 即视为可达
+        """
+        if not backends:
+            raise ValueError("rag_setting 中没有可用的 rag 地址")
+        self.backends = backends
+        self.health_check_interval = float(health_check_interval)
+        self.health_check_path = health_check_path
+        self._by_name = {backend.name: backend for backend in backends}
+        self._next = 0  # 负载相同时轮流分配
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @classmethod
+    def from_setting(cls, setting: dict) -> 'BackendPool':
+        """根据 rag_setting 创建，每个后端使用相同的连接池、熔断器与并发限制参数"""
+        entries = setting.get('backends') or [{'name': 'default', 'url': setting['url']}]
+        backends = []
+        for entry in entries:
+            name = entry.get('name') or entry['url']
+            http = Http(
+                entry['url'],
+                pool_size=setting.get('pool_size', 10),
+                keep_alive=setting.get('keep_alive', True),
+                connect_timeout=setting.get('connect_timeout', 5),
+                read_timeout=setting.get('read_timeout', 30),
+                http2=setting.get('http2', False),
+                metrics_prefix=f'rag.backend.{name}',
+            )
+            backends.append(Backend(name, entry['url'], entry.get('weight', 1), http,
+                                    CircuitBreaker.from_setting(setting, name=name),
+                                    AdaptiveLimiter.from_setting(setting, name=f'rag.{name}')))
+        return cls(backends, setting.get('health_check_interval', 10), setting.get('health_check_path', '/'))
+
+    def get(self, name: Optional[str] = None) -> Backend:
+        """按名称取后端（粘性路由），名称为空或已不在配置中时返回第一个后端"""
+        self.start()
+        backend = self._by_name.get(name) if name is not None else None
+        if backend is None:
+            if name is not None:
+                logger.warning(f"rag 后端 {name} 已不在配置中，改用 {self.backends[0].name}")
+            backend = self.backends[0]
+        return backend
+
+    def pick(self) -> Backend:
+        """为新对话选择后端：可用后端中 (在途请求数 + 1) / 权重 最小者，全部不可用时返回第一个后端（由熔断器拒绝）"""
+        self.start()
+        with self._lock:
+            count = len(self.backends)
+            order = [self.backends[(self._next + i) % count] for i in range(count)]
+            self._next = (self._next + 1) % count
+        candidates = [backend for backend in order if backend.available()]
+        if not candidates:
+            return self.backends[0]
+        return min(candidates, key=lambda backend: (backend.outstanding + 1) / backend.weight)
+
+    def start(self) -> None:
+        """在当前进程启动健康检查线程（fork 出的子进程不会继承线程）"""
+        if self.health_check_interval <= 0 or len(self.backends) < 2 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._health_loop, name="rag-health-check", daemon=True).start()
+
+    def check(self) -> None:
+        """检查所有后端是否可达"""
+        for backend in self.backends:
+            try:
+                healthy = backend.http.get(self.health_check_path).status_code < 500
+            except Exception:
+                healthy = False
+            if healthy != backend.healthy:
+                logger.warning(f"rag 后端 {backend.name} {'恢复可用' if healthy else '不可达'}")
+            backend.healthy = healthy
+            Metrics.gauge(f'rag.backend.{backend.name}.healthy', healthy)
+
+    def _health_loop(self) -> None:
+        while True:
+            time.sleep(self.health_check_interval)
+            self.check()
+
+    def stats(self) -> Dict[str, Any]:
+        return {backend.name: dict(backend.http.stats(), healthy=backend.healthy, outstanding=backend.outstanding,
+                                   weight=backend.weight, breaker=backend.breaker.stats(),
+                                   limiter=backend.limiter.stats() if backend.limiter is not None else None)
+                for backend in self.backends}
@@ -0,0 +1,155 @@
+"""rag 熔断器：
+    rag 变慢或不可用时，所有对话工作进程都会卡在请求上直到超时，队列持续增长
+    熔断器按滚动时间窗口统计失败率与慢请求比例：
+    - closed: 正常放行，窗口内请求数达到 min_requests 且失败率或慢请求比例超过阈值时打开
+    - open: 直接拒绝（快速失败，消息交给重试调度器），open_duration 秒后进入 half_open
+    - half_open: 最多放行 half_open_probes 个探测请求，全部成功则关闭，任一失败重新打开
+    窗口内成功请求的 p95 耗时同时用于对冲请求的触发时间
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from utils.metrics import Metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """熔断器已打开，请求未发送"""
+
+
+class CircuitBreaker:
+    """按滚动窗口统计的熔断器（线程安全）"""
+
+    def __init__(self, name: str = 'rag', window: float = 30, min_requests: int = 20, error_rate: float = 0.5,
+                 slow_call_duration: float = 10, slow_call_rate: float = 0.8, open_duration: float = 15,
+                 half_open_probes: int = 3, clock=time.monotonic):
+        """
+        Args:
+            name: 指标名前缀（breaker.<name>.*）
+            window: 滚动窗口长度（秒）
+            min_requests: 窗口内至少有多少次请求才判断是否打开
+            error_rate: 失败率阈值（0 ~ 1）
+            slow_call_duration: 耗时超过该值（秒）的请求视为慢请求
+            slow_call_rate: 慢请求比例阈值（0 ~ 1）
+            open_duration: 打开后多久进入 half_open（秒）
+            half_open_probes: half_open 状态下放行的探测请求数
+        """
+        self.name = name
+        self.window = float(window)
+        self.min_requests = max(1, int(min_requests))
+        self.error_rate = float(error_rate)
+        self.slow_call_duration = float(slow_call_duration)
+        self.slow_call_rate = float(slow_call_rate)
+        self.open_duration = float(open_duration)
+        self.half_open_probes = max(1, int(half_open_probes))
+        self.clock = clock
+        self.state = CLOSED
+        self._calls = deque()  # (时间, 是否成功, 耗时)
+        self._opened_at = 0.0
+        self._probes = 0  # half_open 状态下已放行的探测请求数
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_setting(cls, setting: dict, name: str = 'rag') -> 'CircuitBreaker':
+        """根据 rag_setting 创建"""
+        return cls(
+            name=name,
+            window=setting.get('breaker_window', 30),
+            min_requests=setting.get('breaker_min_requests', 20),
+            error_rate=setting.get('breaker_error_rate', 0.5),
+            slow_call_duration=setting.get('breaker_slow_call_duration', 10),
+            slow_call_rate=setting.get('breaker_slow_call_rate', 0.8),
+            open_duration=setting.get('breaker_open_duration', 15),
+            half_open_probes=setting.get('breaker_half_open_probes', 3),
+        )
+
+    def allow(self) -> bool:
+        """是否放行一次请求，放行后必须调用 record 或 release"""
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self._opened_at < self.open_duration:
+                    Metrics.incr(f'breaker.{self.name}.rejected')
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    Metrics.incr(f'breaker.{self.name}.rejected')
+                    return False
+                self._probes += 1
+            return True
+
+    def available(self) -> bool:
+        """不改变状态地判断是否可能放行（用于负载均衡时挑选后端）"""
+        with self._lock:
+            return self.state != OPEN or self.clock() - self._opened_at >= self.open_duration
+
+    def record(self, success: bool, duration: float) -> None:
+        """记录一次已放行请求的结果"""
+        now = self.clock()
+        with self._lock:
+            self._calls.append((now, success, duration))
+            self._trim(now)
+            if self.state == HALF_OPEN:
+                if not success:
+                    self._transition(OPEN)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(CLOSED)
+                return
+            if self.state == CLOSED and len(self._calls) >= self.min_requests:
+                failures = sum(1 for _, ok, _ in self._calls if not ok)
+                slow = sum(1 for _, _, elapsed in self._calls if elapsed >= self.slow_call_duration)
+                if failures >= self.error_rate * len(self._calls) or slow >= self.slow_call_rate * len(self._calls):
+                    self._transition(OPEN)
+
+    def release(self) -> None:
+        """放行的请求被取消（如对冲请求中较慢的一个），不计入统计"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def p95(self) -> Optional[float]:
+        """窗口内成功请求耗时的 p95，样本不足 min_requests 时返回 None"""
+        with self._lock:
+            self._trim(self.clock())
+            durations = sorted(elapsed for _, ok, elapsed in self._calls if ok)
+        if len(durations) < self.min_requests:
+            return None
+        return durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trim(self.clock())
+            total = len(self._calls)
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            state = self.state
+        return {'state': state, 'requests': total, 'error_rate': failures / total if total else 0.0, 'p95': self.p95()}
+
+    def _trim(self, now: float) -> None:
+        while self._calls and self._calls[0][0] <= now - self.window:
+            self._calls.popleft()
+
+    def _transition(self, state: str) -> None:
+        """切换状态（调用方需持有 _lock）"""
+        self.state = state
+        self._probes = 0
+        self._probe_successes = 0
+        if state == OPEN:
+            self._opened_at = self.clock()
+            Metrics.incr(f'breaker.{self.name}.opened')
+        if state == CLOSED:
+            # 关闭后重新统计，避免打开前的失败立即再次触发
+            self._calls.clear()
+        Metrics.gauge(f'breaker.{self.name}.state', state)
+
+
+def healthy_response(res) -> bool:
+    """rag 响应是否说明服务正常：5xx 与 429 视为失败，其他 4xx 是请求本身的问题"""
+    return res is not None and res.status_code < 500 and res.status_code != 429
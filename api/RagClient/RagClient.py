@@ -1,13 +1,23 @@
+import json
 import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from typing import Optional
+
+import httpx
+import requests
 
 from api.HttpUtil import Http
+from api.RagClient.BackendPool import Backend, BackendPool
+from api.RagClient.CircuitBreaker import CircuitOpenError, healthy_response
 from api.RagClient.models import ChatList, ChatMessage, CreateChat
 from globals.global_variable import GlobalVariable
+from utils.metrics import Metrics
 
 logger = logging.Logger("RagClient")
 class RagClient(object):
-    _http = None
-    count = 0
+    _pool: BackendPool = None  # rag 后端（连接池、熔断器），同一进程内 RagClient 与 AsyncRagClient 共用
+    _hedge_executor = None
     """初始化"""
     def __init__(self, base_url):
         # rag 地址
@@ -16,47 +26,218 @@ class RagClient(object):
 
     @classmethod
     def _init_http(cls):
-        cls._http = Http(GlobalVariable.config['categories']['rag_setting']['url'])
-        res = cls._get_chat_list()
-        cls.count = res.json()['items'][0]['id']
+        cls._pool = BackendPool.from_setting(GlobalVariable.config['categories']['rag_setting'])
+
+    @classmethod
+    def pool(cls) -> BackendPool:
+        if cls._pool is None:
+            cls._init_http()
+        return cls._pool
+
+    @classmethod
+    def stats(cls):
+        """各 rag 后端的连接池、在途请求数、健康状态与熔断器状态"""
+        return cls._pool.stats() if cls._pool is not None else None
+
+    @classmethod
+    def hedge_enabled(cls) -> bool:
+        return bool(GlobalVariable.config['categories']['rag_setting'].get('hedge', False))
 
     @classmethod
-    def update_count(cls):
-        res = cls._get_chat_list()
-        cls.count = res.json()['items'][0]['id']
+    def _attempt(cls, backend: Backend, send):
+        """发送一次请求并计入熔断器与并发限制器统计（开启 adaptive_concurrency 时先排队等待许可）"""
+        limiter = backend.limiter
+        permit = limiter.acquire() if limiter is not None else None
+        start = time.monotonic()
+        try:
+            with backend.track():
+                res = send(backend.http)
+        except Exception as e:
+            backend.breaker.record(False, time.monotonic() - start)
+            if permit is not None:
+                limiter.release(permit, limiter_outcome(error=e))
+            raise
+        elapsed = time.monotonic() - start
+        backend.breaker.record(healthy_response(res), elapsed)
+        if permit is not None:
+            limiter.release(permit, limiter_outcome(res))
+        Metrics.observe('rag.latency', elapsed)
+        return res
+
+    @classmethod
+    def _send(cls, send, backend: str | None = None, hedge: bool = False):
+        """经过熔断器向指定后端（为空时为默认后端）发送请求，熔断器打开时抛出 CircuitOpenError
+
+        send(http) 使用该后端的连接池发送请求
+        hedge 为 True 且开启了对冲时，请求超过近期 p95 耗时仍未返回则再发送一次，取先成功返回的结果
+        对冲会把同一请求发送两次，只能用于幂等的读请求
+        同步请求无法中止，较慢的一个在后台线程中完成后正常计入统计
+        """
+        target = cls.pool().get(backend)
+        breaker = target.breaker
+        if not breaker.allow():
+            raise CircuitOpenError(f"rag 后端 {target.name} 熔断器已打开，请求未发送")
+        delay = breaker.p95() if hedge and cls.hedge_enabled() else None
+        if delay is None:
+            return cls._attempt(target, send)
+        if cls._hedge_executor is None:
+            cls._hedge_executor = ThreadPoolExecutor(thread_name_prefix='rag-hedge')
+        first = cls._hedge_executor.submit(cls._attempt, target, send)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+        if not breaker.allow():
+            return first.result()
+        Metrics.incr('rag.hedged')
+        second = cls._hedge_executor.submit(cls._attempt, target, send)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and healthy_response(future.result()):
+                    if future is second:
+                        Metrics.incr('rag.hedge_won')
+                    return future.result()
+        return first.result()
 
     """发送chat消息"""
     @classmethod
-    def post_chat(cls, chatMessage: ChatMessage):
-        if cls._http is None:
-            cls._init_http()
+    def post_chat(cls, chatMessage: ChatMessage, backend: str | None = None):
         try:
-            return cls._http.post('/api/chat/conversation_chat',json=chatMessage)
+            return cls._send(lambda http: http.post('/api/chat/conversation_chat',json=chatMessage), backend)
         except Exception as e:
             print(e)
             return None
 
     """获取chat列表"""
     @classmethod
-    def _get_chat_list(cls, chatList: ChatList | None = None):
-        if cls._http is None:
-            cls._init_http()
+    def _get_chat_list(cls, chatList: ChatList | None = None, backend: str | None = None):
         if chatList is None:
             chatList = ChatList()
         try:
-            logger.info(cls._http)
-            return cls._http.get('/api/conversation/conversations', params=chatList)
+            return cls._send(lambda http: http.get('/api/conversation/conversations', params=chatList), backend, hedge=True)
         except Exception as e:
             logger.error(e)
             return None
     
     """创建chat"""
     @classmethod
-    def create_chat(cls, createChat: CreateChat):
-        if cls._http is None:
-            cls._init_http()
+    def create_chat(cls, createChat: CreateChat, backend: str | None = None):
         try:
-            return cls._http.post('/api/conversation',json=createChat)
+            return cls._send(lambda http: http.post('/api/conversation',json=createChat), backend)
         except Exception as e:
             print(e)
-            return None
\ No newline at end of file
+            return None
+
+    """创建chat，返回 (新对话ID, 所在后端)"""
+    @classmethod
+    def create_conversation(cls, createChat: CreateChat):
+        """新对话分配给在途请求最少的可用后端，之后该对话的请求都发往该后端，失败时返回 None"""
+        backend = cls.pool().pick().name
+        conversation_id = conversation_id_of(cls.create_chat(createChat, backend))
+        return None if conversation_id is None else (conversation_id, backend)
+
+    """流式发送chat消息，逐段返回生成的文本"""
+    @classmethod
+    def stream_chat(cls, chatMessage: ChatMessage, backend: str | None = None):
+        """请求失败时抛出异常；rag 不支持流式而返回完整 JSON 时，整段文本作为一段返回"""
+        # 熔断器按收到响应头的耗时统计，生成全文的耗时取决于回复长度
+        res = cls._send(lambda http: http.post_stream('/api/chat/conversation_chat', json=stream_request(chatMessage)), backend)
+        try:
+            res.raise_for_status()
+            if not is_stream(res):
+                if hasattr(res, 'aiter_lines'):
+                    res.read()  # httpx 流式响应需先读取正文
+                yield text_of(res.json())
+                return
+            event_stream = 'text/event-stream' in res.headers.get('content-type', '')
+            for line in res.iter_lines():
+                delta = parse_stream_line(line.decode('utf-8') if isinstance(line, bytes) else line, event_stream)
+                if delta is STREAM_DONE:
+                    return
+                if delta:
+                    yield delta
+        finally:
+            res.close()
+
+
+def conversation_id_of(res):
+    """从 POST /api/conversation 的响应中读取新对话ID，失败时返回 None"""
+    if res is None:
+        return None
+    try:
+        body = res.json()
+    except ValueError:
+        logger.error(f"创建对话返回了无法解析的内容: {res.text[:200]}")
+        return None
+    if isinstance(body, dict) and isinstance(body.get('data'), dict):
+        body = body['data']
+    conversation_id = body.get('id') if isinstance(body, dict) else None
+    if conversation_id is None:
+        logger.error(f"创建对话的响应中没有对话ID: {body}")
+    return conversation_id
+
+
+# 流式回复解析
+STREAM_DONE = object()  # SSE 结束标记 data: [DONE]
+# data 在 message 之前：{code, message: "success", data: {content}} 信封中的 message 是状态说明而不是回复
+_TEXT_KEYS = ('delta', 'content', 'text', 'answer', 'data', 'message')
+
+
+def stream_request(chatMessage: ChatMessage) -> dict:
+    """流式请求体：在 ChatMessage 基础上加上 stream 标记"""
+    return dict(chatMessage.__dict__, stream=True)
+
+
+def is_stream(res) -> bool:
+    """响应是否为流式（SSE 或分块传输的文本），application/json 视为完整回复"""
+    return 'application/json' not in res.headers.get('content-type', '')
+
+
+def limiter_outcome(res=None, error: Optional[BaseException] = None) -> Optional[bool]:
+    """请求结果对并发限制器的意义：429 与超时说明过载（False），其他异常与负载无关（None），其余为正常（True）"""
+    if error is not None:
+        return False if isinstance(error, (requests.Timeout, httpx.TimeoutException, TimeoutError)) else None
+    return res.status_code != 429
+
+
+def text_of(body) -> str:
+    """从一段 JSON 中取出生成的文本，兼容 {content}、{data: {content}}、OpenAI 风格 {choices: [{delta: {content}}]}"""
+    if isinstance(body, str):
+        return body
+    if isinstance(body, dict):
+        choices = body.get('choices')
+        if isinstance(choices, list) and choices:
+            choice = choices[0]
+            return text_of(choice.get('delta') or choice.get('message') or {})
+        for key in _TEXT_KEYS:
+            value = body.get(key)
+            if key == 'message' and 'code' in body and not isinstance(value, dict):
+                continue  # 带 code 的信封中字符串 message 是状态说明
+            if isinstance(value, (str, dict)):
+                return text_of(value)
+    return ''
+
+
+def parse_stream_line(line: str, event_stream: bool):
+    """解析流式响应的一行，返回新增的文本（可能为空），SSE 的 [DONE] 返回 STREAM_DONE
+
+    Args:
+        event_stream: 是否为 SSE（只处理 data: 行）；否则每行是一段 JSON（NDJSON）或纯文本
+    """
+    if event_stream:
+        if not line.startswith('data:'):
+            return ''
+        line = line[6:] if line.startswith('data: ') else line[5:]
+        if line.strip() == '[DONE]':
+            return STREAM_DONE
+    elif not line:
+        return '\n'  # 纯文本分块中的空行是段落分隔
+    try:
+        body = json.loads(line)
+    except ValueError:
+        body = None
+    if isinstance(body, (dict, str)):
+        return text_of(body)
+    return line if event_stream else line + '\n'
\ No newline at end of file
@@ -1,3 +1,5 @@
 from .RagClient import RagClient
+from .AsyncRagClient import AsyncRagClient
+from .CircuitBreaker import CircuitBreaker, CircuitOpenError
 
-__all__ = ["RagClient"]
\ No newline at end of file
+__all__ = ["RagClient", "AsyncRagClient", "CircuitBreaker", "CircuitOpenError"]
\ No newline at end of file
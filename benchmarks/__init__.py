@@ -0,0 +1,5 @@
+"""
+    性能基准测试：
+        用本地桩服务代替外部依赖（MQTT broker、RAG 服务等），对比优化前后的吞吐与延迟
+        运行方式: python -m benchmarks.<脚本名>
+"""
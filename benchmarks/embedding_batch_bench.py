@@ -0,0 +1,65 @@
+"""嵌入请求合并对比：
+    - per_text: 旧实现，每条文本一次 embeddings.create，且在事件循环中调用同步客户端（并发调用实际串行）
+    - batched: AsyncOpenAI + EmbeddingBatcher，并发调用合并为 embeddings.create(input=[...])
+
+桩服务模拟 OpenAI 兼容的 /embeddings 接口，每个请求固定耗时 --delay 秒
+同时发起 -n 个 async_embedding 调用，统计总耗时、请求数与 条/秒
+
+运行: python -m benchmarks.embedding_batch_bench -n 256 --delay 0.02
+"""
+import argparse
+import asyncio
+import time
+
+import openai
+
+from benchmarks.stubs import RagServerStub
+from utils import APIWrapper
+
+
+async def _per_text(client: openai.OpenAI, texts):
+    async def embed(text):
+        # 旧实现：async 函数中直接调用同步客户端
+        return client.embeddings.create(model='bench', input=text).data[0].embedding
+    return await asyncio.gather(*(embed(text) for text in texts))
+
+
+async def _batched(wrapper: APIWrapper, texts):
+    results = await asyncio.gather(*(wrapper.async_embedding(text, 'bench') for text in texts))
+    await wrapper.async_client.close()
+    return results
+
+
+def bench(server: RagServerStub, run, texts):
+    start_requests = server.requests
+    start = time.perf_counter()
+    results = asyncio.run(run(texts))
+    elapsed = time.perf_counter() - start
+    assert all(result is not None for result in results)
+    return elapsed, server.requests - start_requests, len(texts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--count', type=int, default=256, help='并发的嵌入调用数')
+    parser.add_argument('--delay', type=float, default=0.02, help='桩服务每个请求的耗时（秒）')
+    args = parser.parse_args()
+
+    server = RagServerStub(delay=args.delay).start()
+    texts = [f'第 {i} 条记忆' for i in range(args.count)]
+    try:
+        client = openai.OpenAI(api_key='bench', base_url=server.url + '/v1')
+        wrapper = APIWrapper('bench', server.url + '/v1')
+        results = [
+            ('per_text', bench(server, lambda batch: _per_text(client, batch), texts)),
+            ('batched', bench(server, lambda batch: _batched(wrapper, batch), texts)),
+        ]
+    finally:
+        server.stop()
+    print(f"{'mode':<10}{'seconds':>10}{'requests':>10}{'texts/sec':>12}")
+    for name, (elapsed, requests, throughput) in results:
+        print(f"{name:<10}{elapsed:>10.2f}{requests:>10}{throughput:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
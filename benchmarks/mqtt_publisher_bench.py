@@ -0,0 +1,87 @@
+"""MQTT 发布吞吐对比：
+    - connect_per_message: 旧实现，每条回复新建 mqtt.Client 并 connect 后 publish
+    - pooled_publisher: MqttPublisher 长连接，QoS 1 消息并发在途
+
+运行: python -m benchmarks.mqtt_publisher_bench -n 2000
+"""
+import argparse
+import json
+import time
+
+import paho.mqtt.client as mqtt
+
+from api.MqttClient import MqttPublisher
+from benchmarks.stubs import MqttBrokerStub
+from utils.metrics import Metrics
+
+PAYLOAD = json.dumps({'content': '你好呀，今天过得怎么样？' * 4}, ensure_ascii=False)
+
+
+def _wait_for(predicate, timeout: float = 30.0) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.001)
+    return False
+
+
+def bench_connect_per_message(broker: MqttBrokerStub, count: int) -> float:
+    """旧实现：每条消息一次 TCP + MQTT 握手"""
+    start_published = broker.published
+    start = time.perf_counter()
+    clients = []
+    for i in range(count):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        client.connect(broker.host, broker.port, 60)
+        client.publish(str(i % 100), PAYLOAD, qos=1)
+        clients.append(client)
+        # 旧实现从不断开连接；这里每 200 条等送达后关闭 socket，避免基准测试耗尽文件句柄
+        if len(clients) >= 200:
+            _wait_for(lambda: broker.published - start_published >= i + 1)
+            for leaked in clients:
+                leaked.socket().close()
+            clients.clear()
+    _wait_for(lambda: broker.published - start_published >= count)
+    elapsed = time.perf_counter() - start
+    for leaked in clients:
+        leaked.socket().close()
+    return count / elapsed
+
+
+def bench_pooled_publisher(broker: MqttBrokerStub, count: int) -> float:
+    """新实现：长连接 + 在途 QoS 1 消息重叠，计时到所有 PUBACK 返回为止"""
+    publisher = MqttPublisher(broker.host, broker.port, max_inflight=200)
+    publisher.start()
+    _wait_for(publisher.is_connected, timeout=5)
+    acked = lambda: Metrics.snapshot()['counters'].get('mqtt.acked', 0)
+    start_acked = acked()
+    start = time.perf_counter()
+    for i in range(count):
+        publisher.publish(str(i % 100), PAYLOAD, qos=1)
+    _wait_for(lambda: acked() - start_acked >= count)
+    elapsed = time.perf_counter() - start
+    publisher.stop()
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--count', type=int, default=2000, help='发布的消息数量')
+    args = parser.parse_args()
+
+    broker = MqttBrokerStub().start()
+    try:
+        legacy = bench_connect_per_message(broker, args.count)
+        pooled = bench_pooled_publisher(broker, args.count)
+    finally:
+        broker.stop()
+
+    print(f"{'mode':<22}{'msgs/sec':>12}")
+    print(f"{'connect_per_message':<22}{legacy:>12.1f}")
+    print(f"{'pooled_publisher':<22}{pooled:>12.1f}")
+    print(f"speedup: {pooled / legacy:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""机器人客户端消息接收对比：
+    - http: 每条消息一次 POST /message/text（requests 长连接，waitress 服务）
+    - socket: SocketAdapter 长连接，每帧 --batch 条消息，流水线发送，不等待 RESULT
+
+消息入队到本地 queue.Queue（不启动对话工作进程），统计 -n 条消息全部被接收的耗时与 条/秒
+--clients 个客户端并发发送；接口中的 print 输出重定向到 /dev/null
+
+运行: python -m benchmarks.socket_ingest_bench -n 20000 --clients 4 --batch 50
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import queue
+import threading
+import time
+
+import requests
+from flask import Flask
+
+from globals.global_variable import GlobalVariable
+from network.routes.http_routes.message_routes import MessageRoutes
+from network.routes.socket_routes import HELLO, MESSAGE, RESULT, WELCOME, SocketAdapter, encode_frame, read_frame
+from network.routes.wsgi_server import create_wsgi_server
+
+
+def _message(index):
+    return {"sender_id": index % 1000, "sender": "bench", "chat_type": "private", "character": 1,
+            "message_type": "text", "message_send_time": "2025-04-21 12:00:00", "content": f"消息{index}"}
+
+
+def bench_http(count: int, clients: int) -> float:
+    app = Flask(__name__)
+    MessageRoutes(app)
+    server = create_wsgi_server(app, '127.0.0.1', 0, {'threads': clients})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.port}/message/text'
+
+    def send(indexes):
+        with requests.Session() as session:
+            for index in indexes:
+                assert session.post(url, json=_message(index)).status_code == 200
+
+    threads = [threading.Thread(target=send, args=(range(client, count, clients),)) for client in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return elapsed
+
+
+async def _bench_socket(count: int, clients: int, batch: int) -> float:
+    adapter = SocketAdapter(port=0)
+    await adapter.start({'max_inflight': count, 'max_batch': batch})
+
+    async def send(client, indexes):
+        reader, writer = await asyncio.open_connection('127.0.0.1', adapter.port)
+        writer.write(encode_frame(HELLO, 0, {'client_id': f'bench-{client}'}))
+        assert (await read_frame(reader, 1 << 20))[0] == WELCOME
+        frames = [indexes[i:i + batch] for i in range(0, len(indexes), batch)]
+        for request_id, frame in enumerate(frames, 1):
+            writer.write(encode_frame(MESSAGE, request_id, [_message(index) for index in frame]))
+        await writer.drain()
+        for _ in frames:
+            assert (await read_frame(reader, 1 << 20))[0] == RESULT
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(client, list(range(client, count, clients))) for client in range(clients)))
+    elapsed = time.perf_counter() - start
+    await adapter.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=50)
+    args = parser.parse_args()
+
+    GlobalVariable.admission = None
+    for name, run in (('http', lambda: bench_http(args.n, args.clients)),
+                      ('socket', lambda: asyncio.run(_bench_socket(args.n, args.clients, args.batch)))):
+        GlobalVariable.to_message_get_queue = queue.Queue()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            elapsed = run()
+        assert GlobalVariable.to_message_get_queue.qsize() == args.n
+        print(f"{name:>6}: {args.n} 条 {elapsed:.2f}s  {args.n / elapsed:,.0f} 条/秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""流式回复的首句延迟对比：
+    - full_reply: 旧实现，post_chat 等完整回复后一次发布
+    - streamed: stream_chat 逐段读取 SSE，ReplyStream 每完成一句立即发布
+
+桩服务以 SSE 分块返回固定回复，每个片段间隔 --chunk-delay 秒，模拟 LLM 逐 token 生成
+指标为从发出请求到用户收到第一条 MQTT 消息（首句）与收到完整回复的时间
+
+运行: python -m benchmarks.stream_reply_bench -n 20 --chunk-delay 0.05
+"""
+import argparse
+import time
+
+from api.RagClient import RagClient
+from api.RagClient.models import ChatMessage
+from benchmarks.stubs import RagServerStub, STREAM_CHUNKS
+from globals.global_variable import GlobalVariable
+from processors.dialogue import ReplyStream
+
+
+def _median(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2]
+
+
+def bench_full_reply(count: int):
+    """桩服务非流式请求按整段生成耗时返回，首句与完整回复同时到达"""
+    first, total = [], []
+    for _ in range(count):
+        start = time.perf_counter()
+        RagClient.post_chat(ChatMessage(1, "你好")).json()
+        elapsed = time.perf_counter() - start
+        first.append(elapsed)
+        total.append(elapsed)
+    return _median(first), _median(total)
+
+
+def bench_streamed(count: int):
+    first, total = [], []
+    for _ in range(count):
+        published = []
+        stream = ReplyStream(lambda payload, on_ack: published.append(time.perf_counter()))
+        start = time.perf_counter()
+        for delta in RagClient.stream_chat(ChatMessage(1, "你好")):
+            stream.feed(delta)
+        stream.finish()
+        first.append(published[0] - start)
+        total.append(published[-1] - start)
+    return _median(first), _median(total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--count', type=int, default=20, help='每种方式的请求次数')
+    parser.add_argument('--chunk-delay', type=float, default=0.05, help='每个片段的生成耗时（秒）')
+    args = parser.parse_args()
+
+    server = RagServerStub(delay=args.chunk_delay * len(STREAM_CHUNKS), chunk_delay=args.chunk_delay).start()
+    GlobalVariable.config = {'categories': {'rag_setting': {'url': server.url}}}
+    try:
+        results = [('full_reply', bench_full_reply(args.count)), ('streamed', bench_streamed(args.count))]
+    finally:
+        server.stop()
+    print(f"{'mode':<12}{'first sentence (ms)':>22}{'full reply (ms)':>18}")
+    for name, (first, total) in results:
+        print(f"{name:<12}{first * 1e3:>22.1f}{total * 1e3:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""本地桩服务：
+    - MqttBrokerStub: 仅实现 CONNECT/PUBLISH/PINGREQ/DISCONNECT 的最小 MQTT 3.1.1 broker
+    - RagServerStub: 支持 keep-alive 的 HTTP/1.1 服务，对任意请求返回固定 JSON，可模拟服务端处理耗时
+      请求体中 stream 为 true 时以 SSE 分块返回固定的回复文本，可模拟逐段生成的耗时
+      路径以 /embeddings 结尾时按 OpenAI 格式为每条 input 返回一个固定维度的向量，以 /chat/completions 结尾的流式请求按 OpenAI 格式分块
+
+桩服务运行在独立进程中，避免与被测代码争抢 GIL 导致测量失真
+"""
+import http.server
+import json
+import multiprocessing
+import socket
+import socketserver
+import time
+
+
+def _read_exact(sock: socket.socket, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
+
+
+def _read_remaining_length(sock: socket.socket) -> int:
+    multiplier, value = 1, 0
+    while True:
+        byte = _read_exact(sock, 1)[0]
+        value += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return value
+        multiplier *= 128
+
+
+class _MqttHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with broker.connections.get_lock():
+            broker.connections.value += 1
+        try:
+            while True:
+                header = _read_exact(sock, 1)[0]
+                body = _read_exact(sock, _read_remaining_length(sock))
+                packet_type = header >> 4
+                if packet_type == 1:  # CONNECT -> CONNACK
+                    sock.sendall(b'\x20\x02\x00\x00')
+                elif packet_type == 3:  # PUBLISH
+                    qos = (header >> 1) & 0x03
+                    topic_length = int.from_bytes(body[:2], 'big')
+                    if qos:
+                        packet_id = body[2 + topic_length:4 + topic_length]
+                        sock.sendall(b'\x40\x02' + packet_id)  # PUBACK
+                    with broker.published.get_lock():
+                        broker.published.value += 1
+                elif packet_type == 12:  # PINGREQ -> PINGRESP
+                    sock.sendall(b'\xd0\x00')
+                elif packet_type == 14:  # DISCONNECT
+                    return
+        except (ConnectionError, OSError):
+            return
+
+
+class MqttBrokerStub:
+    """本地 MQTT broker 替身，记录收到的 PUBLISH 数量与连接数量"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self._published = multiprocessing.Value('q', 0)
+        self._connections = multiprocessing.Value('q', 0)
+        self._process = None
+
+    @property
+    def published(self) -> int:
+        return self._published.value
+
+    @property
+    def connections(self) -> int:
+        return self._connections.value
+
+    def start(self) -> 'MqttBrokerStub':
+        ready = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self.host, self.port, self._published, self._connections, ready), daemon=True)
+        self._process.start()
+        self.port = ready.get(timeout=10)
+        return self
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+
+class _StubServer(socketserver.ThreadingTCPServer):
+    # 默认 backlog 只有 5，短连接压测时会触发 SYN 重传（1 秒），使结果失真
+    request_queue_size = 1024
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _serve(host, port, published, connections, ready):
+    server = _StubServer((host, port), _MqttHandler)
+    server.broker = type('Counters', (), {'published': published, 'connections': connections})
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+# 流式回复的文本片段（模拟逐 token 生成）
+STREAM_CHUNKS = ['你好', '呀，', '今天', '过得', '怎么样', '？', '我', '刚刚', '在', '看', '书', '，',
+                 '是一本', '关于', '星空', '的', '书。', '要', '一起', '聊聊', '吗', '？']
+
+
+class _RagHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 默认 HTTP/1.0 每次请求后断开，无法测量连接复用
+
+    def _reply(self):
+        with self.server.requests.get_lock():
+            self.server.requests.value += 1
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            request = json.loads(body) if body else {}
+        except ValueError:
+            request = {}
+        if not isinstance(request, dict):
+            request = {}
+        if request.get('stream'):
+            return self._stream()
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        body = self._embeddings(request) if self.path.endswith('/embeddings') else self.server.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _embeddings(self, request) -> bytes:
+        texts = request.get('input') or []
+        texts = [texts] if isinstance(texts, str) else texts
+        with self.server.embedded.get_lock():
+            self.server.embedded.value += len(texts)
+        data = [{'object': 'embedding', 'index': i, 'embedding': [float(len(text)), 0.5, 0.25, 0.125]}
+                for i, text in enumerate(texts)]
+        return json.dumps({'object': 'list', 'data': data, 'model': request.get('model', ''),
+                           'usage': {'prompt_tokens': 0, 'total_tokens': 0}}).encode('utf-8')
+
+    def _stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        openai_style = self.path.endswith('/chat/completions')
+        for chunk in STREAM_CHUNKS:
+            time.sleep(self.server.chunk_delay)
+            event = {'choices': [{'index': 0, 'delta': {'content': chunk}}]} if openai_style else {'content': chunk}
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._write_chunk(b'')
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    do_GET = do_POST = do_PUT = do_DELETE = _reply
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.connections.get_lock():
+            self.server.connections.value += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RagServerStub:
+    """本地 rag 服务替身，记录建立的连接数量"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, delay: float = 0.0, chunk_delay: float = 0.0):
+        """
+        Args:
+            delay: 每个请求模拟的服务端处理耗时（秒）
+            chunk_delay: 流式回复中每个片段的生成耗时（秒）
+        """
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self._connections = multiprocessing.Value('q', 0)
+        self._embedded = multiprocessing.Value('q', 0)
+        self._requests = multiprocessing.Value('q', 0)
+        self._process = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def connections(self) -> int:
+        return self._connections.value
+
+    @property
+    def requests(self) -> int:
+        return self._requests.value
+
+    @property
+    def embedded(self) -> int:
+        """/embeddings 请求中收到的文本总数"""
+        return self._embedded.value
+
+    def start(self) -> 'RagServerStub':
+        ready = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve_http, args=(self.host, self.port, self.delay, self.chunk_delay, self._connections,
+                                      self._requests, self._embedded, ready), daemon=True)
+        self._process.start()
+        self.port = ready.get(timeout=10)
+        return self
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+
+class _HttpStubServer(http.server.ThreadingHTTPServer):
+    request_queue_size = 1024
+    allow_reuse_address = True
+
+
+def _serve_http(host, port, delay, chunk_delay, connections, requests, embedded, ready):
+    server = _HttpStubServer((host, port), _RagHandler)
+    server.delay = delay
+    server.chunk_delay = chunk_delay
+    server.connections = connections
+    server.requests = requests
+    server.embedded = embedded
+    server.body = json.dumps({'code': 200, 'data': {'id': 1, 'content': '你好，我在呢。'}}, ensure_ascii=False).encode('utf-8')
+    ready.put(server.server_address[1])
+    server.serve_forever()
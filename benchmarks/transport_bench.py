@@ -0,0 +1,76 @@
+"""对话消息队列传输对比：
+    - manager: 旧实现，Manager().Queue 代理队列，每次 put/get 是一次发往 manager 进程的 RPC
+    - mp_queue: multiprocessing.Queue，TextMessage 按对象 pickle
+    - mp_queue_codec: multiprocessing.Queue + MessageCodec 二进制编码（QueueTransport 默认方式）
+
+两项指标：
+    - 入队延迟: 生产者（HTTP 请求线程）单次 put 的耗时 p50/p99，消费者同时在另一进程中取消息
+    - 最大吞吐: 生产者连续 put，直到消费者进程取完全部消息为止的 条/秒
+
+运行: python -m benchmarks.transport_bench -n 20000
+"""
+import argparse
+import multiprocessing
+import time
+
+from dispatch import EncodedQueue
+from models.message import TextMessage
+
+
+def _message(i: int) -> TextMessage:
+    return TextMessage(
+        sender_id=10000 + i % 100, sender='用户', chat_type='private', character=1,
+        message_type='text', message_send_time='2024-01-01 12:00:00', content='你好呀，今天过得怎么样？',
+    )
+
+
+def _consume(message_queue, count: int, done) -> None:
+    for _ in range(count):
+        message_queue.get()
+    done.set()
+
+
+def _percentile(samples, q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def bench(message_queue, count: int):
+    """返回 (入队 p50 微秒, 入队 p99 微秒, 吞吐 条/秒)"""
+    messages = [_message(i) for i in range(count)]
+    done = multiprocessing.Event()
+    consumer = multiprocessing.Process(target=_consume, args=(message_queue, count, done), daemon=True)
+    consumer.start()
+    latencies = []
+    start = time.perf_counter()
+    for message in messages:
+        begin = time.perf_counter()
+        message_queue.put(message)
+        latencies.append(time.perf_counter() - begin)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    consumer.join()
+    latencies.sort()
+    return _percentile(latencies, 0.5) * 1e6, _percentile(latencies, 0.99) * 1e6, count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--count', type=int, default=20000, help='入队的消息数量')
+    args = parser.parse_args()
+
+    manager = multiprocessing.Manager()
+    results = [
+        ('manager', bench(manager.Queue(), args.count)),
+        ('mp_queue', bench(multiprocessing.Queue(), args.count)),
+        ('mp_queue_codec', bench(EncodedQueue(), args.count)),
+    ]
+    manager.shutdown()
+
+    print(f"{'mode':<18}{'put p50 (us)':>14}{'put p99 (us)':>14}{'msgs/sec':>12}")
+    for name, (p50, p99, throughput) in results:
+        print(f"{name:<18}{p50:>14.1f}{p99:>14.1f}{throughput:>12.1f}")
+    print(f"speedup: {results[2][1][2] / results[0][1][2]:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
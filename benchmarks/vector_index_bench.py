@@ -0,0 +1,53 @@
+"""记忆检索耗时与召回率：精确检索（exact）与 IVF 近似检索（ivf）对比
+
+向量围绕若干主题中心分布（接近真实的记忆嵌入），查询为库中向量加噪声
+recall@k 以精确检索结果为基准
+
+运行: python -m benchmarks.vector_index_bench -n 200000 --dim 256
+"""
+import argparse
+import time
+
+import numpy as np
+
+from processors.memory import VectorIndex
+
+
+def clustered(rng, count, dim, centers):
+    return (centers[rng.integers(len(centers), size=count)] + 0.5 * rng.standard_normal((count, dim))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--count', type=int, default=200000, help='记忆数量')
+    parser.add_argument('--dim', type=int, default=256, help='向量维度')
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--nprobe', type=int, default=16)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((max(16, args.count // 1000), args.dim))
+    vectors = clustered(rng, args.count, args.dim, centers)
+    queries = vectors[rng.integers(args.count, size=args.queries)] + 0.2 * rng.standard_normal((args.queries, args.dim))
+
+    indexes = {}
+    print(f"{'mode':<8}{'build s':>10}{'p50 ms':>10}{'p99 ms':>10}{'recall':>10}")
+    for name, threshold in (('exact', args.count + 1), ('ivf', 0)):
+        start = time.perf_counter()
+        index = indexes[name] = VectorIndex(args.dim, threshold=threshold, nprobe=args.nprobe)
+        index.add_many(range(args.count), vectors)
+        build = time.perf_counter() - start
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append({memory_id for memory_id, _ in index.search(query, args.k)})
+            latencies.append(time.perf_counter() - start)
+        indexes[name] = results
+        recall = np.mean([len(got & want) / args.k for got, want in zip(results, indexes['exact'])])
+        print(f"{name:<8}{build:>10.2f}{np.percentile(latencies, 50) * 1000:>10.2f}"
+              f"{np.percentile(latencies, 99) * 1000:>10.2f}{recall:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""持久化队列写入对比：
+    - commit_per_message: 每条消息一个事务（max_batch=1），每条消息一次 fsync
+    - group_commit: 写入线程把提交期间到达的所有写入合并为一个事务
+
+多个线程并发写入（模拟 Flask 的多个请求线程），每次写入都等待事务提交后才返回
+
+运行: python -m benchmarks.wal_bench -n 2000 -t 16
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from dispatch import MessageLog
+from models.message import TextMessage
+from utils.metrics import Metrics
+
+
+def _message(i: int) -> TextMessage:
+    return TextMessage(
+        sender_id=10000 + i % 100, sender='用户', chat_type='private', character=1,
+        message_type='text', message_send_time='2024-01-01 12:00:00', content='你好呀，今天过得怎么样？',
+    )
+
+
+def bench(max_batch: int, count: int, threads: int):
+    """返回 (条/秒, 事务数)"""
+    Metrics.reset()
+    with tempfile.TemporaryDirectory() as directory:
+        log = MessageLog(os.path.join(directory, 'messages.db'), max_batch=max_batch)
+        per_thread = count // threads
+
+        def produce():
+            for i in range(per_thread):
+                log.append(_message(i))
+
+        workers = [threading.Thread(target=produce) for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        log.close()
+    return per_thread * threads / elapsed, Metrics.snapshot()['counters'].get('wal.commits', 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--count', type=int, default=2000, help='写入的消息数量')
+    parser.add_argument('-t', '--threads', type=int, default=16, help='并发写入线程数')
+    args = parser.parse_args()
+
+    results = [
+        ('commit_per_message', bench(1, args.count, args.threads)),
+        ('group_commit', bench(512, args.count, args.threads)),
+    ]
+    print(f"{'mode':<22}{'msgs/sec':>12}{'commits':>10}")
+    for name, (throughput, commits) in results:
+        print(f"{name:<22}{throughput:>12.1f}{commits:>10}")
+    print(f"speedup: {results[1][1][0] / results[0][1][0]:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""
+    消息分发层：
+        负责 网络接收层 -> 对话工作进程 之间的消息投递
+
+    - sharded_queue.py: 分片队列，按 sender_id 路由到对话工作进程
+    - transport.py: 进程间传输，multiprocessing.Queue + 紧凑二进制编码
+    - admission.py: 准入控制，按队列深度高低水位拒绝或丢弃低优先级消息
+    - priority.py: 私聊 / 群聊加权公平调度
+    - wal.py: 持久化消息队列，SQLite 日志组提交，回复送达后确认，启动时重放
+    - retry.py: 失败重试，指数退避 + 抖动的定时堆
+    - dead_letter.py: 死信存储，记录多次重试仍失败的消息
+    - reply_channel.py: 回复通道，socket 客户端消息的回复由工作进程发回主进程推送
+"""
+from .admission import AdmissionController
+from .dead_letter import DeadLetterStore
+from .priority import PriorityDispatcher
+from .reply_channel import ReplyChannel
+from .retry import DeliveryError, RetryingQueue, RetryScheduler
+from .sharded_queue import ShardedQueue
+from .transport import EncodedQueue, MessageCodec, QueueTransport
+from .wal import Acknowledger, DurableQueue, MessageLog
+
+__all__ = ["ShardedQueue", "AdmissionController", "PriorityDispatcher", "EncodedQueue", "MessageCodec", "QueueTransport",
+           "MessageLog", "DurableQueue", "Acknowledger", "DeliveryError", "RetryScheduler", "RetryingQueue",
+           "DeadLetterStore", "ReplyChannel"]
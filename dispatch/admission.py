@@ -0,0 +1,105 @@
+"""准入控制：
+    RAG 服务变慢时，积压会无限增长，回复延迟到几分钟之后，不如尽早拒绝让上游降速
+    按队列总深度设置高低水位（滞回）：
+    - 深度达到 high_watermark 后进入过载状态，直到回落到 low_watermark 以下才恢复
+    - 过载时 reject 策略拒绝全部消息；shed 策略只丢弃低优先级的 chat_type（如群聊），私聊仍然接收
+    - 分片队列已满时一律拒绝（不阻塞 HTTP 线程）
+    被拒绝的请求返回 429（过载）或 503（队列已满），并带有 Retry-After 头
+"""
+import queue
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from utils.metrics import Metrics
+
+ACCEPTED = 'accepted'
+SHED = 'shed'  # 过载时丢弃低优先级消息
+REJECTED = 'rejected'  # 过载时拒绝
+QUEUE_FULL = 'queue_full'  # 分片队列已满
+
+
+class AdmissionController:
+    """在消息入队前判断是否接收"""
+
+    def __init__(self, message_queue, high_watermark: int = 0, low_watermark: Optional[int] = None,
+                 policy: str = 'reject', shed_chat_types: Iterable[str] = ('group',), retry_after: int = 5):
+        """
+        Args:
+            message_queue: 对话消息队列（ShardedQueue），需要 put/qsize
+            high_watermark: 高水位，队列总深度达到该值时进入过载状态，<= 0 表示不限制
+            low_watermark: 低水位，过载后深度回落到该值以下才恢复接收，默认为高水位的 80%
+            policy: reject -> 过载时拒绝全部消息; shed -> 过载时只丢弃 shed_chat_types 中的消息
+            shed_chat_types: shed 策略下可丢弃的低优先级 chat_type
+            retry_after: 拒绝时建议上游等待的秒数
+        """
+        if policy not in ('reject', 'shed'):
+            raise ValueError(f"未知的准入策略: {policy}")
+        self.message_queue = message_queue
+        self.high_watermark = max(0, int(high_watermark))
+        if low_watermark is None:
+            low_watermark = int(self.high_watermark * 0.8)
+        self.low_watermark = min(max(0, int(low_watermark)), self.high_watermark)
+        self.policy = policy
+        self.shed_chat_types = frozenset(shed_chat_types)
+        self.retry_after = max(1, int(retry_after))
+        self.overloaded = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_setting(cls, message_queue, setting: dict) -> 'AdmissionController':
+        """根据 dialogue_setting 创建"""
+        return cls(
+            message_queue,
+            high_watermark=setting.get('high_watermark', 0),
+            low_watermark=setting.get('low_watermark'),
+            policy=setting.get('admission_policy', 'reject'),
+            shed_chat_types=setting.get('shed_chat_types', ['group']),
+            retry_after=setting.get('retry_after', 5),
+        )
+
+    def _update_state(self, depth: int) -> bool:
+        """根据当前深度更新过载状态（滞回），返回是否过载"""
+        if self.high_watermark <= 0:
+            return False
+        with self._lock:
+            if not self.overloaded and depth >= self.high_watermark:
+                self.overloaded = True
+                Metrics.incr('admission.overload_events')
+            elif self.overloaded and depth <= self.low_watermark:
+                self.overloaded = False
+            return self.overloaded
+
+    def admit(self, message: Any) -> Tuple[str, int]:
+        """尝试将消息放入队列，返回 (结果, 放入前的队列深度)"""
+        depth = self.message_queue.qsize()
+        Metrics.gauge('admission.depth', depth)
+        if self._update_state(depth):
+            if self.policy == 'reject':
+                Metrics.incr('admission.rejected')
+                return REJECTED, depth
+            if getattr(message, 'chat_type', None) in self.shed_chat_types:
+                Metrics.incr('admission.shed')
+                return SHED, depth
+        try:
+            self.message_queue.put(message, block=False)
+        except queue.Full:
+            Metrics.incr('admission.queue_full')
+            return QUEUE_FULL, depth
+        Metrics.incr('admission.accepted')
+        return ACCEPTED, depth + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """当前深度、水位与各类拒绝计数"""
+        counters = Metrics.snapshot()['counters']
+        return {
+            'depth': self.message_queue.qsize(),
+            'high_watermark': self.high_watermark,
+            'low_watermark': self.low_watermark,
+            'policy': self.policy,
+            'overloaded': self.overloaded,
+            'accepted': counters.get('admission.accepted', 0),
+            'rejected': counters.get('admission.rejected', 0),
+            'shed': counters.get('admission.shed', 0),
+            'queue_full': counters.get('admission.queue_full', 0),
+            'overload_events': counters.get('admission.overload_events', 0),
+        }
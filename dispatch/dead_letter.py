@@ -0,0 +1,90 @@
+"""死信存储：
+    重试多次仍然失败的消息写入本地 SQLite，供管理接口查看与重新投递
+    工作进程写入、主进程读取，每个进程使用自己的数据库连接
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from dispatch.transport import MessageCodec
+
+
+class DeadLetterStore:
+    """死信存储，记录消息、最后一次错误与重试次数"""
+
+    def __init__(self, path: str, codec: Optional[MessageCodec] = None):
+        """
+        Args:
+            path: 数据库文件路径
+            codec: 消息编码器
+        """
+        self.path = path
+        self.codec = codec or MessageCodec()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """按进程打开连接，fork 出的子进程不能复用父进程的连接（调用方需持有 _lock）"""
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letters ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload BLOB NOT NULL, error TEXT, "
+                "attempts INTEGER NOT NULL, failed_at REAL NOT NULL)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def add(self, message: Any, error: str, attempts: int) -> int:
+        """写入一条死信，返回死信ID"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO dead_letters (payload, error, attempts, failed_at) VALUES (?, ?, ?, ?)",
+                    (self.codec.encode(message), error, attempts, time.time()))
+            return cursor.lastrowid
+
+    def list(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """按失败时间倒序列出死信"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, payload, error, attempts, failed_at FROM dead_letters ORDER BY id DESC LIMIT ? OFFSET ?",
+                (limit, offset)).fetchall()
+        return [self._to_dict(*row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+
+    def pop(self, dead_letter_ids: Optional[List[int]] = None) -> List[Any]:
+        """取出并删除死信消息，dead_letter_ids 为空时取出全部，用于重新投递"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if dead_letter_ids is None:
+                    rows = conn.execute("SELECT id, payload FROM dead_letters ORDER BY id").fetchall()
+                else:
+                    marks = ','.join('?' * len(dead_letter_ids))
+                    rows = conn.execute(f"SELECT id, payload FROM dead_letters WHERE id IN ({marks}) ORDER BY id",
+                                        list(dead_letter_ids)).fetchall()
+                conn.executemany("DELETE FROM dead_letters WHERE id = ?", [(row[0],) for row in rows])
+        return [self.codec.decode(payload) for _, payload in rows]
+
+    def _to_dict(self, dead_letter_id, payload, error, attempts, failed_at) -> Dict[str, Any]:
+        message = self.codec.decode(payload)
+        content = dict(message.__dict__) if hasattr(message, '__dict__') else repr(message)
+        return {
+            'id': dead_letter_id,
+            'message': content,
+            'error': error,
+            'attempts': attempts,
+            'failed_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(failed_at)),
+        }
@@ -0,0 +1,249 @@
+"""优先级调度：
+    所有消息共用一个 FIFO 时，活跃群聊刷屏会拖慢私聊回复
+    在分片队列前增加一层加权公平队列（WFQ），由主进程中的调度线程按权重把消息送入分片队列
+    - 消息按 chat_type 分类（private / group），也可以为指定 sender_id 单独配置权重，成为独立的类
+    - 每条消息的虚拟完成时间 = max(分片虚拟时间, 该类上一条的完成时间) + 1 / 权重，按完成时间从小到大发送
+      权重高的类获得更多份额，但权重低的类也总会被调度，不会饿死
+    - 分片队列的深度即预取数（prefetch），其余积压留在本层，优先级才能生效
+      每个分片一个调度线程：本层无消息时等待条件变量，分片队列已满时阻塞在分片队列的 put 上
+    - 送入分片失败（非 queue.Full）的消息写入死信，不计入已调度
+    - 记录每个类别在本层的等待时间分位数（dispatch.wait.<类别>）
+"""
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from dispatch.dead_letter import DeadLetterStore
+from dispatch.reply_channel import ReplyChannel
+from dispatch.sharded_queue import ShardedQueue
+from dispatch.wal import Acknowledger
+from utils.metrics import Metrics
+
+logger = logging.getLogger("PriorityDispatcher")
+
+
+class PriorityDispatcher:
+    """带优先级的分片队列，对生产者与 run.py 仍表现为 ShardedQueue（put/qsize/shards/stats）"""
+
+    def __init__(self, sharded: ShardedQueue, class_weights: Optional[Dict[str, float]] = None,
+                 sender_weights: Optional[Dict[Any, float]] = None, maxsize: int = 0,
+                 dead_letters: Optional[DeadLetterStore] = None, put_timeout: float = 1.0):
+        """
+        Args:
+            sharded: 下游分片队列，分片队列深度即每个分片最多预取的消息数，必须为有限值
+            class_weights: chat_type -> 权重，未配置的类别权重为 1
+            sender_weights: sender_id -> 权重，配置后该发送者单独成为一个类别
+            maxsize: 本层最多积压的消息数，<= 0 表示不限制
+            dead_letters: 死信存储，送入分片失败的消息写入其中，为 None 时只记录日志
+            put_timeout: 调度线程阻塞在分片队列 put 上的单次超时（秒），超时后检查是否已停止
+        """
+        if not sharded.maxsize:
+            raise ValueError("优先级调度要求分片队列深度（预取数）为有限值")
+        self.sharded = sharded
+        self.class_weights = {str(k): float(v) for k, v in (class_weights or {}).items()}
+        self.sender_weights = {str(k): float(v) for k, v in (sender_weights or {}).items()}
+        self.pending_limit = max(0, int(maxsize))
+        self.dead_letters = dead_letters
+        self.put_timeout = put_timeout
+        self._heaps: List[list] = [[] for _ in range(sharded.shard_count)]
+        self._virtual_time = [0.0] * sharded.shard_count
+        self._last_finish: List[Dict[str, float]] = [{} for _ in range(sharded.shard_count)]
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._threads: List[Optional[threading.Thread]] = []
+        self._stopping = False
+
+    @classmethod
+    def from_setting(cls, manager, setting: dict,
+                     dead_letters: Optional[DeadLetterStore] = None) -> 'PriorityDispatcher':
+        """根据 dialogue_setting 创建：分片队列深度为 prefetch，queue_size 作为本层每个分片的积压上限"""
+        sharded = ShardedQueue(manager, setting.get('worker_count', 1), max(1, int(setting.get('prefetch', 2))))
+        return cls(
+            sharded,
+            class_weights=setting.get('class_weights', {'private': 4, 'group': 1}),
+            sender_weights=setting.get('sender_weights') or {},
+            maxsize=setting.get('queue_size', 0) * sharded.shard_count,
+            dead_letters=dead_letters,
+        )
+
+    # 与 ShardedQueue 保持一致的属性，run.py 据此启动工作进程
+    @property
+    def shards(self):
+        return self.sharded.shards
+
+    @property
+    def shard_count(self) -> int:
+        return self.sharded.shard_count
+
+    @property
+    def maxsize(self) -> int:
+        return self.sharded.maxsize
+
+    def classify(self, message: Any) -> str:
+        """消息所属类别：单独配置了权重的发送者 > chat_type"""
+        sender_id = getattr(message, 'sender_id', None)
+        if sender_id is not None and str(sender_id) in self.sender_weights:
+            return f"sender:{sender_id}"
+        return str(getattr(message, 'chat_type', None) or 'default')
+
+    def weight_of(self, flow: str) -> float:
+        if flow.startswith('sender:'):
+            weight = self.sender_weights.get(flow[len('sender:'):], 1.0)
+        else:
+            weight = self.class_weights.get(flow, 1.0)
+        return max(weight, 1e-6)
+
+    def put(self, message: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        """放入调度层，本层积压达到上限时按 queue.Queue 的语义阻塞或抛出 queue.Full"""
+        flow = self.classify(message)
+        shard_id = self.sharded.shard_of(message)
+        with self._condition:
+            if self.pending_limit:
+                if not self._condition.wait_for(lambda: self._pending < self.pending_limit,
+                                                timeout if block else 0):
+                    raise queue.Full
+            last_finish = self._last_finish[shard_id]
+            finish = max(self._virtual_time[shard_id], last_finish.get(flow, 0.0)) + 1.0 / self.weight_of(flow)
+            last_finish[flow] = finish
+            heapq.heappush(self._heaps[shard_id], (finish, next(self._sequence), flow, time.monotonic(), message))
+            self._pending += 1
+            self._ensure_started()
+            self._condition.notify_all()
+
+    def qsize(self) -> int:
+        """本层积压 + 分片队列积压"""
+        return self._pending + self.sharded.qsize()
+
+    def pending_by_class(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        with self._condition:
+            for heap in self._heaps:
+                for _, _, flow, _, _ in heap:
+                    counts[flow] = counts.get(flow, 0) + 1
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        """ShardedQueue.stats() + 各类别的积压与等待时间分位数"""
+        stats = self.sharded.stats()
+        waits = Metrics.snapshot()['percentiles']
+        pending = self.pending_by_class()
+        flows = set(pending) | set(self.class_weights) | {name[len('dispatch.wait.'):] for name in waits
+                                                          if name.startswith('dispatch.wait.')}
+        stats['classes'] = {
+            flow: {
+                'weight': self.weight_of(flow),
+                'pending': pending.get(flow, 0),
+                'wait': waits.get(f"dispatch.wait.{flow}", {'count': 0}),
+            }
+            for flow in sorted(flows)
+        }
+        return stats
+
+    def _ensure_started(self) -> None:
+        """启动各分片的调度线程，只替换已退出的线程，同一分片不会有两个调度线程（调用方需持有 _condition）"""
+        if len(self._threads) == self.shard_count and all(thread.is_alive() for thread in self._threads):
+            return
+        self._stopping = False
+        if len(self._threads) != self.shard_count:
+            self._threads = [None] * self.shard_count
+        for shard_id, thread in enumerate(self._threads):
+            if thread is not None and thread.is_alive():
+                continue
+            thread = self._threads[shard_id] = threading.Thread(
+                target=self._run, args=(shard_id,), name=f"priority-dispatcher-{shard_id}", daemon=True)
+            thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self, shard_id: int) -> None:
+        """分片调度线程：本层有消息时取出完成时间最小的一条，阻塞直到分片队列有空位"""
+        heap = self._heaps[shard_id]
+        shard = self.sharded.shards[shard_id]
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stopping or heap)
+                if self._stopping:
+                    return
+                entry = heapq.heappop(heap)
+            while True:
+                try:
+                    shard.put(entry[-1], True, self.put_timeout)
+                except queue.Full:
+                    if self._stopping:
+                        self._requeue(shard_id, entry)
+                        return
+                    continue
+                except Exception as e:
+                    self._failed(shard_id, entry, e)
+                else:
+                    self._dispatched(shard_id, entry)
+                break
+
+    def dispatch_once(self) -> int:
+        """不阻塞地向所有有空位的分片送入消息，返回本次送出的数量"""
+        sent = 0
+        for shard_id, shard in enumerate(self.sharded.shards):
+            heap = self._heaps[shard_id]
+            while True:
+                with self._condition:
+                    if not heap:
+                        break
+                    entry = heapq.heappop(heap)
+                try:
+                    shard.put(entry[-1], block=False)
+                except queue.Full:
+                    self._requeue(shard_id, entry)
+                    break
+                except Exception as e:
+                    self._failed(shard_id, entry, e)
+                    continue
+                self._dispatched(shard_id, entry)
+                sent += 1
+        return sent
+
+    def _requeue(self, shard_id: int, entry: tuple) -> None:
+        with self._condition:
+            heapq.heappush(self._heaps[shard_id], entry)
+
+    def _dispatched(self, shard_id: int, entry: tuple) -> None:
+        finish, _, flow, enqueued, _ = entry
+        Metrics.observe(f"dispatch.wait.{flow}", time.monotonic() - enqueued)
+        with self._condition:
+            self._virtual_time[shard_id] = finish
+            self._release(shard_id)
+
+    def _failed(self, shard_id: int, entry: tuple, error: Exception) -> None:
+        """送入分片失败（如消息无法序列化）：写入死信，不计入已调度"""
+        message = entry[-1]
+        Metrics.incr('dispatch.failed')
+        logger.error(f"消息送入分片 {shard_id} 失败，写入死信: {error}", exc_info=True)
+        ReplyChannel.failed(message, error)  # socket 客户端收到失败通知
+        if self.dead_letters is not None:
+            try:
+                self.dead_letters.add(message, f"{type(error).__name__}: {error}", 1)
+            except Exception as e:
+                logger.error(f"写入死信失败: {e}", exc_info=True)
+            else:
+                Acknowledger.ack(message)  # 死信已持久化，持久化队列中的原消息可以确认
+        with self._condition:
+            self._release(shard_id)
+
+    def _release(self, shard_id: int) -> None:
+        """一条消息离开本层（需持有 _condition）"""
+        if not self._heaps[shard_id]:
+            # 分片空闲后重置虚拟时间，避免数值无限增长
+            self._virtual_time[shard_id] = 0.0
+            self._last_finish[shard_id].clear()
+        self._pending -= 1
+        self._condition.notify_all()
@@ -0,0 +1,59 @@
+"""回复通道：
+    socket 客户端发来的消息（TextMessage.reply_to 不为空），回复不经过 MQTT，
+    由工作进程通过 reply_queue 发回主进程，再由 SocketAdapter 推送到客户端的长连接上
+    reply_queue 中每一项为 (reply_to, sender_id, payload, final, ack_ids, count)
+    - payload: 回复的 JSON 文本（与 MQTT 消息相同），流式回复时为一句
+    - final: 是否为该消息的最后一帧，最后一帧写入连接后确认持久化队列中的消息（ack_ids）
+    - count: 该回复对应的消息条数（连发合并后多条消息只有一条回复），用于归还客户端的在途配额
+"""
+import json
+from typing import Any, Optional
+
+from utils.metrics import Metrics
+
+SOCKET = 'socket'
+
+
+def socket_route(client_id: str, request_id: int) -> str:
+    """socket 消息的 reply_to：socket:<客户端ID>:<请求帧ID>"""
+    return f"{SOCKET}:{client_id}:{request_id}"
+
+
+def parse_route(reply_to: str) -> Optional[tuple]:
+    """解析 reply_to，返回 (客户端ID, 请求帧ID)，不是 socket 消息时返回 None"""
+    kind, _, rest = (reply_to or '').partition(':')
+    client_id, _, request_id = rest.rpartition(':')
+    if kind != SOCKET or not client_id or not request_id.isdigit():
+        return None
+    return client_id, int(request_id)
+
+
+class ReplyChannel:
+    """工作进程一侧：把 socket 消息的回复发回主进程（未启用 socket 服务时不接管任何消息）"""
+    _queue = None
+
+    @classmethod
+    def bind(cls, reply_queue) -> None:
+        cls._queue = reply_queue
+
+    @classmethod
+    def accepts(cls, message: Any) -> bool:
+        """消息的回复是否经由回复通道发送"""
+        return cls._queue is not None and parse_route(getattr(message, 'reply_to', None)) is not None
+
+    @classmethod
+    def publish(cls, message: Any, payload: str, final: bool = True, ack: bool = True) -> None:
+        """发送一帧回复，ack 为 False 时写入连接后不确认持久化队列中的消息"""
+        message_ids = getattr(message, 'ack_ids', None) or [getattr(message, 'message_id', None)]
+        ack_ids = [message_id for message_id in message_ids if message_id is not None] if final and ack else []
+        count = getattr(message, 'merged_count', 1)
+        cls._queue.put((message.reply_to, message.sender_id, payload, final, ack_ids, count))
+        Metrics.incr('reply_channel.sent')
+
+    @classmethod
+    def failed(cls, message: Any, error: Exception) -> None:
+        """消息多次重试仍失败（写入死信）时通知客户端，同时归还在途配额；持久化队列中的消息由死信流程确认"""
+        if not cls.accepts(message):
+            return
+        payload = json.dumps({'status': 'error', 'message': f"{type(error).__name__}: {error}"}, ensure_ascii=False)
+        cls.publish(message, payload, ack=False)
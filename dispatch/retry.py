@@ -0,0 +1,144 @@
+"""失败重试：
+    rag 请求失败或 MQTT 回复发送失败时，消息不再直接丢弃
+    - 按指数退避 + 随机抖动计算下一次重试时间，放入定时堆，不阻塞工作进程处理其他消息
+    - 超过最大重试次数后写入死信存储，可通过管理接口查看与重新投递
+    - 重试的消息与新消息共用同一个处理入口（RetryingQueue.get），到期的重试优先取出
+"""
+import heapq
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Any, Optional
+
+from dispatch.dead_letter import DeadLetterStore
+from dispatch.reply_channel import ReplyChannel
+from dispatch.wal import Acknowledger
+from utils.metrics import Metrics
+
+logger = logging.getLogger("RetryScheduler")
+
+
+class DeliveryError(Exception):
+    """rag 未返回回复或 MQTT 回复未能发送，需要重试"""
+
+
+class RetryScheduler:
+    """失败消息的定时重试堆（线程安全）"""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 jitter: float = 0.5, dead_letters: Optional[DeadLetterStore] = None, clock=time.monotonic):
+        """
+        Args:
+            max_attempts: 最多处理次数（含第一次），达到后写入死信
+            base_delay: 第一次重试的基础等待时间（秒），之后每次翻倍
+            max_delay: 单次等待时间上限（秒）
+            jitter: 随机抖动比例，0 ~ 1，避免大量消息在同一时刻重试
+            dead_letters: 死信存储，为 None 时超过次数的消息只记录日志
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = max(0.0, float(base_delay))
+        self.max_delay = max(self.base_delay, float(max_delay))
+        self.jitter = min(max(float(jitter), 0.0), 1.0)
+        self.dead_letters = dead_letters
+        self.clock = clock
+        self._heap = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_setting(cls, setting: dict) -> 'RetryScheduler':
+        """根据 dialogue_setting 创建"""
+        return cls(
+            max_attempts=setting.get('retry_max_attempts', 5),
+            base_delay=setting.get('retry_base_delay', 1),
+            max_delay=setting.get('retry_max_delay', 60),
+            jitter=setting.get('retry_jitter', 0.5),
+            dead_letters=DeadLetterStore(setting.get('dead_letter_path', 'data/queue/dead_letters.db')),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay * (1 - self.jitter) + random.random() * delay * self.jitter
+
+    def failed(self, message: Any, error: Exception) -> None:
+        """记录一次处理失败：未超过次数时放入定时堆，否则写入死信"""
+        attempt = getattr(message, 'retry_attempt', 0) + 1
+        if attempt >= self.max_attempts:
+            self._dead_letter(message, error, attempt)
+            return
+        try:
+            message.retry_attempt = attempt
+        except AttributeError:
+            # 无法记录重试次数的对象（如 GET / 发送的测试字符串）不重试，直接写入死信
+            self._dead_letter(message, error, attempt)
+            return
+        delay = self.backoff(attempt)
+        with self._lock:
+            heapq.heappush(self._heap, (self.clock() + delay, next(self._sequence), message))
+            Metrics.gauge('retry.scheduled', len(self._heap))
+        Metrics.incr('retry.retried')
+        logger.warning(f"消息第 {attempt} 次处理失败，{delay:.1f} 秒后重试: {error}")
+
+    def _dead_letter(self, message: Any, error: Exception, attempts: int) -> None:
+        Metrics.incr('retry.dead_lettered')
+        logger.error(f"消息处理 {attempts} 次均失败，写入死信: {error}")
+        ReplyChannel.failed(message, error)  # socket 客户端收到失败通知
+        if self.dead_letters is None:
+            return
+        try:
+            self.dead_letters.add(message, f"{type(error).__name__}: {error}", attempts)
+        except Exception as e:
+            logger.error(f"写入死信失败: {e}", exc_info=True)
+            return
+        # 死信已持久化，持久化队列中的原消息可以确认
+        Acknowledger.ack(message)
+
+    def pop_due(self) -> Optional[Any]:
+        """取出一条已到期的重试消息"""
+        with self._lock:
+            if self._heap and self._heap[0][0] <= self.clock():
+                message = heapq.heappop(self._heap)[2]
+                Metrics.gauge('retry.scheduled', len(self._heap))
+                return message
+        return None
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+
+class RetryingQueue:
+    """在消息队列外包一层重试堆，对消费者仍表现为 get(timeout) 接口"""
+
+    def __init__(self, source, scheduler: RetryScheduler):
+        self.source = source
+        self.scheduler = scheduler
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        """优先取出到期的重试消息，否则从原队列读取，最多等到下一条重试到期"""
+        clock = self.scheduler.clock
+        deadline = None if timeout is None else clock() + timeout
+        while True:
+            message = self.scheduler.pop_due()
+            if message is not None:
+                return message
+            now = clock()
+            if not block or deadline is not None and now >= deadline:
+                raise queue.Empty
+            wake = self.scheduler.next_due()
+            if deadline is not None:
+                wake = deadline if wake is None else min(wake, deadline)
+            try:
+                return self.source.get(timeout=None if wake is None else max(wake - now, 0.001))
+            except queue.Empty:
+                continue
+
+    def qsize(self) -> int:
+        return self.source.qsize() + self.scheduler.pending()
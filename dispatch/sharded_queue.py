@@ -0,0 +1,99 @@
+"""分片消息队列：
+    按 sender_id 的哈希值将消息路由到固定的分片队列，每个分片由一个对话工作进程消费
+    - 同一用户的消息始终落在同一分片 -> 保证单用户消息有序
+    - 不同用户分散到不同分片 -> 多进程并行处理
+"""
+import zlib
+from typing import Any, Dict, List, Optional
+
+from utils.metrics import Metrics
+
+
+class ShardedQueue:
+    """分片队列，对生产者一侧表现为普通队列（put/qsize）"""
+
+    def __init__(self, manager, shard_count: int = 1, maxsize: int = 0):
+        """
+        Args:
+            manager: 提供 Queue(maxsize) 的对象（QueueTransport 或 multiprocessing.Manager() 实例），用于创建跨进程队列
+            shard_count: 分片数量（即对话工作进程数量）
+            maxsize: 每个分片队列的最大深度，<= 0 表示不限制
+        """
+        self.shard_count = max(1, int(shard_count))
+        self.maxsize = max(0, int(maxsize))
+        self.shards = [manager.Queue(self.maxsize) for _ in range(self.shard_count)]
+
+    @staticmethod
+    def shard_key(message: Any) -> Optional[str]:
+        """获取消息的分片键，没有 sender_id 的消息（如测试消息）返回 None"""
+        sender_id = getattr(message, 'sender_id', None)
+        return None if sender_id is None else str(sender_id)
+
+    def shard_of(self, message: Any) -> int:
+        """计算消息所属分片
+
+        使用 crc32 而不是内置 hash()，保证不同进程、不同启动之间结果一致
+        """
+        key = self.shard_key(message)
+        if key is None:
+            return 0
+        return zlib.crc32(key.encode('utf-8')) % self.shard_count
+
+    def put(self, message: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        """将消息放入其所属分片"""
+        self.shards[self.shard_of(message)].put(message, block, timeout)
+
+    def depths(self) -> List[int]:
+        """各分片当前积压深度"""
+        return [shard.qsize() for shard in self.shards]
+
+    def qsize(self) -> int:
+        """所有分片的积压总数"""
+        return sum(self.depths())
+
+    def stats(self) -> Dict[str, Any]:
+        """运行时统计：分片数量、每个分片的积压深度、已处理数量、吞吐量、连发合并与重试情况、rag 后端连接池情况
+
+        吞吐量来自各工作进程 flush 到共享字典中的 dialogue.throughput 指标
+        """
+        collected = Metrics.collect()
+        shards = []
+        for shard_id, depth in enumerate(self.depths()):
+            scope = collected.get(f"dialogue-{shard_id}", {})
+            rate = scope.get('rates', {}).get('dialogue.throughput', {})
+            counters = scope.get('counters', {})
+            gauges = scope.get('gauges', {})
+            percentiles = scope.get('percentiles', {})
+            limiters = {name[len('limiter.'):-len('.limit')]: None for name in gauges
+                        if name.startswith('limiter.') and name.endswith('.limit')}
+            for name in limiters:
+                limiters[name] = {'limit': gauges.get(f'limiter.{name}.limit'),
+                                  'inflight': gauges.get(f'limiter.{name}.inflight', 0),
+                                  'queue_seconds': percentiles.get(f'limiter.{name}.queue_seconds', {'count': 0})}
+            backends = {name[len('rag.backend.'):-len('.requests')]: None for name in counters
+                        if name.startswith('rag.backend.') and name.endswith('.requests')}
+            for name in backends:
+                prefix = f'rag.backend.{name}'
+                backends[name] = {'healthy': gauges.get(f'{prefix}.healthy', True),
+                                  'outstanding': gauges.get(f'{prefix}.outstanding', 0),
+                                  'requests': counters.get(f'{prefix}.requests', 0),
+                                  'connections_opened': counters.get(f'{prefix}.connections_opened', 0),
+                                  'latency': percentiles.get(f'{prefix}.latency', {'count': 0})}
+            shards.append({
+                'shard': shard_id,
+                'depth': depth,
+                'processed': rate.get('total', 0),
+                'failed': counters.get('dialogue.failed', 0),
+                'per_second': rate.get('per_second', 0.0),
+                'coalesced': counters.get('coalesce.merged', 0),
+                'saved_calls': counters.get('coalesce.saved_calls', 0),
+                'retried': counters.get('retry.retried', 0),
+                'dead_lettered': counters.get('retry.dead_lettered', 0),
+                'cache_hits': counters.get('answer_cache.hit', 0),
+                'cache_misses': counters.get('answer_cache.miss', 0),
+                'breakers': {name[len('breaker.'):-len('.state')]: state for name, state in gauges.items()
+                             if name.startswith('breaker.') and name.endswith('.state')},
+                'limiters': limiters,
+                'backends': backends,
+            })
+        return {'worker_count': self.shard_count, 'queue_size': self.maxsize, 'shards': shards}
@@ -0,0 +1,157 @@
+"""进程间消息传输：
+    Manager().Queue 的每次 put/get 都是一次发往 manager 进程的 RPC，且 TextMessage 按对象 pickle
+    这里改为 multiprocessing.Queue（管道 + 后台 feeder 线程，put 不等待对端）并使用紧凑的二进制编码
+    - MessageCodec: TextMessage <-> bytes，其他对象回退为 pickle
+    - EncodedQueue: 在 multiprocessing.Queue 外做编解码
+    - QueueTransport: 按配置创建队列，供 ShardedQueue 使用
+"""
+import multiprocessing
+import pickle
+import struct
+import typing
+from dataclasses import fields
+from typing import Any, List, Optional, Tuple
+
+from models.message import TextMessage
+
+_FIXED_FORMATS = {int: 'q', float: 'd', bool: '?', str: 'I'}  # str 在定长区只存放字节长度
+
+
+class MessageCodec:
+    """TextMessage 的紧凑二进制编码
+
+    布局: 类型标记(1B) | None 位图(4B) | 定长区(整数/浮点/布尔/字符串长度) | 字符串内容(utf-8)
+    字段布局由 TextMessage 的字段声明自动生成，新增字段无需修改编码器
+    """
+    TEXT = b'T'
+    PICKLE = b'P'
+
+    def __init__(self, message_class=TextMessage):
+        self.message_class = message_class
+        hints = typing.get_type_hints(message_class)
+        self.fields: List[Tuple[str, type]] = [(f.name, self._base_type(hints[f.name])) for f in fields(message_class)]
+        if len(self.fields) > 32:
+            raise ValueError("MessageCodec 最多支持 32 个字段")
+        self.struct = struct.Struct('<I' + ''.join(_FIXED_FORMATS[kind] for _, kind in self.fields))
+
+    @staticmethod
+    def _base_type(hint) -> type:
+        """Optional[X] -> X"""
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        base = args[0] if args else hint
+        if base not in _FIXED_FORMATS:
+            raise TypeError(f"MessageCodec 不支持的字段类型: {hint}")
+        return base
+
+    def encode(self, message: Any) -> bytes:
+        if type(message) is not self.message_class:
+            return self.PICKLE + pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        mask = 0
+        fixed = []
+        blobs = []
+        try:
+            for index, (name, kind) in enumerate(self.fields):
+                value = getattr(message, name)
+                if value is None:
+                    mask |= 1 << index
+                    fixed.append(False if kind is bool else 0)
+                elif not self._matches(value, kind):
+                    raise TypeError(name)
+                elif kind is str:
+                    blob = value.encode('utf-8')
+                    fixed.append(len(blob))
+                    blobs.append(blob)
+                else:
+                    fixed.append(value)
+            return self.TEXT + self.struct.pack(mask, *fixed) + b''.join(blobs)
+        except (TypeError, struct.error, UnicodeEncodeError):
+            # 字段类型与声明不符（如 sender_id 传入了字符串、content 传入了数字）、整数超出 8 字节、
+            # 字符串含有无法编码的代理字符时退回 pickle
+            return self.PICKLE + pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _matches(value: Any, kind: type) -> bool:
+        if kind is float:
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+        if kind is int:
+            return isinstance(value, int) and not isinstance(value, bool)
+        return isinstance(value, kind)
+
+    def decode(self, data: bytes) -> Any:
+        if data[:1] == self.PICKLE:
+            return pickle.loads(data[1:])
+        values = self.struct.unpack_from(data, 1)
+        mask = values[0]
+        offset = 1 + self.struct.size
+        kwargs = {}
+        for index, (name, kind) in enumerate(self.fields):
+            value = values[index + 1]
+            if mask & (1 << index):
+                kwargs[name] = None
+            elif kind is str:
+                kwargs[name] = data[offset:offset + value].decode('utf-8')
+                offset += value
+            else:
+                kwargs[name] = value
+        return self.message_class(**kwargs)
+
+
+class EncodedQueue:
+    """multiprocessing.Queue + MessageCodec，接口与 queue.Queue 一致
+
+    队列深度由共享计数器统计（put 成功后加一，get 成功后减一），
+    macOS 不支持 sem_getvalue，multiprocessing.Queue.qsize() 不可用，准入控制与优先级调度依赖该深度
+    """
+
+    def __init__(self, maxsize: int = 0, codec: Optional[MessageCodec] = None, context=None):
+        context = context or multiprocessing.get_context()
+        self.codec = codec or MessageCodec()
+        self.queue = context.Queue(maxsize)
+        self._size = context.Value('q', 0)
+
+    def put(self, message: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        self.queue.put(self.codec.encode(message), block, timeout)
+        with self._size.get_lock():
+            self._size.value += 1
+
+    def put_nowait(self, message: Any) -> None:
+        self.put(message, False)
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        data = self.queue.get(block, timeout)
+        with self._size.get_lock():
+            self._size.value -= 1
+        return self.codec.decode(data)
+
+    def get_nowait(self) -> Any:
+        return self.get(False)
+
+    def qsize(self) -> int:
+        # 消费者可能在生产者计数之前取走消息，计数短暂为负
+        return max(0, self._size.value)
+
+    def empty(self) -> bool:
+        return self.queue.empty()
+
+
+class QueueTransport:
+    """按配置创建对话消息队列
+
+    Args:
+        kind: queue -> multiprocessing.Queue + 二进制编码（默认）; manager -> Manager().Queue 代理队列
+        manager: kind 为 manager 时使用的 Manager() 实例
+    """
+
+    def __init__(self, kind: str = 'queue', manager=None):
+        if kind not in ('queue', 'manager'):
+            raise ValueError(f"未知的队列传输方式: {kind}")
+        if kind == 'manager' and manager is None:
+            raise ValueError("manager 传输方式需要传入 Manager() 实例")
+        self.kind = kind
+        self.manager = manager
+        self.codec = MessageCodec()
+
+    def Queue(self, maxsize: int = 0):
+        if self.kind == 'manager':
+            return self.manager.Queue(maxsize)
+        return EncodedQueue(maxsize, self.codec)
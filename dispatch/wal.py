@@ -0,0 +1,229 @@
+"""持久化消息队列（预写日志）：
+    队列位于内存 / Manager 进程中，重启或崩溃时所有已接收但未处理的消息都会丢失
+    启用 durable_queue 后，/message/text 接收的消息先写入本地 SQLite 日志再入队：
+    - 组提交：写入线程把同一时间段内到达的所有写入与确认合并为一个事务，只 fsync 一次
+    - 至少一次投递：对话工作进程在 MQTT 回复收到 PUBACK 后，通过确认队列通知主进程删除该消息
+    - 启动时重放所有未确认的消息
+"""
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, List, Optional
+
+from dispatch.transport import MessageCodec
+from utils.metrics import Metrics
+
+logger = logging.getLogger("MessageLog")
+
+
+class _Append:
+    __slots__ = ('payload', 'message_id', 'done', 'error')
+
+    def __init__(self, payload: bytes, message_id: int):
+        self.payload = payload
+        self.message_id = message_id
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+
+
+class MessageLog:
+    """基于 SQLite 的消息日志，写入与确认由单个写入线程组提交"""
+
+    def __init__(self, path: str, max_batch: int = 512, commit_delay: float = 0.0, codec: Optional[MessageCodec] = None):
+        """
+        Args:
+            path: 日志文件路径
+            max_batch: 单个事务最多包含的写入数
+            commit_delay: 提交前额外等待更多写入的时间（秒），0 表示只合并提交期间自然积累的写入
+            codec: 消息编码器
+        """
+        self.path = path
+        self.max_batch = max(1, int(max_batch))
+        self.commit_delay = max(0.0, float(commit_delay))
+        self.codec = codec or MessageCodec()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, payload BLOB NOT NULL, created REAL NOT NULL)")
+        self._conn.commit()
+        self._next_id = (self._conn.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0) + 1
+        self._appends: List[_Append] = []
+        self._acks: List[int] = []
+        self._condition = threading.Condition()  # 保护待提交的写入与确认
+        self._db_lock = threading.Lock()  # 保护数据库连接，提交期间不阻塞新的写入
+        self._stopping = False
+        self._writer = threading.Thread(target=self._write_loop, name="message-log-writer", daemon=True)
+        self._writer.start()
+        self._ack_reader: Optional[threading.Thread] = None
+
+    def append(self, message: Any, timeout: Optional[float] = 10.0) -> int:
+        """写入一条消息并等待其所在事务提交，返回消息ID（同时写入 message.message_id）"""
+        with self._condition:
+            message_id = self._next_id
+            self._next_id += 1
+            message.message_id = message_id
+            entry = _Append(self.codec.encode(message), message_id)
+            self._appends.append(entry)
+            self._condition.notify_all()
+        if not entry.done.wait(timeout):
+            raise TimeoutError("消息日志写入超时")
+        if entry.error is not None:
+            raise entry.error
+        return message_id
+
+    def ack(self, message_ids: Iterable[int]) -> None:
+        """确认（删除）消息，随下一次组提交写入"""
+        message_ids = [message_id for message_id in message_ids if message_id is not None]
+        if not message_ids:
+            return
+        with self._condition:
+            self._acks.extend(message_ids)
+            self._condition.notify_all()
+
+    def attach_ack_queue(self, ack_queue) -> None:
+        """启动读取线程，把工作进程通过确认队列发来的消息ID交给写入线程"""
+        def read_acks():
+            while not self._stopping:
+                try:
+                    self.ack(ack_queue.get(timeout=1))
+                except queue.Empty:
+                    continue
+                except (EOFError, OSError):
+                    return
+        self._ack_reader = threading.Thread(target=read_acks, name="message-log-acks", daemon=True)
+        self._ack_reader.start()
+
+    def unacked(self) -> List[Any]:
+        """所有未确认的消息（按写入顺序），用于启动时重放"""
+        with self._db_lock:
+            rows = self._conn.execute("SELECT id, payload FROM messages ORDER BY id").fetchall()
+        messages = []
+        for message_id, payload in rows:
+            message = self.codec.decode(payload)
+            message.message_id = message_id
+            messages.append(message)
+        return messages
+
+    def pending(self) -> int:
+        with self._db_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self) -> None:
+        """提交剩余的写入与确认后关闭"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._writer.join()
+        self._conn.close()
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._condition:
+                while not (self._appends or self._acks or self._stopping):
+                    self._condition.wait()
+                if self._stopping and not (self._appends or self._acks):
+                    return
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            with self._condition:
+                appends = self._appends[:self.max_batch]
+                del self._appends[:self.max_batch]
+                acks, self._acks = self._acks, []
+            # 提交期间新到达的写入继续积累，下一轮一起提交
+            self._commit(appends, acks)
+
+    def _commit(self, appends: List[_Append], acks: List[int]) -> None:
+        """在一个事务中写入新消息并删除已确认的消息"""
+        start = time.monotonic()
+        try:
+            now = time.time()
+            with self._db_lock, self._conn:
+                if appends:
+                    self._conn.executemany("INSERT INTO messages (id, payload, created) VALUES (?, ?, ?)",
+                                           [(entry.message_id, entry.payload, now) for entry in appends])
+                if acks:
+                    self._conn.executemany("DELETE FROM messages WHERE id = ?", [(message_id,) for message_id in acks])
+        except Exception as e:
+            logger.error(f"消息日志提交失败: {e}", exc_info=True)
+            for entry in appends:
+                entry.error = e
+        Metrics.incr('wal.commits')
+        Metrics.incr('wal.appended', len(appends))
+        Metrics.incr('wal.acked', len(acks))
+        Metrics.observe('wal.commit_seconds', time.monotonic() - start)
+        for entry in appends:
+            entry.done.set()
+
+
+class DurableQueue:
+    """先写日志再入队的消息队列，对生产者与 run.py 仍表现为 ShardedQueue"""
+
+    def __init__(self, inner, log: MessageLog):
+        self.inner = inner
+        self.log = log
+
+    @property
+    def shards(self):
+        return self.inner.shards
+
+    @property
+    def shard_count(self) -> int:
+        return self.inner.shard_count
+
+    @property
+    def maxsize(self) -> int:
+        return self.inner.maxsize
+
+    def put(self, message: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        """写入日志后入队；入队失败（如队列已满）时立即确认删除，由调用方处理拒绝"""
+        if not hasattr(message, 'message_id'):
+            # 非 TextMessage（如测试消息）不需要持久化
+            self.inner.put(message, block, timeout)
+            return
+        message_id = self.log.append(message)
+        try:
+            self.inner.put(message, block, timeout)
+        except Exception:
+            self.log.ack([message_id])
+            raise
+
+    def replay(self) -> int:
+        """启动时把未确认的消息重新放入队列，返回重放数量"""
+        messages = self.log.unacked()
+        for message in messages:
+            self.inner.put(message)
+        if messages:
+            logger.info(f"重放 {len(messages)} 条未确认的消息")
+        return len(messages)
+
+    def qsize(self) -> int:
+        return self.inner.qsize()
+
+    def stats(self):
+        stats = self.inner.stats()
+        stats['durable_pending'] = self.log.pending()
+        return stats
+
+
+class Acknowledger:
+    """工作进程一侧：回复送达后把消息ID发回主进程（未启用持久化队列时为空操作）"""
+    _queue = None
+
+    @classmethod
+    def bind(cls, ack_queue) -> None:
+        cls._queue = ack_queue
+
+    @classmethod
+    def ack(cls, message: Any) -> None:
+        if cls._queue is None:
+            return
+        message_ids = getattr(message, 'ack_ids', None) or [getattr(message, 'message_id', None)]
+        message_ids = [message_id for message_id in message_ids if message_id is not None]
+        if message_ids:
+            cls._queue.put(message_ids)
@@ -2,10 +2,12 @@
 Global variables
 全局变量
 """
+import multiprocessing
 from queue import Queue
 from typing import Optional
 
 from config import SettingReader
+from dispatch import AdmissionController, DeadLetterStore, DurableQueue, MessageLog, PriorityDispatcher, QueueTransport, ShardedQueue
 from registry import HandlerRegistry
 
 
@@ -15,8 +17,13 @@ from registry import HandlerRegistry
 class GlobalVariable:
     _var = {} # 通用全局变量，需要使用自行添加
     handlerRegistry = None # 处理器注册器
-    to_message_get_queue:Queue = None  # 进程通信队列 消息接收进程
+    to_message_get_queue:ShardedQueue = None  # 进程通信队列 消息接收进程（按 sender_id 分片，可能包装为 PriorityDispatcher）
     to_message_send_queue:Queue = None  # 进程通信队列 消息发送进程
+    admission: AdmissionController = None  # 准入控制 /message/text 入队前按队列深度判断是否接收
+    metrics_store = None  # 跨进程指标快照 Manager().dict()
+    ack_queue = None  # 持久化队列的确认队列 工作进程 -> 主进程，未启用持久化队列时为 None
+    reply_queue = None  # socket 客户端消息的回复队列 工作进程 -> 主进程，未启用 socket 服务时为 None
+    dead_letters: DeadLetterStore = None  # 死信存储 多次重试仍失败的消息，供管理接口查看与重新投递
     rag_url = None
     config = None
 
@@ -26,8 +33,31 @@ class GlobalVariable:
 
     @classmethod
     def init_queues(cls,manager):
-        cls.to_message_get_queue = manager.Queue(-1) # 进程通信队列 消息接收进程
+        worker_count = cls.get_setting('dialogue_setting', 'worker_count', 1)
+        queue_size = cls.get_setting('dialogue_setting', 'queue_size', 0)
+        transport = QueueTransport(cls.get_setting('dialogue_setting', 'transport', 'queue'), manager)
+        cls.dead_letters = DeadLetterStore(cls.get_setting('dialogue_setting', 'dead_letter_path', 'data/queue/dead_letters.db'))
+        if cls.get_setting('dialogue_setting', 'priority_enabled', False):
+            # 私聊 / 群聊加权公平调度，调度线程在主进程中把消息送入分片队列（分片队列深度为 prefetch，积压留在调度层）
+            cls.to_message_get_queue = PriorityDispatcher.from_setting(transport, cls.get_setting('dialogue_setting', default={}), cls.dead_letters)
+        else:
+            cls.to_message_get_queue = ShardedQueue(transport, worker_count, queue_size) # 进程通信队列 消息接收进程
+        if cls.get_setting('dialogue_setting', 'durable_queue', False):
+            # 先写本地日志再入队，回复送达后由工作进程通过 ack_queue 确认，重启时重放未确认的消息
+            message_log = MessageLog(
+                cls.get_setting('dialogue_setting', 'durable_path', 'data/queue/messages.db'),
+                max_batch=cls.get_setting('dialogue_setting', 'durable_max_batch', 512),
+                commit_delay=cls.get_setting('dialogue_setting', 'durable_commit_delay', 0),
+            )
+            cls.ack_queue = multiprocessing.Queue()
+            message_log.attach_ack_queue(cls.ack_queue)
+            cls.to_message_get_queue = DurableQueue(cls.to_message_get_queue, message_log)
+        cls.admission = AdmissionController.from_setting(cls.to_message_get_queue, cls.get_setting('dialogue_setting', default={}))
+        if cls.get_setting('socket_setting', 'enabled', False):
+            # socket 客户端消息的回复由工作进程发回主进程，推送到客户端的长连接上
+            cls.reply_queue = multiprocessing.Queue()
         cls.to_message_send_queue = manager.Queue(-1) # 进程通信队列 消息发送进程
+        cls.metrics_store = manager.dict()
     @classmethod
     def init_handler_registry(cls):
         cls.handlerRegistry = HandlerRegistry()
@@ -35,6 +65,16 @@ class GlobalVariable:
     def init_config(cls):
         cls.config = SettingReader().get_config()
     @classmethod
+    def get_setting(cls, category, key=None, default=None):
+        """读取 config['categories'][category][key]，缺失时返回 default（兼容旧版本的 config.yaml）"""
+        if cls.config is None:
+            cls.init_config()
+        value = (cls.config or {}).get('categories', {}).get(category)
+        if key is not None:
+            value = value.get(key) if isinstance(value, dict) else None
+        return default if value is None else value
+
+    @classmethod
     def set(cls, key, value):
         cls._var[key] = value
     
@@ -4,6 +4,7 @@
 """
 
 from dataclasses import dataclass
+from typing import Optional
 
 @dataclass
 class TextMessage:
@@ -16,6 +17,8 @@ class TextMessage:
         message_type: 消息类型
         message_send_time: 消息发送时间
         content: 消息内容
+        message_id: 持久化队列中的消息ID，未启用持久化队列时为 None
+        reply_to: 回复通道，socket 客户端发来的消息为 socket:<客户端ID>:<请求帧ID>，为 None 时回复发布到 MQTT
     说明：
         消息类型为text时，content为文本内容
     """
@@ -26,7 +29,35 @@ class TextMessage:
     message_type: str
     message_send_time: str
     content: str
+    message_id: Optional[int] = None
+    reply_to: Optional[str] = None
     
+    @classmethod
+    def validate(cls, data) -> Optional[str]:
+        """校验客户端发来的消息字典（/message/text 接口与 socket 接口共用），通过时返回 None，否则返回错误信息"""
+        if not isinstance(data, dict):
+            return '消息必须为JSON对象'
+        for field in ['sender_id', 'sender', 'chat_type', 'character', 'message_type', 'message_send_time', 'content']:
+            if field not in data:
+                return f'缺少必需字段: {field}'
+        if not isinstance(data['sender_id'], int):
+            return 'sender_id必须为整数'
+        if not isinstance(data['sender'], str):
+            return 'sender必须为字符串'
+        if data['chat_type'] != 'group' and data['chat_type'] != 'private':
+            return 'chat_type必须为group或者private'
+        if not isinstance(data['character'], int):
+            return 'character必须为整数'
+        if data['message_type'] != 'text':
+            return 'message_type必须为text'
+        if not isinstance(data['message_send_time'], str):
+            return 'message_send_time必须为字符串'
+        if not isinstance(data['content'], str):
+            return 'content必须为字符串'
+        if data['content'] == '':
+            return 'content内容为空'
+        return None
+
     @classmethod
     def from_dict(cls, data: dict) -> 'TextMessage':
         """从字典创建消息实例"""
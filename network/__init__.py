@@ -7,6 +7,7 @@
 
 import asyncio
 from typing import Tuple
+from globals.global_variable import GlobalVariable
 from network.routes.flask_routes import FlaskAdapter
 from network.routes.socket_routes import SocketAdapter
 
@@ -49,16 +50,16 @@ class NetworkManager:
         if not self.flask_adapter or not self.socket_adapter:
             raise RuntimeError("网络适配器尚未初始化，请先调用initialize方法")
             
+        # 启动Socket服务器（机器人客户端长连接）
+        socket_setting = GlobalVariable.get_setting('socket_setting', default={})
+        if socket_setting.get('enabled', False):
+            await self.socket_adapter.start(socket_setting, GlobalVariable.reply_queue, GlobalVariable.ack_queue)
+
         # 启动Flask服务器
         async def start_flask():
             loop = asyncio.get_event_loop()
 
-            await loop.run_in_executor(
-                None, 
-                self.flask_adapter.app.run, 
-                self.flask_adapter.host, 
-                self.flask_adapter.port
-            )
+            await loop.run_in_executor(None, self.flask_adapter.serve)
             
         self._flask_task = asyncio.create_task(start_flask())
         
@@ -69,6 +70,10 @@ class NetworkManager:
             
     async def shutdown(self) -> None:
         """关闭所有服务器"""
+        # 先优雅停止 HTTP 服务（等待进行中的请求完成，阻塞，因此放在线程中执行），serve 随之返回
+        if self.flask_adapter:
+            await asyncio.get_running_loop().run_in_executor(None, self.flask_adapter.shutdown)
+
         if hasattr(self, '_flask_task'):
             self._flask_task.cancel()
             try:
@@ -76,10 +81,6 @@ class NetworkManager:
             except asyncio.CancelledError:
                 pass
         
-        # 关闭Flask服务器
-        if self.flask_adapter:
-            self.flask_adapter.shutdown()
-        
         # 关闭Socket服务器
         if self.socket_adapter:
             await self.socket_adapter.close()
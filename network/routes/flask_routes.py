@@ -2,8 +2,7 @@ import asyncio
 from typing import Any, Dict, Optional, List, Callable
 from flask import Flask, jsonify, request, session
 from flask_cors import CORS
-from werkzeug.serving import make_server
-from threading import Thread
+from globals.global_variable import GlobalVariable
 
 from yaml import Token
 
@@ -14,6 +13,7 @@ from .http_routes.message_routes import MessageRoutes
 from .http_routes.config_routes import ConfigRoutes
 from .http_routes.system_routes import SystemRoutes
 from .http_routes.resource_routes import ResourceRoutes
+from .wsgi_server import WsgiServer, create_wsgi_server
 
 class FlaskAdapter():
     """Flask通信适配器
@@ -33,7 +33,7 @@ class FlaskAdapter():
         self.port = port
         self.app: Flask = Flask(__name__)
         CORS(self.app)
-        self.server = None
+        self.server: Optional[WsgiServer] = None
         # self.routes = {}
         # token 解析器
         self.token_config = token_config.TokenConfig()
@@ -111,9 +111,15 @@ class FlaskAdapter():
         """配置静态文件夹"""
         self.app.static_folder = 'static'
 
-    def shutdown(self) -> None:
-        """关闭Flask服务器"""
+    def serve(self) -> None:
+        """按 http_setting 启动 HTTP 服务并阻塞，直到 shutdown 被调用"""
+        setting = GlobalVariable.get_setting('http_setting', default={})
+        self.server = create_wsgi_server(self.app, self.host, self.port, setting)
+        self.server.serve_forever()
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """关闭Flask服务器：停止接收新连接，等待进行中的请求完成（最多 timeout 秒，默认 http_setting.shutdown_timeout）"""
         if self.server:
-            self.server.shutdown()
-            self.server = None
+            server, self.server = self.server, None
+            server.shutdown(timeout)
 
@@ -3,6 +3,7 @@ import os
 from flask import request, jsonify
 from werkzeug.utils import secure_filename
 
+from dispatch.admission import ACCEPTED, QUEUE_FULL, SHED
 from globals.global_variable import GlobalVariable
 from models.message import TextMessage
 
@@ -29,6 +30,8 @@ class MessageRoutes:
                 JSON响应:
                 - 成功: {'status': 'ok', 'message': '消息接收成功', 'received_content': str}
                 - 失败: {'status': 'error', 'message': str}
+                - 过载: 429（积压超过高水位）或 503（队列已满），带 Retry-After 头
+                响应头 X-Queue-Depth 为当前积压深度，上游可据此主动降速
             """
             # 记录请求基本信息
             print(f"收到请求: {request.method} {request.url}")
@@ -43,43 +46,39 @@ class MessageRoutes:
                 data = request.get_json()
                 print("原始请求体:\n", request.get_data(as_text=True))
                 
-                # 验证必需字段
-                required_fields = ['sender_id', 'sender', 'chat_type', 'character', 
-                                'message_type', 'message_send_time','content']
-                for field in required_fields:
-                    if field not in data:
-                        return jsonify({
-                            'status': 'error',
-                            'message': f'缺少必需字段: {field}'
-                        }), 400
-                        
-                # 验证字段类型
-                if not isinstance(data['sender_id'], int):
-                    return jsonify({'status': 'error', 'message': 'sender_id必须为整数'}), 400
-                if not isinstance(data['sender'], str):
-                    return jsonify({'status': 'error', 'message': 'sender必须为字符串'}), 400
-                if data['chat_type'] != 'group' and data['chat_type'] != 'private':
-                    return jsonify({'status': 'error', 'message': 'chat_type必须为group或者private'}), 400
-                if not isinstance(data['character'], int):
-                    return jsonify({'status': 'error', 'message': 'character必须为整数'}), 400
-                if data['message_type'] != 'text':
-                    return jsonify({'status': 'error', 'message': 'message_type必须为text'}), 400
-                if data['content'] == '':
-                    return jsonify({'status': 'error', 'message':'content内容为空'}),400
+                # 验证必需字段与字段类型（与 socket 接口共用 TextMessage.validate）
+                error = TextMessage.validate(data)
+                if error is not None:
+                    return jsonify({'status': 'error', 'message': error}), 400
 
                 
             except Exception as e:
                 print(f"JSON解析错误: {str(e)}")
                 return jsonify({'status': 'error', 'message': '无效的JSON格式'}), 400
 
-            # 递交消息队列
+            # 递交消息队列（准入控制：积压过高时拒绝，让上游降速）
             text_message = TextMessage.from_dict(data)
-            GlobalVariable.to_message_get_queue.put(text_message)
+            admission = GlobalVariable.admission
+            if admission is None:
+                GlobalVariable.to_message_get_queue.put(text_message)
+                return jsonify({
+                    'status': 'ok',
+                    'message': '消息接收成功'
+                }), 200
 
-            return jsonify({
-                'status': 'ok',
-                'message': '消息接收成功'
-            }), 200
+            result, depth = admission.admit(text_message)
+            headers = {'X-Queue-Depth': str(depth)}
+            if result == ACCEPTED:
+                return jsonify({
+                    'status': 'ok',
+                    'message': '消息接收成功'
+                }), 200, headers
+
+            headers['Retry-After'] = str(admission.retry_after)
+            if result == QUEUE_FULL:
+                return jsonify({'status': 'error', 'message': '消息队列已满，请稍后重试'}), 503, headers
+            message = '服务繁忙，群聊消息已丢弃' if result == SHED else '服务繁忙，请稍后重试'
+            return jsonify({'status': 'error', 'message': message}), 429, headers
     
         @self.app.route('/message/image', methods=['POST'])
         def receive_image():
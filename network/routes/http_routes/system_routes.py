@@ -2,6 +2,8 @@ from flask import jsonify, request
 import psutil
 import time
 
+from globals.global_variable import GlobalVariable
+
 class SystemRoutes:
     def __init__(self, app):
         self.app = app
@@ -79,6 +81,112 @@ class SystemRoutes:
                     'message': str(e)
                 }), 500
 
+        # 准入控制统计
+        @self.app.route('/system_manager/admission_stats', methods=['GET'])
+        def admission_stats():
+            """获取 /message/text 准入控制统计
+            Returns:
+                - status: 状态，success 或 error
+                - message: 消息
+                - data: {'depth', 'high_watermark', 'low_watermark', 'policy', 'overloaded',
+                         'accepted', 'rejected', 'shed', 'queue_full', 'overload_events'}
+            """
+            if GlobalVariable.admission is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': '对话工作进程尚未启动'
+                }), 503
+            return jsonify({
+                'status': 'success',
+                'message': '获取准入控制统计成功',
+                'data': GlobalVariable.admission.stats()
+            }), 200
+
+        # 对话工作进程统计
+        @self.app.route('/system_manager/dialogue_stats', methods=['GET'])
+        def dialogue_stats():
+            """获取对话工作进程统计
+            Returns:
+                - status: 状态，success 或 error
+                - message: 消息
+                - data: {'worker_count': int, 'queue_size': int,
+                         'shards': [{'shard', 'depth', 'processed', 'failed', 'per_second',
+                                     'coalesced', 'saved_calls', 'retried', 'dead_lettered',
+                                     'cache_hits', 'cache_misses', 'breakers': {名称: closed / open / half_open},
+                                     'limiters': {名称: {'limit', 'inflight', 'queue_seconds': {count, p50, p90, p99, max}}},
+                                     'backends': {rag 后端: {'healthy', 'outstanding', 'requests', 'connections_opened',
+                                                            'latency': {count, p50, p90, p99, max}}}}],
+                         'classes': {类别: {'weight', 'pending', 'wait': {count, p50, p90, p99, max}}}（启用优先级调度时）}
+            """
+            if GlobalVariable.to_message_get_queue is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': '对话工作进程尚未启动'
+                }), 503
+            return jsonify({
+                'status': 'success',
+                'message': '获取对话统计成功',
+                'data': GlobalVariable.to_message_get_queue.stats()
+            }), 200
+
+        # 死信列表
+        @self.app.route('/system_manager/dead_letters', methods=['GET'])
+        def dead_letters():
+            """获取多次重试仍失败的消息
+            Query:
+                - limit: 返回条数，默认 100
+                - offset: 偏移量，默认 0
+            Returns:
+                - data: {'total': int, 'items': [{'id', 'message', 'error', 'attempts', 'failed_at'}]}
+            """
+            if GlobalVariable.dead_letters is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': '对话工作进程尚未启动'
+                }), 503
+            limit = request.args.get('limit', 100, type=int)
+            offset = request.args.get('offset', 0, type=int)
+            return jsonify({
+                'status': 'success',
+                'message': '获取死信列表成功',
+                'data': {
+                    'total': GlobalVariable.dead_letters.count(),
+                    'items': GlobalVariable.dead_letters.list(limit, offset)
+                }
+            }), 200
+
+        # 重新投递死信
+        @self.app.route('/system_manager/dead_letters/replay', methods=['POST'])
+        def replay_dead_letters():
+            """将死信重新放入对话队列
+            请求体(JSON，可选):
+                - ids: 需要重新投递的死信ID列表，不传时重新投递全部死信
+            Returns:
+                - data: {'replayed': int}
+            """
+            if GlobalVariable.dead_letters is None or GlobalVariable.to_message_get_queue is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': '对话工作进程尚未启动'
+                }), 503
+            ids = (request.get_json(silent=True) or {}).get('ids')
+            if ids is not None and not (isinstance(ids, list) and all(isinstance(i, int) for i in ids)):
+                return jsonify({'status': 'error', 'message': 'ids必须为整数列表'}), 400
+            messages = GlobalVariable.dead_letters.pop(ids)
+            replayed = 0
+            for message in messages:
+                try:
+                    GlobalVariable.to_message_get_queue.put(message, timeout=5)
+                    replayed += 1
+                except Exception as e:
+                    # 队列已满等原因投递失败，放回死信存储
+                    GlobalVariable.dead_letters.add(message, f"重新投递失败: {e}", 0)
+            return jsonify({
+                'status': 'success',
+                'message': f'已重新投递 {replayed} 条死信',
+                'data': {'replayed': replayed}
+            }), 200
+
         # # 检查更新 TODO： 此接口待项目完全重构后实现
         # @self.app.route('/system_manager/check_update',methods=['GET'])
 
@@ -1,36 +1,388 @@
 import asyncio
-from typing import Any, Dict, Optional
+import collections
+import json
+import logging
+import queue
+import struct
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from dispatch.admission import ACCEPTED, QUEUE_FULL, SHED
+from dispatch.reply_channel import parse_route, socket_route
+from globals.global_variable import GlobalVariable
+from models.message import TextMessage
+from utils.metrics import Metrics
 
 """Socket通信适配器
-    实现基于Socket的网络通信 
-    待实现
+    面向机器人客户端（微信、QQ 桥接程序）的长连接 TCP 服务，省去每条消息一次 HTTP 请求的开销与 MQTT 转发
+    帧格式: 长度(4B 大端，不含长度字段本身) | 类型(1B) | 请求ID(4B 大端) | 内容(JSON, utf-8)
+    - HELLO(0x01) 客户端 -> 服务端: {"client_id": str, "token": str}，连接后的第一帧
+      服务端回复 WELCOME(0x81): {"max_inflight": int, "max_batch": int, "max_frame_size": int}
+      同一 client_id 重新连接时替换旧连接，断线期间的回复缓存后补发
+    - MESSAGE(0x02) 客户端 -> 服务端: 一条消息（字段与 /message/text 相同）或消息数组（批量）
+      服务端按帧的先后处理，回复 RESULT(0x82)，请求ID与 MESSAGE 相同，results 与消息一一对应:
+      {"results": [{"status": "ok"} | {"status": "error", "code": 400/429/503, "message": str}], "queue_depth": int}
+      客户端不需要等待 RESULT 即可继续发送（流水线）
+    - REPLY(0x83) 服务端 -> 客户端: 对话回复，请求ID为消息所在 MESSAGE 帧的ID: {"sender_id": int, "reply": 回复}
+      回复内容与 MQTT 消息相同，流式回复时每句一帧；多次重试仍失败时 reply 为 {"status": "error", "message": str}
+    - PING(0x03) / PONG(0x84): 保活，idle_timeout 秒内没有收到任何帧时断开
+    - ERROR(0xFF) 服务端 -> 客户端: 协议错误 {"message": str}，之后断开连接
+    流量控制（每个客户端）：已接收但尚未回复的消息达到 max_inflight 时暂停读取该连接，客户端的发送被 TCP 窗口阻塞，
+    直到回复送出（或等待超过 reply_timeout）；待推送的帧超过 max_pending_replies 时断开不读取的慢客户端
 """
 
+logger = logging.getLogger("SocketAdapter")
+
+HELLO = 0x01
+MESSAGE = 0x02
+PING = 0x03
+WELCOME = 0x81
+RESULT = 0x82
+REPLY = 0x83
+PONG = 0x84
+ERROR = 0xFF
+
+_HEADER = struct.Struct('>IBI')  # 长度 | 类型 | 请求ID
+_HEAD_SIZE = _HEADER.size - 4  # 长度字段之后的帧头（类型 + 请求ID）
+
+
+class ProtocolError(Exception):
+    """客户端违反帧协议，发送 ERROR 后断开连接"""
+
+
+def encode_frame(kind: int, request_id: int, payload: Any = b'') -> bytes:
+    """编码一帧，payload 为 bytes 时原样发送，否则编码为 JSON"""
+    body = payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    return _HEADER.pack(len(body) + _HEAD_SIZE, kind, request_id) + body
+
+
+async def read_frame(reader: asyncio.StreamReader, max_frame_size: int) -> Tuple[int, int, bytes]:
+    """读取一帧，返回 (类型, 请求ID, 内容)"""
+    length, kind, request_id = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if length < _HEAD_SIZE or length - _HEAD_SIZE > max_frame_size:
+        raise ProtocolError(f"帧长度 {length} 超出限制 {max_frame_size}")
+    return kind, request_id, await reader.readexactly(length - _HEAD_SIZE)
+
+
+class _Connection:
+    """一个客户端连接：帧先进入发送队列，由写入协程批量写出"""
+
+    def __init__(self, client_id: str, writer: asyncio.StreamWriter, max_pending: int):
+        self.client_id = client_id
+        self.writer = writer
+        self.max_pending = max_pending
+        self.outbox: Deque[Tuple[bytes, List[int], bool]] = collections.deque()  # (帧, 确认ID, 是否为回复)
+        self.released = asyncio.Event()  # 在途消息减少时通知读取协程
+        self.closed = False
+        self._wakeup = asyncio.Event()
+
+    def send(self, frame: bytes, ack_ids: Optional[List[int]] = None, reply: bool = False) -> bool:
+        """放入发送队列，积压超过 max_pending 时返回 False"""
+        self.outbox.append((frame, ack_ids or [], reply))
+        self._wakeup.set()
+        return len(self.outbox) <= self.max_pending
+
+    async def write_loop(self, on_written) -> None:
+        """批量写出发送队列中的帧，写入成功后回调 on_written(确认ID)"""
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self.outbox and not self.closed:
+                    batch = [self.outbox.popleft() for _ in range(min(len(self.outbox), 256))]
+                    self.writer.writelines([frame for frame, _, _ in batch])
+                    await self.writer.drain()
+                    on_written([message_id for _, ack_ids, _ in batch for message_id in ack_ids])
+        except ConnectionError:
+            # 连接已断开，读取协程随之结束并注销连接
+            pass
+
+    def close(self) -> List[Tuple[bytes, List[int]]]:
+        """关闭连接，返回尚未写出的回复帧"""
+        self.closed = True
+        self._wakeup.set()
+        self.released.set()
+        if not self.writer.is_closing():
+            self.writer.close()
+        unsent = [(frame, ack_ids) for frame, ack_ids, reply in self.outbox if reply]
+        self.outbox.clear()
+        return unsent
+
+
 class SocketAdapter():
-   
-    
+    """Socket通信适配器
+
+    实现基于 asyncio 的长连接 TCP 服务，消息入队规则与 /message/text 接口相同，回复推送到同一连接
+    """
+
     def __init__(self, host: str = '127.0.0.1', port: int = 8000):
         """初始化Socket适配器
-        
+
         Args:
             host: 主机地址
-            port: 端口号
+            port: 端口号，0 为随机端口
         """
         self.host = host
         self.port = port
         self.server = None
-        self.clients = set()
+        self.clients: Dict[str, _Connection] = {}
         self.running = False
-        
+        self.auth_token = ""
+        self.max_frame_size = 1024 * 1024
+        self.max_batch = 100
+        self.max_inflight = 200
+        self.reply_timeout = 300
+        self.max_pending_replies = 10000
+        self.reply_buffer_size = 1000
+        self.idle_timeout = 120
+        self.ack_queue = None
+        self._inflight: Dict[str, Deque[float]] = collections.defaultdict(collections.deque)  # 客户端 -> 在途消息的截止时间
+        self._offline: Dict[str, Deque[Tuple[bytes, List[int]]]] = {}  # 客户端断线期间的回复
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handlers = set()  # 各连接的处理协程，关闭时等待其结束
+
+    async def start(self, setting: Optional[Dict[str, Any]] = None, reply_queue=None, ack_queue=None) -> None:
+        """启动服务
+
+        Args:
+            setting: socket_setting 配置
+            reply_queue: 工作进程发回的回复（见 dispatch.reply_channel）
+            ack_queue: 持久化队列的确认队列，回复写入连接后确认消息
+        """
+        setting = setting or {}
+        for key in ('auth_token', 'max_frame_size', 'max_batch', 'max_inflight', 'reply_timeout',
+                    'max_pending_replies', 'reply_buffer_size', 'idle_timeout'):
+            setattr(self, key, setting.get(key, getattr(self, key)))
+        self.ack_queue = ack_queue
+        self._loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.running = True
+        if reply_queue is not None:
+            threading.Thread(target=self._read_replies, args=(reply_queue,), name="socket-replies", daemon=True).start()
+        logger.info(f"Socket 服务监听 {self.host}:{self.port}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = None
+        writing = None
+        self._handlers.add(asyncio.current_task())
+        try:
+            kind, request_id, payload = await asyncio.wait_for(read_frame(reader, self.max_frame_size), self.idle_timeout)
+            hello = self._decode(payload) if kind == HELLO else None
+            if not isinstance(hello, dict) or not hello.get('client_id'):
+                raise ProtocolError("连接后的第一帧必须为 HELLO，且包含 client_id")
+            if self.auth_token and hello.get('token') != self.auth_token:
+                raise ProtocolError("token 无效")
+            writer.transport.set_write_buffer_limits(high=self.max_frame_size)
+            connection = self._register(str(hello['client_id']), writer)
+            writing = asyncio.create_task(connection.write_loop(self._written))
+            connection.send(encode_frame(WELCOME, request_id, {
+                'max_inflight': self.max_inflight, 'max_batch': self.max_batch, 'max_frame_size': self.max_frame_size,
+            }))
+            # 补发断线期间的回复
+            for frame, ack_ids in self._offline.pop(connection.client_id, ()):
+                connection.send(frame, ack_ids, reply=True)
+            while self.running and not connection.closed:
+                await self._wait_capacity(connection)
+                kind, request_id, payload = await asyncio.wait_for(read_frame(reader, self.max_frame_size), self.idle_timeout)
+                if kind == MESSAGE:
+                    result = await self._submit(connection.client_id, request_id, payload)
+                    connection.send(encode_frame(RESULT, request_id, result))
+                elif kind == PING:
+                    connection.send(encode_frame(PONG, request_id))
+                else:
+                    raise ProtocolError(f"未知的帧类型: {kind}")
+        except ProtocolError as e:
+            logger.warning(f"Socket 客户端协议错误: {e}")
+            Metrics.incr('socket.protocol_error')
+            if not writer.is_closing():
+                writer.write(encode_frame(ERROR, 0, {'message': str(e)}))
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self._handlers.discard(asyncio.current_task())
+            if writing is not None:
+                writing.cancel()
+            if connection is not None:
+                self._unregister(connection)
+            elif not writer.is_closing():
+                writer.close()
+
+    def _register(self, client_id: str, writer: asyncio.StreamWriter) -> _Connection:
+        """登记连接，替换同一客户端的旧连接"""
+        previous = self.clients.get(client_id)
+        if previous is not None:
+            self._unregister(previous)
+        connection = _Connection(client_id, writer, self.max_pending_replies)
+        self.clients[client_id] = connection
+        Metrics.gauge('socket.clients', len(self.clients))
+        return connection
+
+    def _unregister(self, connection: _Connection) -> None:
+        """关闭连接，尚未写出的回复留待重新连接后补发"""
+        for frame, ack_ids in connection.close():
+            self._buffer(connection.client_id, frame, ack_ids)
+        if self.clients.get(connection.client_id) is connection:
+            del self.clients[connection.client_id]
+        Metrics.gauge('socket.clients', len(self.clients))
+
+    def _buffer(self, client_id: str, frame: bytes, ack_ids: List[int]) -> None:
+        """缓存断线客户端的回复，超过 reply_buffer_size 时丢弃最早的（持久化队列中未确认的消息重启后重放）"""
+        buffer = self._offline.setdefault(client_id, collections.deque())
+        buffer.append((frame, ack_ids))
+        if len(buffer) > self.reply_buffer_size:
+            buffer.popleft()
+            Metrics.incr('socket.reply_dropped')
+
+    async def _wait_capacity(self, connection: _Connection) -> None:
+        """在途消息达到 max_inflight 时暂停读取，直到有回复送出或在途消息超时"""
+        while self._pending(connection.client_id) >= self.max_inflight and not connection.closed:
+            connection.released.clear()
+            try:
+                await asyncio.wait_for(connection.released.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+
+    def _pending(self, client_id: str) -> int:
+        """客户端的在途消息数，超过 reply_timeout 仍未回复的不再计入"""
+        pending = self._inflight[client_id]
+        now = time.monotonic()
+        while pending and pending[0] < now:
+            pending.popleft()
+            Metrics.incr('socket.reply_timeout')
+        return len(pending)
+
+    def _release(self, client_id: str, count: int) -> None:
+        pending = self._inflight[client_id]
+        for _ in range(min(count, len(pending))):
+            pending.popleft()
+        connection = self.clients.get(client_id)
+        if connection is not None:
+            connection.released.set()
+
+    async def _submit(self, client_id: str, request_id: int, payload: bytes) -> Dict[str, Any]:
+        """校验并入队一个 MESSAGE 帧中的消息，返回 RESULT 内容"""
+        data = self._decode(payload)
+        items = data if isinstance(data, list) else [data]
+        if len(items) > self.max_batch:
+            raise ProtocolError(f"单帧最多 {self.max_batch} 条消息")
+        results: List[Optional[Dict[str, Any]]] = []
+        messages = []
+        for item in items:
+            error = TextMessage.validate(item)
+            if error is not None:
+                results.append({'status': 'error', 'code': 400, 'message': error})
+                continue
+            message = TextMessage.from_dict(item)
+            message.reply_to = socket_route(client_id, request_id)
+            messages.append(message)
+            results.append(None)
+        # 先占用在途配额：入队后回复可能比这里更早返回
+        deadline = time.monotonic() + self.reply_timeout
+        self._inflight[client_id].extend([deadline] * len(messages))
+        # 持久化队列入队需要等待日志提交，放在线程中执行，不阻塞其他连接
+        admitted, depth = await asyncio.get_running_loop().run_in_executor(None, self._admit, messages)
+        admitted = iter(admitted)
+        rejected = 0
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = next(admitted)
+                rejected += results[index]['status'] != 'ok'
+        self._release(client_id, rejected)
+        Metrics.incr('socket.messages', len(messages) - rejected)
+        if rejected:
+            Metrics.incr('socket.rejected', rejected)
+        return {'results': results, 'queue_depth': depth}
+
+    def _admit(self, messages: List[TextMessage]) -> Tuple[List[Dict[str, Any]], int]:
+        """递交消息队列（准入控制：积压过高时拒绝，让客户端降速）"""
+        admission = GlobalVariable.admission
+        results = []
+        depth = 0
+        for message in messages:
+            try:
+                if admission is None:
+                    GlobalVariable.to_message_get_queue.put(message)
+                    results.append({'status': 'ok'})
+                    continue
+                result, depth = admission.admit(message)
+            except Exception as e:
+                # 单条消息入队失败（如写入持久化日志出错）不影响同一帧中的其他消息，调用方归还其在途配额
+                logger.error(f"消息入队失败: {e}", exc_info=True)
+                results.append({'status': 'error', 'code': 500, 'message': '消息入队失败'})
+                continue
+            if result == ACCEPTED:
+                results.append({'status': 'ok'})
+            elif result == QUEUE_FULL:
+                results.append({'status': 'error', 'code': 503, 'message': '消息队列已满，请稍后重试',
+                                'retry_after': admission.retry_after})
+            else:
+                results.append({'status': 'error', 'code': 429, 'retry_after': admission.retry_after,
+                                'message': '服务繁忙，群聊消息已丢弃' if result == SHED else '服务繁忙，请稍后重试'})
+        return results, depth
+
+    def _decode(self, payload: bytes) -> Any:
+        try:
+            return json.loads(payload)
+        except ValueError:
+            raise ProtocolError("帧内容不是有效的JSON")
+
+    def _read_replies(self, reply_queue) -> None:
+        """读取线程：把工作进程发回的回复成批交给事件循环推送"""
+        while self.running:
+            try:
+                items = [reply_queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            try:
+                while len(items) < 256:
+                    items.append(reply_queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self._loop.call_soon_threadsafe(self._deliver, items)
+            except RuntimeError:
+                # 事件循环已关闭
+                return
+
+    def _deliver(self, items) -> None:
+        """推送回复：客户端在线时写入其连接，否则缓存到重新连接"""
+        for reply_to, sender_id, payload, final, ack_ids, count in items:
+            route = parse_route(reply_to)
+            if route is None:
+                continue
+            client_id, request_id = route
+            frame = encode_frame(REPLY, request_id,
+                                 f'{{"sender_id": {json.dumps(sender_id)}, "reply": {payload}}}'.encode('utf-8'))
+            if final:
+                self._release(client_id, count)
+            Metrics.incr('socket.replies')
+            connection = self.clients.get(client_id)
+            if connection is None:
+                self._buffer(client_id, frame, ack_ids)
+            elif not connection.send(frame, ack_ids, reply=True):
+                logger.warning(f"Socket 客户端 {client_id} 待推送的回复超过 {self.max_pending_replies} 帧，断开连接")
+                Metrics.incr('socket.slow_client')
+                self._unregister(connection)
+
+    def _written(self, ack_ids: List[int]) -> None:
+        """回复已写入连接，确认持久化队列中的消息"""
+        if ack_ids and self.ack_queue is not None:
+            self.ack_queue.put(ack_ids)
+
     async def close(self) -> None:
         """关闭Socket服务器"""
         self.running = False
         if self.server:
             self.server.close()
             self.server = None
-            
-        # 关闭所有客户端连接
-        for client in self.clients:
-            if not client.is_closing():
-                client.close()
+
+        # 关闭所有客户端连接，等待各连接的处理协程结束
+        for connection in list(self.clients.values()):
+            self._unregister(connection)
         self.clients.clear()
+        if self._handlers:
+            await asyncio.wait(list(self._handlers), timeout=1)
@@ -0,0 +1,250 @@
+"""HTTP 服务：
+    Flask 自带的开发服务器（app.run）不适合并发负载，也无法从外部停止
+    - waitress: 生产级 WSGI 服务，固定数量的线程处理请求，单独的 I/O 循环管理连接（需要 pip install waitress）
+    - threaded: werkzeug 多线程服务，每个连接一个线程，waitress 未安装时使用
+    两者都支持 HTTP/1.1 长连接，空闲超过 keep_alive_timeout 的连接被关闭
+    优雅停止：先停止接收新连接、关闭空闲连接，等待进行中的请求完成（最多 shutdown_timeout 秒）后再关闭
+    消息接收接口只做校验与入队，实际处理在对话工作进程中，因此使用多线程而不是多进程：
+    入队依赖主进程内的调度器、持久化队列与准入控制状态，多个 HTTP 进程无法共享
+"""
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger("WsgiServer")
+
+
+class _InflightCounter:
+    """统计进行中的请求数（响应体发送完毕才算结束），用于优雅停止"""
+
+    def __init__(self, app):
+        self.app = app
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.inflight += 1
+            Metrics.gauge('http.inflight', self.inflight)
+        try:
+            body = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return _ClosingIterator(body, self._done)
+
+    def _done(self) -> None:
+        with self._lock:
+            self.inflight -= 1
+            Metrics.gauge('http.inflight', self.inflight)
+            if self.inflight == 0:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout: float) -> bool:
+        """等待所有进行中的请求完成，超时返回 False"""
+        with self._lock:
+            return self._idle.wait_for(lambda: self.inflight == 0, timeout)
+
+
+class _ClosingIterator:
+    """响应体迭代完毕（服务调用 close）时回调"""
+
+    def __init__(self, body, on_close):
+        self._body = body
+        self._iterator = iter(body)
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._on_close()
+
+
+class WsgiServer(ABC):
+    """WSGI 服务的公共部分：serve_forever 阻塞运行，shutdown 在其他线程中优雅停止"""
+
+    def __init__(self, app, host: str, port: int, threads: int = 16, connection_limit: int = 1000,
+                 keep_alive_timeout: float = 60, shutdown_timeout: float = 10):
+        """
+        Args:
+            app: WSGI 应用
+            host: 监听地址
+            port: 监听端口，0 为随机端口
+            threads: 处理请求的线程数（threaded 模式下每个连接一个线程，不使用该参数）
+            connection_limit: 同时保持的最大连接数（仅 waitress）
+            keep_alive_timeout: 空闲长连接保持时间（秒）
+            shutdown_timeout: 优雅停止时等待进行中请求的最长时间（秒）
+        """
+        self.counter = _InflightCounter(app)
+        self.host = host
+        self.port = port
+        self.threads = int(threads)
+        self.connection_limit = int(connection_limit)
+        self.keep_alive_timeout = float(keep_alive_timeout)
+        self.shutdown_timeout = float(shutdown_timeout)
+        self._stopped = threading.Event()
+
+    @property
+    def inflight(self) -> int:
+        return self.counter.inflight
+
+    @abstractmethod
+    def serve_forever(self) -> None:
+        """阻塞运行，直到 shutdown 完成"""
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """停止接收新连接，等待进行中的请求完成后关闭；全部请求在 timeout 内完成时返回 True"""
+        timeout = self.shutdown_timeout if timeout is None else timeout
+        start = time.monotonic()
+        self._stop_accepting()
+        drained = self.counter.wait_idle(timeout)
+        if not drained:
+            logger.warning(f"HTTP 服务停止时仍有 {self.inflight} 个请求未完成（已等待 {timeout} 秒）")
+        self._close()
+        self._stopped.set()
+        logger.info(f"HTTP 服务已停止，耗时 {time.monotonic() - start:.2f} 秒")
+        return drained
+
+    @abstractmethod
+    def _stop_accepting(self) -> None:
+        """停止接收新连接并关闭空闲连接，返回时已生效"""
+
+    @abstractmethod
+    def _close(self) -> None:
+        """关闭所有连接与处理线程"""
+
+
+class WaitressServer(WsgiServer):
+    """waitress 没有公开的优雅停止接口（close() 只关闭监听套接字，已建立的连接仍留在 I/O 循环中），
+    停止时使用了 waitress 内部的 accepting / del_channel / active_channels / _map / trigger / task_dispatcher，
+    按 requirements.txt 中固定的 waitress==3.0.2 实现，升级 waitress 时需要同步检查
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._serving = threading.Event()
+        from waitress.server import create_server
+        self._server = create_server(
+            self.counter, host=self.host, port=self.port,
+            threads=self.threads,
+            connection_limit=self.connection_limit,
+            channel_timeout=self.keep_alive_timeout,
+            ident='KouriChat',
+        )
+        self.port = self._server.effective_port
+
+    def serve_forever(self) -> None:
+        logger.info(f"HTTP 服务（waitress）监听 {self.host}:{self.port}，{self.threads} 个线程")
+        self._serving.set()
+        try:
+            self._server.run()
+        except (OSError, ValueError):
+            # 停止时 I/O 循环中的套接字被关闭
+            if not self._stopped.is_set():
+                raise
+        finally:
+            self._serving.clear()
+
+    def _in_loop(self, func) -> None:
+        """在 I/O 循环线程中执行 func 并等待其完成（I/O 循环未运行时直接执行）"""
+        if not self._serving.is_set():
+            func()
+            return
+        done = threading.Event()
+
+        def thunk():
+            try:
+                func()
+            finally:
+                done.set()
+        self._server.trigger.pull_trigger(thunk)
+        if not done.wait(self.shutdown_timeout):
+            logger.warning(f"HTTP 服务的 I/O 循环 {self.shutdown_timeout} 秒内未响应停止请求")
+
+    def _stop_accepting(self) -> None:
+        def stop():
+            # 关闭监听套接字，空闲的长连接发送完毕后关闭
+            self._server.accepting = False
+            self._server.del_channel()
+            self._server.socket.close()
+            for channel in list(self._server.active_channels.values()):
+                if not channel.requests:
+                    channel.will_close = True
+        self._in_loop(stop)
+
+    def _close(self) -> None:
+        def close():
+            for channel in list(self._server._map.values()):
+                channel.handle_close()
+        self._in_loop(close)
+        self._server.task_dispatcher.shutdown(timeout=1)
+
+
+class ThreadedServer(WsgiServer):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep_alive_timeout = self.keep_alive_timeout
+
+        class Handler(WSGIRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            timeout = keep_alive_timeout  # 空闲连接读超时后关闭
+
+            def log_request(self, *args, **kwargs):
+                # 默认每个请求输出一行访问日志，高并发时占用大量时间
+                pass
+
+        self._server = ThreadedWSGIServer(self.host, self.port, self.counter, handler=Handler)
+        self.port = self._server.server_address[1]
+
+    def serve_forever(self) -> None:
+        logger.info(f"HTTP 服务（werkzeug 多线程）监听 {self.host}:{self.port}")
+        self._server.serve_forever()
+
+    def _stop_accepting(self) -> None:
+        self._server.shutdown()
+
+    def _close(self) -> None:
+        self._server.server_close()
+
+
+def waitress_available() -> bool:
+    try:
+        import waitress  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_wsgi_server(app, host: str, port: int, setting: Optional[Dict[str, Any]] = None) -> WsgiServer:
+    """根据 http_setting 创建 HTTP 服务，server 为 waitress 但未安装时回退为 threaded"""
+    setting = setting or {}
+    kind = setting.get('server', 'waitress')
+    if kind not in ('waitress', 'threaded'):
+        raise ValueError(f"未知的 HTTP 服务类型: {kind}")
+    if kind == 'waitress' and not waitress_available():
+        logger.warning("未安装 waitress（pip install waitress），HTTP 服务回退为 werkzeug 多线程模式")
+        kind = 'threaded'
+    server_class = WaitressServer if kind == 'waitress' else ThreadedServer
+    return server_class(
+        app, host, port,
+        threads=setting.get('threads', 16),
+        connection_limit=setting.get('connection_limit', 1000),
+        keep_alive_timeout=setting.get('keep_alive_timeout', 60),
+        shutdown_timeout=setting.get('shutdown_timeout', 10),
+    )
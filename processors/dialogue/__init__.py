@@ -1,2 +1,11 @@
 from .dialogue import dialogueProcessor
-__all__ = ["dialogueProcessor"]
\ No newline at end of file
+from .async_engine import AsyncDialogueEngine
+from .coalescer import CoalescingQueue, MessageCoalescer
+from .answer_cache import AnswerCache
+from .context_store import MemoryContextStore, SQLiteContextStore, create_context_store
+from .conversation_pool import ConversationPool
+from .reply_stream import ReplyStream, SentenceSplitter
+from .llm_router import LlmFastPath, LlmRouter
+__all__ = ["dialogueProcessor", "AsyncDialogueEngine", "CoalescingQueue", "MessageCoalescer",
+           "MemoryContextStore", "SQLiteContextStore", "create_context_store", "ConversationPool",
+           "AnswerCache", "ReplyStream", "SentenceSplitter", "LlmFastPath", "LlmRouter"]
@@ -0,0 +1,102 @@
+"""回复缓存：
+    大量用户发送相同的问候或常见问题（"你好"、"在吗"、"你是谁"），每条都是一次完整的 conversation_chat 请求（默认开启网络搜索）
+    开启后对短消息按 (角色, 归一化文本) 缓存 rag 回复，命中时直接发送缓存的回复，不再创建对话或请求 rag
+    - 归一化: NFKC、转小写、去掉空白/标点/符号，"你好！"、"你好~"、"你 好" 视为同一问题
+    - 只缓存归一化后不超过 max_length 的消息，长消息几乎不会重复，且更依赖对话上下文
+    - 条目超过 ttl 后失效，超过容量时淘汰最久未使用的条目
+    - 可按角色关闭（需要结合记忆或人设变化回答的角色）
+    缓存位于每个对话工作进程内，命中的回复不会写入该用户的 rag 对话记录
+"""
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+from utils.metrics import Metrics
+
+
+def normalize(text: str) -> str:
+    """归一化消息文本，去掉不影响语义的差异"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return ''.join(ch for ch in text if unicodedata.category(ch)[0] not in ('P', 'S', 'Z', 'C'))
+
+
+def cacheable(status_code: int, reply: Any) -> bool:
+    """只缓存成功的 rag 回复：HTTP 2xx，且回复体中的 code（有该字段时）为 200 或 0
+
+    rag 过载时返回的 5xx / 429 错误回复不能缓存，否则在 ttl 内会发给所有发送相同消息的用户
+    """
+    if not 200 <= status_code < 300 or not isinstance(reply, dict):
+        return False
+    return reply.get('code', 200) in (200, 0)
+
+
+class AnswerCache:
+    """(角色, 归一化文本) -> rag 回复 的 TTL + LRU 缓存（线程安全）"""
+
+    def __init__(self, ttl: float = 3600, capacity: int = 1000, max_length: int = 20,
+                 exclude_characters: Iterable[int] = (), clock=time.monotonic):
+        """
+        Args:
+            ttl: 缓存有效期（秒）
+            capacity: 最多缓存的回复数量
+            max_length: 只缓存归一化后不超过该长度的消息
+            exclude_characters: 不使用缓存的角色ID
+        """
+        self.ttl = float(ttl)
+        self.capacity = max(1, int(capacity))
+        self.max_length = max(1, int(max_length))
+        self.exclude_characters = set(exclude_characters or ())
+        self.clock = clock
+        self._items: OrderedDict = OrderedDict()  # key -> (过期时间, 回复)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_setting(cls, setting: dict) -> Optional['AnswerCache']:
+        """根据 dialogue_setting 创建，未开启 answer_cache 时返回 None"""
+        if not setting.get('answer_cache', False):
+            return None
+        return cls(
+            ttl=setting.get('answer_cache_ttl', 3600),
+            capacity=setting.get('answer_cache_size', 1000),
+            max_length=setting.get('answer_cache_max_length', 20),
+            exclude_characters=setting.get('answer_cache_exclude_characters') or (),
+        )
+
+    def key(self, character: int, content: str) -> Optional[Tuple[int, str]]:
+        """消息的缓存键，不可缓存（角色已关闭、文本过长或为空）时返回 None"""
+        if character in self.exclude_characters:
+            return None
+        text = normalize(content)
+        if not text or len(text) > self.max_length:
+            return None
+        return character, text
+
+    def get(self, key: Optional[Tuple[int, str]]) -> Optional[Any]:
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._items[key]
+                Metrics.incr('answer_cache.expired')
+                entry = None
+            if entry is not None:
+                self._items.move_to_end(key)
+        Metrics.incr('answer_cache.hit' if entry is not None else 'answer_cache.miss')
+        return None if entry is None else entry[1]
+
+    def set(self, key: Optional[Tuple[int, str]], reply: Any) -> None:
+        if key is None or reply is None:
+            return
+        with self._lock:
+            self._items[key] = (self.clock() + self.ttl, reply)
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+                Metrics.incr('answer_cache.evicted')
+            Metrics.gauge('answer_cache.size', len(self._items))
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,117 @@
+"""异步对话引擎：
+    在单个对话工作进程内同时处理多个会话
+    - 读取线程从分片队列取消息，交给事件循环
+    - 同一 sender_id 的消息按到达顺序逐条处理（每个发送者同一时刻最多一个请求）
+    - 不同发送者并发处理，同时进行的 rag 请求数由信号量限制为 max_concurrency
+    - 进程内最多持有 max_pending 条未完成的消息，超出时停止读取队列，积压留在分片队列中
+"""
+import asyncio
+import logging
+import queue
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger("AsyncDialogueEngine")
+
+
+class AsyncDialogueEngine:
+
+    def __init__(self, processor, message_queue, max_concurrency: int = 100,
+                 max_pending: Optional[int] = None, shard_id: int = 0, on_failure=None):
+        """
+        Args:
+            processor: 对话处理器，需实现 async_processMessage
+            message_queue: 当前工作进程消费的分片队列
+            max_concurrency: 同时进行的 rag 请求上限
+            max_pending: 进程内未完成消息的上限，默认为 max_concurrency 的 4 倍
+            shard_id: 分片编号，仅用于日志
+            on_failure: 可选，消息处理失败时调用 on_failure(message, error)，用于安排重试
+        """
+        self.processor = processor
+        self.message_queue = message_queue
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_pending = max_pending or self.max_concurrency * 4
+        self.shard_id = shard_id
+        self.on_failure = on_failure
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending: Dict[Any, Deque] = {}  # sender -> 待处理消息
+        self._tasks: Dict[Any, asyncio.Task] = {}  # sender -> 正在处理该发送者消息的任务
+        self._in_flight = 0
+        self._stopping = threading.Event()
+
+    def run(self) -> None:
+        """阻塞运行，直到调用 stop() 且已读取的消息全部处理完成"""
+        asyncio.run(self._main())
+
+    def stop(self) -> None:
+        """停止读取队列（线程安全）"""
+        self._stopping.set()
+
+    async def _main(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        reader = threading.Thread(target=self._reader, name=f"dialogue-reader-{self.shard_id}", daemon=True)
+        reader.start()
+        logger.info(f"[worker-{self.shard_id}] 异步对话引擎已启动，最大并发 {self.max_concurrency}")
+        await self.loop.run_in_executor(None, reader.join)
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values())
+
+    def _reader(self) -> None:
+        """读取线程：阻塞读取分片队列，并把消息投递到事件循环"""
+        while not self._stopping.is_set():
+            self._slots.acquire()
+            try:
+                message = self.message_queue.get(timeout=Metrics.flush_interval)
+            except queue.Empty:
+                self._slots.release()
+                Metrics.flush()
+                continue
+            self.loop.call_soon_threadsafe(self._dispatch, message)
+            Metrics.maybe_flush()
+
+    def _dispatch(self, message) -> None:
+        """按发送者排队，发送者没有正在运行的任务时启动一个"""
+        sender = getattr(message, 'sender_id', None)
+        self._pending.setdefault(sender, deque()).append(message)
+        if sender not in self._tasks:
+            self._tasks[sender] = self.loop.create_task(self._drain(sender))
+
+    async def _drain(self, sender) -> None:
+        """依次处理同一发送者的消息，保证单个用户的回复顺序"""
+        pending = self._pending[sender]
+        try:
+            while pending:
+                message = pending.popleft()
+                try:
+                    async with self._semaphore:
+                        self._in_flight += 1
+                        Metrics.gauge('dialogue.in_flight', self._in_flight)
+                        try:
+                            await self.processor.async_processMessage(message)
+                        except Exception as e:
+                            logger.error(f"[worker-{self.shard_id}] 消息处理失败: {e}", exc_info=True)
+                            Metrics.incr('dialogue.failed')
+                            if self.on_failure is not None:
+                                try:
+                                    self.on_failure(message, e)
+                                except Exception as retry_error:
+                                    # 重试记录失败不能结束该发送者的处理任务
+                                    logger.error(f"[worker-{self.shard_id}] 安排重试失败: {retry_error}", exc_info=True)
+                        finally:
+                            self._in_flight -= 1
+                            Metrics.gauge('dialogue.in_flight', self._in_flight)
+                    Metrics.mark('dialogue.throughput')
+                finally:
+                    self._slots.release()
+        finally:
+            # 任务被取消时，该发送者尚未处理的消息也要归还名额，否则读取线程最终阻塞在 acquire
+            for _ in pending:
+                self._slots.release()
+            del self._pending[sender]
+            del self._tasks[sender]
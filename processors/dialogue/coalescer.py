@@ -0,0 +1,145 @@
+"""连发消息合并：
+    用户经常在几秒内连续发送多条短消息，逐条请求 rag 既浪费调用，又可能出现回复顺序错乱
+    在 processMessage 之前按 sender_id 做防抖：
+    - 同一发送者的 text 消息在 window 秒内持续到达时先暂存，安静 window 秒后合并为一条
+    - 从第一条开始最多等待 max_wait 秒，或累计 max_messages 条时立即合并，避免一直等待
+    - 非 text 消息不合并，并且会先放出同一发送者已暂存的消息，保证顺序
+"""
+import dataclasses
+import queue
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from models.message import TextMessage
+from utils.metrics import Metrics
+
+
+class _Burst:
+    __slots__ = ('messages', 'first', 'last')
+
+    def __init__(self, message: TextMessage, now: float):
+        self.messages = [message]
+        self.first = now
+        self.last = now
+
+
+class MessageCoalescer:
+    """按发送者合并连发消息（不涉及队列，时间由调用方传入）"""
+
+    def __init__(self, window: float = 0.8, max_wait: float = 3.0, max_messages: int = 10, separator: str = "\n"):
+        """
+        Args:
+            window: 防抖窗口（秒），同一发送者两条消息间隔小于该值时合并
+            max_wait: 从第一条消息开始最多等待的时间（秒）
+            max_messages: 单次合并的最多消息条数
+            separator: 合并时消息内容之间的分隔符
+        """
+        self.window = window
+        self.max_wait = max(window, max_wait)
+        self.max_messages = max(1, int(max_messages))
+        self.separator = separator
+        self._bursts: Dict[Any, _Burst] = {}
+
+    def add(self, message: Any, now: float) -> List[Any]:
+        """加入一条消息，返回需要立即处理的消息"""
+        if not isinstance(message, TextMessage) or message.message_type != "text":
+            # 非文本消息直接放行，先放出该发送者暂存的文本，保持顺序
+            burst = self._bursts.pop(getattr(message, 'sender_id', None), None)
+            return ([self._merge(burst)] if burst else []) + [message]
+
+        burst = self._bursts.get(message.sender_id)
+        if burst is None:
+            self._bursts[message.sender_id] = _Burst(message, now)
+        else:
+            burst.messages.append(message)
+            burst.last = now
+        if len(self._bursts[message.sender_id].messages) >= self.max_messages:
+            return [self._merge(self._bursts.pop(message.sender_id))]
+        return []
+
+    def _deadline(self, burst: _Burst) -> float:
+        return min(burst.last + self.window, burst.first + self.max_wait)
+
+    def next_deadline(self) -> Optional[float]:
+        """最早需要放出的时间点，没有暂存消息时返回 None"""
+        if not self._bursts:
+            return None
+        return min(self._deadline(burst) for burst in self._bursts.values())
+
+    def pop_due(self, now: float) -> List[TextMessage]:
+        """放出已经到期的合并消息"""
+        due = [sender for sender, burst in self._bursts.items() if self._deadline(burst) <= now]
+        return [self._merge(self._bursts.pop(sender)) for sender in due]
+
+    def pop_all(self) -> List[TextMessage]:
+        """放出全部暂存消息（退出时调用）"""
+        merged = [self._merge(burst) for burst in self._bursts.values()]
+        self._bursts.clear()
+        return merged
+
+    def pending(self) -> int:
+        return sum(len(burst.messages) for burst in self._bursts.values())
+
+    def _merge(self, burst: _Burst) -> TextMessage:
+        messages = burst.messages
+        if len(messages) == 1:
+            return messages[0]
+        Metrics.incr('coalesce.merged')  # 合并产生的请求数
+        Metrics.incr('coalesce.saved_calls', len(messages) - 1)  # 节省的 rag 调用数
+        merged = dataclasses.replace(
+            messages[-1],
+            content=self.separator.join(message.content for message in messages),
+        )
+        # 持久化队列：合并后的回复送达时，被合并的每条消息都需要确认
+        merged.ack_ids = [message_id for message in messages
+                          for message_id in (getattr(message, 'ack_ids', None) or [message.message_id])
+                          if message_id is not None]
+        # socket 客户端：合并后的一条回复归还所有被合并消息占用的在途配额
+        merged.merged_count = sum(getattr(message, 'merged_count', 1) for message in messages)
+        return merged
+
+
+class CoalescingQueue:
+    """在分片队列外包一层合并逻辑，对消费者仍表现为 get(timeout) 接口"""
+
+    def __init__(self, source, coalescer: MessageCoalescer, clock=time.monotonic):
+        self.source = source
+        self.coalescer = coalescer
+        self.clock = clock
+        self._ready = deque()
+
+    @classmethod
+    def wrap(cls, source, setting: dict):
+        """根据 dialogue_setting 包装队列，window 为 0 时不合并，直接返回原队列"""
+        window = float(setting.get('coalesce_window', 0) or 0)
+        if window <= 0:
+            return source
+        return cls(source, MessageCoalescer(
+            window=window,
+            max_wait=float(setting.get('coalesce_max_wait', 3)),
+            max_messages=int(setting.get('coalesce_max_messages', 10)),
+        ))
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        """取出下一条（可能已合并的）消息，timeout 内没有可处理的消息时抛出 queue.Empty"""
+        now = self.clock()
+        deadline = None if timeout is None else now + timeout
+        while True:
+            self._ready.extend(self.coalescer.pop_due(now))
+            if self._ready:
+                return self._ready.popleft()
+            if deadline is not None and now >= deadline or not block:
+                raise queue.Empty
+            wake = self.coalescer.next_deadline()
+            if deadline is not None:
+                wake = deadline if wake is None else min(wake, deadline)
+            try:
+                message = self.source.get(timeout=None if wake is None else max(wake - now, 0.001))
+                self._ready.extend(self.coalescer.add(message, self.clock()))
+            except queue.Empty:
+                pass
+            now = self.clock()
+
+    def qsize(self) -> int:
+        return self.source.qsize() + self.coalescer.pending() + len(self._ready)
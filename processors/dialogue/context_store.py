@@ -0,0 +1,173 @@
+"""会话映射存储：
+    sender_id -> (rag 对话ID, 对话所在的 rag 后端) 的映射，替代类级别的 dict（无限增长、重启丢失、进程间不共享）
+    - MemoryContextStore: 进程内 LRU，超过容量时淘汰最久未使用的映射
+    - SQLiteContextStore: LRU + SQLite，命中 LRU 时为微秒级字典查找，未命中时查询本地数据库
+      映射在重启后保留，多个对话工作进程通过 SQLite（WAL 模式）共享
+    同一 sender_id 的消息总是路由到同一个工作进程，进程内 LRU 不会读到其他进程修改前的旧值
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from utils.metrics import Metrics
+
+
+Route = Tuple[int, Optional[str]]  # (对话ID, 后端名称)
+
+
+class MemoryContextStore:
+    """进程内 LRU 映射，接口与 dict 一致（in / [] / get / pop，值为对话ID），get_route 同时返回后端"""
+
+    def __init__(self, capacity: int = 10000):
+        """
+        Args:
+            capacity: 最多保留的映射数量，<= 0 表示不限制
+        """
+        self.capacity = max(0, int(capacity))
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(sender_id: Any) -> str:
+        return str(sender_id)
+
+    def _cache_get(self, key: str) -> Optional[Route]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def _cache_set(self, key: str, value: Route) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if self.capacity and len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def _cache_pop(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def get_route(self, sender_id: Any) -> Optional[Route]:
+        """返回 (对话ID, 后端名称)，没有映射时返回 None"""
+        route = self._cache_get(self._key(sender_id))
+        Metrics.incr('context.hit' if route is not None else 'context.miss')
+        return route
+
+    def get(self, sender_id: Any, default: Optional[int] = None) -> Optional[int]:
+        route = self.get_route(sender_id)
+        return default if route is None else route[0]
+
+    def set(self, sender_id: Any, conversation_id: int, backend: Optional[str] = None) -> None:
+        self._cache_set(self._key(sender_id), (conversation_id, backend))
+
+    def pop(self, sender_id: Any, default: Optional[int] = None) -> Optional[int]:
+        value = self.get(sender_id)
+        self._cache_pop(self._key(sender_id))
+        return default if value is None else value
+
+    def __contains__(self, sender_id: Any) -> bool:
+        return self.get(sender_id) is not None
+
+    def __getitem__(self, sender_id: Any) -> int:
+        value = self.get(sender_id)
+        if value is None:
+            raise KeyError(sender_id)
+        return value
+
+    def __setitem__(self, sender_id: Any, conversation_id: int) -> None:
+        self.set(sender_id, conversation_id)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SQLiteContextStore(MemoryContextStore):
+    """LRU + SQLite 的持久化映射，LRU 只作为缓存，数据以 SQLite 为准"""
+
+    def __init__(self, path: str, capacity: int = 10000):
+        """
+        Args:
+            path: 数据库文件路径
+            capacity: 进程内 LRU 缓存容量
+        """
+        super().__init__(capacity)
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """按进程打开连接，fork 出的子进程不能复用父进程的连接（调用方需持有 _db_lock）"""
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS conversations (sender_id TEXT PRIMARY KEY, conversation_id INTEGER NOT NULL, backend TEXT)")
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")]
+            if 'backend' not in columns:
+                # 旧版本的映射表没有后端列，原有对话属于默认后端
+                self._conn.execute("ALTER TABLE conversations ADD COLUMN backend TEXT")
+            self._conn.commit()
+            self._pid = os.getpid()
+            with self._lock:
+                # 子进程继承的缓存可能已过期，以数据库为准
+                self._items.clear()
+        return self._conn
+
+    def get_route(self, sender_id: Any) -> Optional[Route]:
+        key = self._key(sender_id)
+        if self._pid == os.getpid():
+            route = self._cache_get(key)
+            if route is not None:
+                Metrics.incr('context.hit')
+                return route
+        with self._db_lock:
+            row = self._connect().execute("SELECT conversation_id, backend FROM conversations WHERE sender_id = ?", (key,)).fetchone()
+        if row is None:
+            Metrics.incr('context.miss')
+            return None
+        Metrics.incr('context.disk_hit')
+        route = (row[0], row[1])
+        self._cache_set(key, route)
+        return route
+
+    def set(self, sender_id: Any, conversation_id: int, backend: Optional[str] = None) -> None:
+        key = self._key(sender_id)
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO conversations (sender_id, conversation_id, backend) VALUES (?, ?, ?)",
+                             (key, conversation_id, backend))
+        self._cache_set(key, (conversation_id, backend))
+
+    def pop(self, sender_id: Any, default: Optional[int] = None) -> Optional[int]:
+        value = self.get(sender_id)
+        key = self._key(sender_id)
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM conversations WHERE sender_id = ?", (key,))
+        self._cache_pop(key)
+        return default if value is None else value
+
+    def __len__(self) -> int:
+        with self._db_lock:
+            return self._connect().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+
+def create_context_store(setting: dict) -> MemoryContextStore:
+    """根据 dialogue_setting 创建会话映射存储（context_store: sqlite / memory）"""
+    capacity = setting.get('context_cache_size', 10000)
+    kind = setting.get('context_store', 'sqlite')
+    if kind == 'sqlite':
+        return SQLiteContextStore(setting.get('context_store_path', 'data/context/conversations.db'), capacity)
+    if kind == 'memory':
+        return MemoryContextStore(capacity)
+    raise ValueError(f"未知的会话映射存储类型: {kind}")
@@ -0,0 +1,82 @@
+"""预创建对话池：
+    新用户的第一条消息需要先 POST /api/conversation 创建对话，再请求回复
+    开启后后台线程预先创建若干空闲对话，新用户直接取用，第一条消息不再多一次往返
+    取走一个后在后台补齐；池为空或创建失败时由调用方同步创建
+    池中的对话只保存在进程内存中，进程退出时未使用的对话会留在 rag 服务中
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger("ConversationPool")
+
+
+class ConversationPool:
+
+    def __init__(self, create: Callable[[], Optional[Any]], size: int = 0, retry_delay: float = 5.0):
+        """
+        Args:
+            create: 创建一个对话并返回对话（RagClient.create_conversation 返回的 (对话ID, 后端)），失败时返回 None
+            size: 池中保持的空闲对话数量，0 表示不预创建
+            retry_delay: 创建失败后等待多久再补充（秒）
+        """
+        self.create = create
+        self.size = max(0, int(size))
+        self.retry_delay = retry_delay
+        self._spare = deque()
+        self._lock = threading.Lock()
+        self._refill = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+
+    def take(self) -> Optional[Any]:
+        """取出一个空闲对话，池为空时返回 None"""
+        if not self.size:
+            return None
+        self.start()
+        with self._lock:
+            conversation = self._spare.popleft() if self._spare else None
+            Metrics.gauge('conversation_pool.spare', len(self._spare))
+        Metrics.incr('conversation_pool.hit' if conversation is not None else 'conversation_pool.miss')
+        self._refill.set()
+        return conversation
+
+    def spare(self) -> int:
+        return len(self._spare)
+
+    def start(self) -> None:
+        """在当前进程启动补充线程，首次 take 时也会自动启动（fork 出的子进程不会继承线程）"""
+        if not self.size or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._spare.clear()
+            self._refill.set()
+            self._thread = threading.Thread(target=self._fill_loop, name="conversation-pool", daemon=True)
+            self._thread.start()
+
+    def _fill_loop(self) -> None:
+        while True:
+            self._refill.wait()
+            self._refill.clear()
+            while len(self._spare) < self.size:
+                try:
+                    conversation = self.create()
+                except Exception as e:
+                    logger.error(f"预创建对话失败: {e}")
+                    conversation = None
+                if conversation is None:
+                    # rag 服务暂不可用，稍后再补充
+                    time.sleep(self.retry_delay)
+                    self._refill.set()
+                    break
+                with self._lock:
+                    self._spare.append(conversation)
+                    Metrics.gauge('conversation_pool.spare', len(self._spare))
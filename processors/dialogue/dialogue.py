@@ -5,25 +5,56 @@
     对话处理器收到信息后的处理流程:
         dialogue_processor -> processMessage(判断消息类型）-> _type_process_message -> 建立 rag_client 映射
         -> 获取 rag 内容 -> 发送 rag 内容
+    异步模式(dialogue_setting.mode = async)下由 AsyncDialogueEngine 调用 async_processMessage，流程相同，
+    请求 rag 时不阻塞进程，同一进程内可以同时等待多个会话的回复
+    开启 llm_fast_path 时，判断为简单闲聊的消息直接发送给 llm_settings 配置的大模型，不经过 rag
 """
 import json
+import time
 from itertools import count
 from typing import Union
-import paho.mqtt.client as mqtt
 
-from api.RagClient import RagClient
+from api.MqttClient import MqttPublisher
+from api.RagClient import AsyncRagClient, RagClient
 from api.RagClient.models import ChatMessage, CreateChat
+from dispatch.retry import DeliveryError
+from dispatch.reply_channel import ReplyChannel
+from dispatch.wal import Acknowledger
 from config import SettingReader
 from globals.global_variable import GlobalVariable
+from utils.metrics import Metrics
 from models.message import TextMessage
+from utils.background_loop import BackgroundLoop
+from processors.dialogue.answer_cache import AnswerCache, cacheable
+from processors.dialogue.context_store import create_context_store
+from processors.dialogue.conversation_pool import ConversationPool
+from processors.dialogue.llm_router import LlmFastPath
+from processors.dialogue.reply_stream import ReplyStream
 
 
 class dialogueProcessor:
     """ TODO: 一个用户实例一个dialogueProcessor 并使用映射表进行管理"""
-    context_rag_mapper = {} # id 映射表
 
     def __init__(self):
         print('init dialogueProcessor')
+        # sender_id -> (rag 对话ID, 所在后端) 映射表，LRU + SQLite，重启后保留，多个工作进程共享
+        self.context_rag_mapper = create_context_store(GlobalVariable.get_setting('dialogue_setting', default={}))
+        # 预创建的空闲对话，新用户直接取用（conversation_pool_size 为 0 时不预创建）
+        self.conversation_pool = ConversationPool(
+            lambda: RagClient.create_conversation(CreateChat("预留对话")),
+            GlobalVariable.get_setting('dialogue_setting', 'conversation_pool_size', 0),
+        )
+        self.retry_scheduler = None # 失败重试调度器，由对话工作进程设置
+        # async 模式下单条消息等待 rag 的总时长（创建对话 + 获取回复），超过后放弃请求并交给重试
+        self.rag_deadline = GlobalVariable.get_setting('dialogue_setting', 'rag_deadline', 60)
+        # 常见短消息的回复缓存（answer_cache 未开启时为 None）
+        self.answer_cache = AnswerCache.from_setting(GlobalVariable.get_setting('dialogue_setting', default={}))
+        # 流式回复：rag 边生成边按句发布，而不是等完整回复后一次发布
+        self.stream_reply = GlobalVariable.get_setting('dialogue_setting', 'stream_reply', False)
+        self.stream_max_chars = GlobalVariable.get_setting('dialogue_setting', 'stream_max_chars', 120)
+        # 闲聊直连大模型（llm_fast_path 未开启时为 None）
+        self.llm_fast_path = LlmFastPath.from_setting(GlobalVariable.get_setting('dialogue_setting', default={}),
+                                                      GlobalVariable.get_setting('llm_settings', default={}))
 
     def processMessage(self,message:Union[TextMessage]): # 联合消息类型，消息类型来自于 models 下，请仔细甄别
         if message.message_type == "text":
@@ -31,23 +62,172 @@ class dialogueProcessor:
 
     def _text_process_message(self,message:TextMessage):
         """text 消息处理"""
-        if message.sender_id not in self.context_rag_mapper: # 如果没有映射关系，建立映射关系,建立映射关系后，会自动发送消息
-            # 获取该用户配置的 rag_baseurl TODO(为后期多用户预留)
-            RagClient.update_count() # TODO: 这里需要考虑一个极端情况，在请求rag当前对话列表时，另一个用户同时请求该列表，rag方面需要做出锁限制，或是create对话列表时候可以传入指定参数
-            self.context_rag_mapper[message.sender_id] = RagClient.count + 1
-            create_chat = CreateChat(f"用户{RagClient.count + 1}")
-            RagClient.create_chat(create_chat)
+        cache_key = self._cache_key(message)
+        cached = self.answer_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            return self._publish_cached(message, cached)
+
+        if self.llm_fast_path is not None and self.llm_fast_path.accepts(message):
+            # 在进程共用的后台事件循环中请求大模型，多个同步调用共用一个连接池
+            if BackgroundLoop.run(self._llm_reply(message, cache_key, time.monotonic() + self.rag_deadline)):
+                return
+
+        route = self.context_rag_mapper.get_route(message.sender_id)
+        if route is None: # 如果没有映射关系，建立映射关系
+            # 优先取用预创建的对话，否则直接使用创建接口返回的对话ID；对话创建在哪个 rag 后端，之后都发往该后端
+            route = self.conversation_pool.take() or RagClient.create_conversation(CreateChat(f"用户{message.sender_id}"))
+            if route is None:
+                raise DeliveryError(f"RAG Error: 用户{message.sender_id}的对话创建失败")
+            self.context_rag_mapper.set(message.sender_id, *route)
+        conversation_id, backend = route
 
         # 构造 ChatMessage
-        chat_message = ChatMessage(self.context_rag_mapper[message.sender_id],message.content)
-        res = RagClient.post_chat(chat_message)
-        json_string = json.dumps(res.json(), ensure_ascii=False)
-        client = mqtt.Client()
+        chat_message = ChatMessage(conversation_id,message.content)
+        if self.stream_reply:
+            stream = self._reply_stream(message)
+            for delta in RagClient.stream_chat(chat_message, backend):
+                stream.feed(delta)
+            return self._finish_stream(message, stream, cache_key)
+        res = RagClient.post_chat(chat_message, backend)
+        if res is None:
+            raise DeliveryError(f"RAG Error: 用户{message.sender_id}的消息未获取到回复")
+        reply = res.json()
+        if cache_key is not None and cacheable(res.status_code, reply):
+            self.answer_cache.set(cache_key, reply)
+        self._publish_reply(message, reply)
+
+    async def async_processMessage(self,message:Union[TextMessage]):
+        if message.message_type == "text":
+            return await self._async_text_process_message(message)
+
+    async def _async_text_process_message(self,message:TextMessage):
+        """text 消息处理（异步）"""
+        # 同一发送者的消息由引擎串行处理，不会重复创建对话；不同用户各自使用创建接口返回的ID，无需加锁
+        cache_key = self._cache_key(message)
+        cached = self.answer_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            return self._publish_cached(message, cached)
+
+        deadline = time.monotonic() + self.rag_deadline
+        if self.llm_fast_path is not None and self.llm_fast_path.accepts(message):
+            if await self._llm_reply(message, cache_key, deadline):
+                return
+
+        route = self.context_rag_mapper.get_route(message.sender_id)
+        if route is None:
+            route = self.conversation_pool.take() or await AsyncRagClient.create_conversation(CreateChat(f"用户{message.sender_id}"), deadline=deadline)
+            if route is None:
+                raise DeliveryError(f"RAG Error: 用户{message.sender_id}的对话创建失败")
+            self.context_rag_mapper.set(message.sender_id, *route)
+        conversation_id, backend = route
+
+        chat_message = ChatMessage(conversation_id,message.content)
+        if self.stream_reply:
+            stream = self._reply_stream(message)
+            async for delta in AsyncRagClient.stream_chat(chat_message, deadline=deadline, backend=backend):
+                stream.feed(delta)
+            return self._finish_stream(message, stream, cache_key)
+        res = await AsyncRagClient.post_chat(chat_message, deadline=deadline, backend=backend)
+        if res is None:
+            raise DeliveryError(f"RAG Error: 用户{message.sender_id}的消息未获取到回复")
+        reply = res.json()
+        if cache_key is not None and cacheable(res.status_code, reply):
+            self.answer_cache.set(cache_key, reply)
+        self._publish_reply(message, reply)
+
+    async def _llm_reply(self, message:TextMessage, cache_key, deadline:float) -> bool:
+        """直连大模型生成并发布回复；还没有发出任何内容就失败时返回 False，由调用方改为请求 rag"""
+        stream = self._reply_stream(message) if self.stream_reply else None
+        parts = []
         try:
-            client.connect(GlobalVariable.config['categories']['mqtt_setting']['ip'], GlobalVariable.config['categories']['mqtt_setting']['port'], GlobalVariable.config['categories']['mqtt_setting']['keepalive'])
-            client.publish(str(message.sender_id), json_string,qos=1)
+            async for delta in self.llm_fast_path.stream(message, timeout=max(deadline - time.monotonic(), 0)):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"超过 {self.rag_deadline} 秒未生成完毕")
+                if stream is not None:
+                    stream.feed(delta)
+                else:
+                    parts.append(delta)
         except Exception as e:
-            print(f"MQTT Error: {e}")
+            if stream is not None and stream.sentences:
+                # 已经发出部分句子，重试时从 seq 0 重新发送整条回复
+                raise DeliveryError(f"LLM Error: 用户{message.sender_id}的回复生成中断: {e}")
+            print(f"LLM Error: 用户{message.sender_id}的消息请求大模型失败，改为请求 rag: {e}")
+            Metrics.incr('llm.fallback')
+            return False
+        if stream is not None:
+            if stream.empty:
+                Metrics.incr('llm.fallback')
+                return False
+            self._finish_stream(message, stream, cache_key)
+            return True
+        text = ''.join(parts).strip()
+        if not text:
+            Metrics.incr('llm.fallback')
+            return False
+        # 与 rag 回复的结构一致
+        reply = {"code": 200, "data": {"content": text}}
+        if cache_key is not None:
+            self.answer_cache.set(cache_key, reply)
+        self._publish_reply(message, reply)
+        return True
+
+    def _cache_key(self, message:TextMessage):
+        """回复缓存键，未开启缓存或消息不可缓存时返回 None"""
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.key(message.character, message.content)
+
+    def _publish_cached(self, message:TextMessage, cached):
+        """发送缓存的回复，流式模式下缓存的是已切分的句子"""
+        if not self.stream_reply:
+            return self._publish_reply(message, cached)
+        stream = self._reply_stream(message)
+        for sentence in cached:
+            stream.feed(sentence)
+        self._finish_stream(message, stream, None)
+
+    def _reply_stream(self, message:TextMessage) -> ReplyStream:
+        """创建流式回复，各句共用一个丢弃回调，同一条回复只安排一次重试"""
+        dropped = []
+        def on_drop():
+            if not dropped:
+                dropped.append(True)
+                self._delivery_failed(message, DeliveryError("MQTT Error: 流式回复在发送缓冲区中被丢弃"))
+        def publish(payload, on_ack):
+            if ReplyChannel.accepts(message):
+                # socket 客户端：结束标记写入连接后由主进程确认
+                return ReplyChannel.publish(message, payload, final=on_ack is not None)
+            MqttPublisher.get_instance().publish(str(message.sender_id), payload, qos=1, on_ack=on_ack, on_drop=on_drop)
+        return ReplyStream(publish, self.stream_max_chars)
+
+    def _finish_stream(self, message:TextMessage, stream:ReplyStream, cache_key):
+        """发送结束标记，结束标记收到 PUBACK 后确认持久化队列中的消息"""
+        if stream.empty:
+            raise DeliveryError(f"RAG Error: 用户{message.sender_id}的消息未获取到回复")
+        sentences = stream.finish(on_ack=lambda: Acknowledger.ack(message))
+        if cache_key is not None:
+            self.answer_cache.set(cache_key, tuple(sentences))
+
+    def _publish_reply(self, message:TextMessage, reply):
+        """将 rag 回复发布到发送者对应的 MQTT topic，socket 客户端发来的消息推送到其长连接"""
+        json_string = json.dumps(reply, ensure_ascii=False)
+        if ReplyChannel.accepts(message):
+            # socket 客户端发来的消息：经回复通道交给主进程，推送到客户端的长连接上
+            return ReplyChannel.publish(message, json_string)
+        # 复用进程内的长连接发布，broker 断开时消息进入缓冲区等待重连后补发
+        # 收到 PUBACK 后确认持久化队列中的消息（未启用持久化队列时为空操作）
+        # 缓冲区已满被丢弃时交给重试调度器，重新请求并发送
+        on_ack = lambda: Acknowledger.ack(message)
+        on_drop = lambda: self._delivery_failed(message, DeliveryError("MQTT Error: 回复在发送缓冲区中被丢弃"))
+        if not MqttPublisher.get_instance().publish(str(message.sender_id), json_string, qos=1, on_ack=on_ack, on_drop=on_drop):
+            print(f"MQTT Error: 发送缓冲区已满，丢弃最早的消息")
+
+    def _delivery_failed(self, message:TextMessage, error:Exception):
+        """处理失败：交给重试调度器，未设置时只记录"""
+        if self.retry_scheduler is None:
+            print(f"{error}")
+            return
+        self.retry_scheduler.failed(message, error)
 
 
 
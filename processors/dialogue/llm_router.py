@@ -0,0 +1,110 @@
+"""闲聊直连大模型：
+    "你好"、"哈哈"、"晚安"这类简单闲聊不需要记忆或知识库，经过 rag 只会增加延迟与 rag 负载
+    - LlmRouter: 按规则判断消息发往 llm 还是 rag，只做长度判断与关键词查找，耗时可以忽略
+      超过 max_length 或含有 rag_keywords 中任一词（涉及记忆、提问）的消息发往 rag
+    - LlmFastPath: 用 llm_settings 配置的模型流式生成回复，所有请求共用 APIWrapper 的异步客户端连接池
+    直连大模型的对话不会记入 rag 的对话记录
+"""
+import logging
+import time
+from typing import Iterable, Optional
+
+from models.message import TextMessage
+from utils.api_client import APIWrapper
+from utils.concurrency_limiter import AdaptiveLimiter
+from utils.metrics import Metrics
+
+logger = logging.getLogger("LlmRouter")
+
+LLM = 'llm'
+RAG = 'rag'
+
+# 涉及记忆或需要查询知识的词，含有这些词的消息发往 rag
+DEFAULT_RAG_KEYWORDS = ["记得", "记住", "上次", "之前", "以前", "昨天", "前天", "上周", "你说过", "我说过",
+                        "我叫", "我的", "什么", "怎么", "为什么", "如何", "哪", "多少", "几", "谁"]
+
+
+class LlmRouter:
+    """按规则判断消息的处理路径"""
+
+    def __init__(self, max_length: int = 30, rag_keywords: Optional[Iterable[str]] = None):
+        """
+        Args:
+            max_length: 超过该长度的消息发往 rag
+            rag_keywords: 含有其中任一词的消息发往 rag，为空时使用 DEFAULT_RAG_KEYWORDS
+        """
+        self.max_length = int(max_length)
+        self.rag_keywords = tuple(DEFAULT_RAG_KEYWORDS if rag_keywords is None else rag_keywords)
+
+    def route(self, content: str) -> str:
+        """返回 LLM 或 RAG"""
+        text = (content or '').strip()
+        if not text or len(text) > self.max_length or any(keyword in text for keyword in self.rag_keywords):
+            return RAG
+        return LLM
+
+
+class LlmFastPath:
+    """把路由为 LLM 的消息直接发送给大模型"""
+
+    def __init__(self, client: APIWrapper, router: LlmRouter, model: str, temperature: float = 0.7,
+                 max_tokens: int = 1000, system_prompt: str = ""):
+        """
+        Args:
+            client: 大模型 API 客户端
+            router: 消息路由规则
+            model: 模型名称
+            temperature: 温度参数
+            max_tokens: 最大token数
+            system_prompt: 系统提示词，为空时不发送
+        """
+        self.client = client
+        self.router = router
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.system_prompt = system_prompt
+
+    @classmethod
+    def from_setting(cls, dialogue_setting: dict, llm_settings: dict) -> Optional['LlmFastPath']:
+        """根据 dialogue_setting 与 llm_settings 创建，未开启或未配置 api_key 时返回 None"""
+        if not dialogue_setting.get('llm_fast_path', False):
+            return None
+        settings = (llm_settings or {}).get('settings', {})
+        value = lambda key, default=None: (settings.get(key) or {}).get('value', default)
+        if not value('api_key'):
+            logger.warning("已开启 llm_fast_path，但 llm_settings 中没有配置 api_key，所有消息仍发往 rag")
+            return None
+        return cls(
+            APIWrapper(value('api_key'), value('base_url'), model=value('model'),
+                       limiter=AdaptiveLimiter.from_setting(dialogue_setting.get('llm_limiter'), 'llm')),
+            LlmRouter(dialogue_setting.get('llm_fast_path_max_length', 30),
+                      dialogue_setting.get('llm_fast_path_rag_keywords')),
+            model=value('model'),
+            temperature=value('temperature', 0.7),
+            max_tokens=value('max_tokens', 1000),
+            system_prompt=dialogue_setting.get('llm_fast_path_system_prompt', ""),
+        )
+
+    def accepts(self, message: TextMessage) -> bool:
+        """消息是否直连大模型，同时记录路由指标"""
+        route = self.router.route(message.content)
+        Metrics.incr(f'dialogue.route.{route}')
+        return route == LLM
+
+    async def stream(self, message: TextMessage, timeout: Optional[float] = None):
+        """流式生成回复，逐段返回文本；请求失败时抛出异常"""
+        messages = [{"role": "user", "content": message.content}]
+        if self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        start = time.monotonic()
+        first = True
+        try:
+            async for delta in self.client.async_stream_completion(messages, self.temperature, self.max_tokens,
+                                                                   self.model, timeout):
+                if first:
+                    Metrics.observe('llm.first_token_seconds', time.monotonic() - start)
+                    first = False
+                yield delta
+        finally:
+            Metrics.observe('llm.latency', time.monotonic() - start)
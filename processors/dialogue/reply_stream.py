@@ -0,0 +1,101 @@
+"""流式回复：
+    rag 边生成边返回文本时，按句子切分后立即发布到发送者的 MQTT topic，用户等待的时间从完整生成缩短到第一句生成
+    每条 MQTT 消息为 {"seq": 序号, "content": 句子, "final": false}，序号从 0 开始
+    全部发送后再发送一条 {"seq": 序号, "content": "", "final": true} 作为结束标记
+    失败重试时会从 seq 0 重新发送整条回复，客户端收到 seq 0 时应丢弃尚未结束的回复
+"""
+import json
+import time
+from typing import Callable, List, Optional
+
+from utils.metrics import Metrics
+
+# 句末标点，之后紧跟的引号与括号属于同一句
+_SENTENCE_ENDS = set('。！？!?；;…\n')
+_CLOSERS = set('"\'”’」』）)】》')
+
+
+class SentenceSplitter:
+    """把逐段到达的文本切分为完整的句子"""
+
+    def __init__(self, max_chars: int = 120):
+        """
+        Args:
+            max_chars: 没有句末标点时，累积超过该长度也作为一句发送
+        """
+        self.max_chars = max(1, int(max_chars))
+        self._buffer = ''
+
+    def feed(self, text: str) -> List[str]:
+        """追加一段文本，返回新完成的句子"""
+        self._buffer += text
+        sentences = []
+        start = 0
+        i = 0
+        while i < len(self._buffer):
+            if self._buffer[i] in _SENTENCE_ENDS:
+                # 连续的句末标点（"？！"、"……"）与后面的引号括号一起归入当前句
+                while i + 1 < len(self._buffer) and (self._buffer[i + 1] in _SENTENCE_ENDS or self._buffer[i + 1] in _CLOSERS):
+                    i += 1
+                if i + 1 == len(self._buffer):
+                    # 还不能确定后面是否还有标点，等下一段文本
+                    break
+                sentences.append(self._buffer[start:i + 1])
+                start = i + 1
+            elif i + 1 - start >= self.max_chars:
+                sentences.append(self._buffer[start:i + 1])
+                start = i + 1
+            i += 1
+        self._buffer = self._buffer[start:]
+        return [sentence for sentence in (s.strip() for s in sentences) if sentence]
+
+    def pending(self) -> bool:
+        return bool(self._buffer.strip())
+
+    def flush(self) -> Optional[str]:
+        """返回剩余的文本"""
+        rest, self._buffer = self._buffer.strip(), ''
+        return rest or None
+
+
+class ReplyStream:
+    """把一条回复的文本分句发布，最后发送结束标记"""
+
+    def __init__(self, publish: Callable[[str, Optional[Callable]], None], max_chars: int = 120):
+        """
+        Args:
+            publish: publish(payload, on_ack)，发布一条 MQTT 消息；on_ack 只在结束标记上传入
+            max_chars: 单句最大长度
+        """
+        self.publish = publish
+        self.splitter = SentenceSplitter(max_chars)
+        self.sentences: List[str] = []
+        self._start = time.monotonic()
+
+    @property
+    def empty(self) -> bool:
+        """尚未收到任何文本"""
+        return not self.sentences and not self.splitter.pending()
+
+    def feed(self, text: str) -> None:
+        for sentence in self.splitter.feed(text):
+            self._send(sentence)
+
+    def finish(self, on_ack: Optional[Callable] = None) -> List[str]:
+        """发送剩余文本与结束标记，返回已发送的全部句子"""
+        rest = self.splitter.flush()
+        if rest:
+            self._send(rest)
+        self.publish(self._payload('', True), on_ack)
+        Metrics.observe('stream.reply_seconds', time.monotonic() - self._start)
+        return self.sentences
+
+    def _send(self, sentence: str) -> None:
+        if not self.sentences:
+            Metrics.observe('stream.first_sentence_seconds', time.monotonic() - self._start)
+        self.publish(self._payload(sentence, False), None)
+        self.sentences.append(sentence)
+        Metrics.incr('stream.sentences')
+
+    def _payload(self, content: str, final: bool) -> str:
+        return json.dumps({'seq': len(self.sentences), 'content': content, 'final': final}, ensure_ascii=False)
@@ -0,0 +1,2 @@
+from .retrieval import MemoryRetrieval, VectorIndex
+__all__ = ["MemoryRetrieval", "VectorIndex"]
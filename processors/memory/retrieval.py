@@ -0,0 +1,332 @@
+"""记忆检索：每个用户一个本地向量索引，按余弦相似度返回 top-k 记忆
+    - 记忆数量不超过 threshold 时精确检索：所有向量放在一个矩阵中，一次矩阵乘法算出全部相似度
+    - 超过 threshold 后自动切换为倒排索引（IVF）：k-means 把向量划分到 nlist 个簇，
+      查询时只比较离查询向量最近的 nprobe 个簇，检索耗时与记忆总数基本无关（近似检索）
+    - 记忆数量增长到上次训练时的 4 倍后重新训练簇中心，回落到 threshold / 2 以下时切回精确检索
+    - 支持逐条插入、删除（同一ID再次插入视为更新），save / load 持久化为 .npz 文件
+    记忆ID为整数（如记忆表的自增主键），向量插入时归一化
+"""
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger("MemoryRetrieval")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """scores 中最大的 k 个的下标（从大到小）"""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class _Block:
+    """一组向量的连续存储，删除时用最后一行填补空位"""
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.size = 0
+        self.positions: Dict[int, int] = {}
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """追加向量（ids 不能已存在）"""
+        end = self.size + len(ids)
+        if end > len(self.ids):
+            capacity = max(end, len(self.ids) * 2)
+            self.ids = np.resize(self.ids, capacity)
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.ids[self.size:end] = ids
+        self.vectors[self.size:end] = vectors
+        for offset, memory_id in enumerate(ids.tolist()):
+            self.positions[memory_id] = self.size + offset
+        self.size = end
+
+    def remove(self, memory_id: int) -> None:
+        position = self.positions.pop(memory_id)
+        last = self.size - 1
+        if position != last:
+            self.ids[position] = self.ids[last]
+            self.vectors[position] = self.vectors[last]
+            self.positions[int(self.ids[position])] = position
+        self.size = last
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (相似度, ID)，按相似度从大到小"""
+        scores = self.vectors[:self.size] @ query
+        order = _top_k(scores, k)
+        return scores[order], self.ids[:self.size][order]
+
+
+class VectorIndex:
+    """单个用户的向量索引（线程安全）"""
+
+    def __init__(self, dim: int, threshold: int = 20000, nlist: Optional[int] = None, nprobe: int = 16,
+                 seed: int = 0):
+        """
+        Args:
+            dim: 向量维度
+            threshold: 记忆数量超过该值后切换为 IVF 近似检索
+            nlist: IVF 簇数量，为空时取 sqrt(记忆数量)
+            nprobe: 每次查询比较的簇数量，越大召回率越高、耗时越长
+            seed: k-means 随机种子
+        """
+        self.dim = int(dim)
+        self.threshold = int(threshold)
+        self.nlist = nlist
+        self.nprobe = max(1, int(nprobe))
+        self._rng = np.random.default_rng(seed)
+        self._flat: Optional[_Block] = _Block(self.dim)
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[_Block] = []
+        self._assign: Dict[int, int] = {}  # 记忆ID -> 簇编号（IVF 模式）
+        self._trained_size = 0
+        self._lock = threading.RLock()
+
+    @property
+    def approximate(self) -> bool:
+        """是否为 IVF 近似检索模式"""
+        return self._centroids is not None
+
+    def __len__(self) -> int:
+        if self._flat is not None:
+            return self._flat.size
+        return len(self._assign)
+
+    def __contains__(self, memory_id: int) -> bool:
+        if self._flat is not None:
+            return memory_id in self._flat.positions
+        return memory_id in self._assign
+
+    def add(self, memory_id: int, vector: Iterable[float]) -> None:
+        """插入一条记忆，ID 已存在时更新其向量"""
+        self.add_many([memory_id], [vector])
+
+    def add_many(self, memory_ids: Iterable[int], vectors) -> None:
+        """批量插入，比逐条插入快"""
+        ids = np.asarray(list(memory_ids), dtype=np.int64)
+        vectors = _normalize(vectors).reshape(len(ids), self.dim)
+        # 同一批中重复的ID只保留最后一个
+        _, last = np.unique(ids[::-1], return_index=True)
+        keep = np.sort(len(ids) - 1 - last)
+        ids, vectors = ids[keep], vectors[keep]
+        with self._lock:
+            for memory_id in ids.tolist():
+                if memory_id in self:
+                    self._remove(memory_id)
+            if self._flat is not None:
+                self._flat.add(ids, vectors)
+            else:
+                self._add_to_lists(ids, vectors)
+            self._rebalance()
+
+    def remove(self, memory_id: int) -> bool:
+        """删除一条记忆，不存在时返回 False"""
+        with self._lock:
+            if memory_id not in self:
+                return False
+            self._remove(memory_id)
+            self._rebalance()
+            return True
+
+    def search(self, vector: Iterable[float], k: int = 10) -> List[Tuple[int, float]]:
+        """返回相似度最高的 k 条记忆 [(记忆ID, 余弦相似度)]，按相似度从大到小"""
+        query = _normalize(vector).reshape(self.dim)
+        with self._lock:
+            if k <= 0 or not len(self):
+                return []
+            if self._flat is not None:
+                scores, ids = self._flat.search(query, k)
+            else:
+                probes = _top_k(self._centroids @ query, min(self.nprobe, len(self._lists)))
+                results = [self._lists[probe].search(query, k) for probe in probes if self._lists[probe].size]
+                if not results:
+                    return []
+                scores = np.concatenate([result[0] for result in results])
+                ids = np.concatenate([result[1] for result in results])
+                order = _top_k(scores, k)
+                scores, ids = scores[order], ids[order]
+        Metrics.incr('memory.search')
+        return list(zip(ids.tolist(), scores.tolist()))
+
+    def _remove(self, memory_id: int) -> None:
+        if self._flat is not None:
+            self._flat.remove(memory_id)
+        else:
+            self._lists[self._assign.pop(memory_id)].remove(memory_id)
+
+    def _add_to_lists(self, ids: np.ndarray, vectors: np.ndarray, assign: Optional[np.ndarray] = None) -> None:
+        if assign is None:
+            assign = self._nearest(vectors)
+        order = np.argsort(assign, kind='stable')
+        for rows in np.split(order, np.flatnonzero(np.diff(assign[order])) + 1):
+            if len(rows):
+                self._lists[int(assign[rows[0]])].add(ids[rows], vectors[rows])
+        self._assign.update(zip(ids.tolist(), assign.tolist()))
+
+    def _nearest(self, vectors: np.ndarray, chunk: int = 8192) -> np.ndarray:
+        """每个向量最近的簇中心（分块计算，避免生成过大的相似度矩阵）"""
+        return np.concatenate([np.argmax(vectors[start:start + chunk] @ self._centroids.T, axis=1)
+                               for start in range(0, len(vectors), chunk)]) if len(vectors) else np.empty(0, np.int64)
+
+    def _export(self) -> Tuple[np.ndarray, np.ndarray]:
+        """全部 (ID, 向量)"""
+        if self._flat is not None:
+            return self._flat.ids[:self._flat.size].copy(), self._flat.vectors[:self._flat.size].copy()
+        blocks = [block for block in self._lists if block.size]
+        if not blocks:
+            return np.empty(0, np.int64), np.empty((0, self.dim), np.float32)
+        return (np.concatenate([block.ids[:block.size] for block in blocks]),
+                np.concatenate([block.vectors[:block.size] for block in blocks]))
+
+    def _rebalance(self) -> None:
+        """按记忆数量在精确检索与 IVF 之间切换，或重新训练簇中心"""
+        size = len(self)
+        if self._flat is not None and size > self.threshold:
+            self._train()
+        elif self._flat is None and size < self.threshold // 2:
+            ids, vectors = self._export()
+            self._flat, self._centroids, self._lists, self._assign = _Block(self.dim, max(64, size)), None, [], {}
+            self._flat.add(ids, vectors)
+            logger.info(f"记忆数量 {size} 低于 {self.threshold // 2}，切换为精确检索")
+        elif self._flat is None and size > 4 * self._trained_size:
+            self._train()
+
+    def _train(self, iterations: int = 10) -> None:
+        """用 k-means 训练簇中心并重新分配所有向量"""
+        ids, vectors = self._export()
+        nlist = min(len(ids), self.nlist or max(16, int(np.sqrt(len(ids)))))
+        # 用采样训练，每个簇约 64 个样本
+        sample = vectors[self._rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False)]
+        centroids = sample[self._rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            self._centroids = centroids
+            assign = self._nearest(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            # 空簇保留原中心
+            centroids = np.where(counts[:, None] > 0, _normalize(sums), centroids)
+        self._centroids = centroids
+        self._lists = [_Block(self.dim, 16) for _ in range(nlist)]
+        self._assign = {}
+        self._flat = None
+        self._add_to_lists(ids, vectors)
+        self._trained_size = len(ids)
+        Metrics.incr('memory.index_trained')
+        logger.info(f"记忆数量 {len(ids)} 超过 {self.threshold}，训练 IVF 索引（{nlist} 个簇）")
+
+    def save(self, path: str) -> None:
+        """保存到 .npz 文件（先写临时文件再替换，写入中断不会损坏原文件）"""
+        with self._lock:
+            ids, vectors = self._export()
+            arrays = {'ids': ids, 'vectors': vectors}
+            if self._centroids is not None:
+                arrays['centroids'] = self._centroids
+                arrays['assign'] = np.asarray([self._assign[memory_id] for memory_id in ids.tolist()], dtype=np.int64)
+                arrays['trained_size'] = np.asarray(self._trained_size)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp = path + '.tmp'
+        with open(temp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'VectorIndex':
+        """从 save 保存的文件恢复，kwargs 为构造参数（维度从文件读取）"""
+        with np.load(path) as data:
+            ids, vectors = data['ids'], data['vectors']
+            index = cls(vectors.shape[1], **kwargs)
+            if 'centroids' in data:
+                index._centroids = data['centroids']
+                index._lists = [_Block(index.dim, 16) for _ in range(len(index._centroids))]
+                index._flat = None
+                index._trained_size = int(data['trained_size'])
+                index._add_to_lists(ids, vectors, data['assign'])
+            else:
+                index._flat.add(ids, vectors)
+        return index
+
+
+class MemoryRetrieval:
+    """按用户管理向量索引，索引文件保存在 directory/<用户ID>.npz"""
+
+    def __init__(self, directory: str, dim: int, **index_options):
+        """
+        Args:
+            directory: 索引文件目录
+            dim: 向量维度
+            index_options: VectorIndex 的其他构造参数（threshold、nlist、nprobe）
+        """
+        self.directory = directory
+        self.dim = dim
+        self.index_options = index_options
+        self._indexes: Dict[str, VectorIndex] = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _path(self, user_id) -> str:
+        return os.path.join(self.directory, f'{user_id}.npz')
+
+    def index(self, user_id) -> VectorIndex:
+        """用户的索引，首次访问时从文件加载"""
+        key = str(user_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                path = self._path(key)
+                if os.path.exists(path):
+                    index = VectorIndex.load(path, **self.index_options)
+                    if index.dim != self.dim:
+                        raise ValueError(f"用户 {key} 的记忆索引维度为 {index.dim}，与配置的 {self.dim} 不一致")
+                else:
+                    index = VectorIndex(self.dim, **self.index_options)
+                self._indexes[key] = index
+            return index
+
+    def add(self, user_id, memory_id: int, vector: Iterable[float]) -> None:
+        self.index(user_id).add(memory_id, vector)
+        self._mark_dirty(user_id)
+
+    def add_many(self, user_id, memory_ids: Iterable[int], vectors) -> None:
+        """批量插入同一用户的记忆向量"""
+        self.index(user_id).add_many(memory_ids, vectors)
+        self._mark_dirty(user_id)
+
+    def remove(self, user_id, memory_id: int) -> bool:
+        removed = self.index(user_id).remove(memory_id)
+        if removed:
+            self._mark_dirty(user_id)
+        return removed
+
+    def _mark_dirty(self, user_id) -> None:
+        with self._lock:
+            self._dirty.add(str(user_id))
+
+    def search(self, user_id, vector: Iterable[float], k: int = 10) -> List[Tuple[int, float]]:
+        return self.index(user_id).search(vector, k)
+
+    def flush(self) -> None:
+        """保存有修改的索引"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            indexes = [(key, self._indexes[key]) for key in dirty if key in self._indexes]
+        for key, index in indexes:
+            index.save(self._path(key))
@@ -1,17 +1,20 @@
 import asyncio
-import concurrent.futures
 from functools import partial
 
 import sys
 import os
 import logging
+import queue
 from multiprocessing import Process, Manager
 from time import time
 
 from network import NetworkManager
 from config import SettingReader
+from dispatch import Acknowledger, DurableQueue, ReplyChannel, RetryingQueue, RetryScheduler
 from globals.global_variable import GlobalVariable
+from processors.dialogue import AsyncDialogueEngine, CoalescingQueue
 from registry.handler_registry import HandlerRegistry
+from utils.metrics import Metrics
 
 # 添加项目根目录到系统路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -19,15 +22,72 @@ models = SettingReader().get_model()
 logger = logging.getLogger(__name__)
 
 
-def dialogue_task(to_message_send_queue, to_message_get_queue):
+def dialogue_task(shard_id, to_message_get_queue, metrics_store, ack_queue=None, reply_queue=None):
     """ 对话处理进程： 该进程用于处理所有与对话发送相关的cpu密集任务
+        每个进程只消费自己的分片队列，同一 sender_id 的消息总在同一进程内按序处理
     return: 无返回值
     """
+    Metrics.bind(metrics_store, f"dialogue-{shard_id}")
+    Acknowledger.bind(ack_queue) # 持久化队列：回复送达后确认消息
+    ReplyChannel.bind(reply_queue) # socket 客户端消息的回复发回主进程推送
+    dialogue_processed = GlobalVariable.handlerRegistry.modules['dialogue']
+    setting = GlobalVariable.get_setting('dialogue_setting', default={})
+    # 同一用户短时间内的连发消息先合并，再交给 processMessage
+    to_message_get_queue = CoalescingQueue.wrap(to_message_get_queue, setting)
+    # 处理失败的消息按退避时间重新取出，超过次数写入死信
+    retry_scheduler = RetryScheduler.from_setting(setting)
+    dialogue_processed.retry_scheduler = retry_scheduler
+    dialogue_processed.conversation_pool.start() # 后台预创建空闲对话
+    to_message_get_queue = RetryingQueue(to_message_get_queue, retry_scheduler)
+    if setting.get('mode', 'sync') == 'async':
+        # 异步模式：单进程内并发等待多个会话的 rag 回复
+        max_concurrency = setting.get('max_concurrency', 100)
+        AsyncDialogueEngine(dialogue_processed, to_message_get_queue, max_concurrency, shard_id=shard_id,
+                            on_failure=retry_scheduler.failed).run()
+        return
     while True:
-        message = to_message_get_queue.get()
-        print(f"获取到消息{message}")
-        dialogue_processed = GlobalVariable.handlerRegistry['dialogue']
-        dialogue_processed.processMessage(message)
+        try:
+            message = to_message_get_queue.get(timeout=Metrics.flush_interval)
+        except queue.Empty:
+            Metrics.flush() # 空闲时也刷新统计，保证吞吐量随时间衰减
+            continue
+        print(f"[worker-{shard_id}] 获取到消息{message}")
+        try:
+            dialogue_processed.processMessage(message)
+        except Exception as e:
+            logger.error(f"[worker-{shard_id}] 消息处理失败: {e}", exc_info=True)
+            Metrics.incr('dialogue.failed')
+            try:
+                retry_scheduler.failed(message, e)
+            except Exception as retry_error:
+                # 重试记录失败只记录日志，不能结束工作进程
+                logger.error(f"[worker-{shard_id}] 安排重试失败: {retry_error}", exc_info=True)
+        Metrics.mark('dialogue.throughput')
+        Metrics.maybe_flush()
+
+
+async def report_stats(interval):
+    """ 定期输出对话工作进程统计 """
+    while interval > 0:
+        await asyncio.sleep(interval)
+        stats = GlobalVariable.to_message_get_queue.stats()
+        for shard in stats['shards']:
+            logger.info(f"[worker-{shard['shard']}] 积压 {shard['depth']} 条, "
+                        f"已处理 {shard['processed']} 条, {shard['per_second']} 条/秒")
+        for name, item in stats.get('classes', {}).items():
+            wait = item['wait']
+            if wait['count']:
+                logger.info(f"[dispatch-{name}] 调度积压 {item['pending']} 条, 等待 p50 {wait['p50']}s / p99 {wait['p99']}s")
+
+
+def stop_workers(workers, timeout=5):
+    """ 终止对话工作进程 """
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+    for worker in workers:
+        if worker.pid is not None:
+            worker.join(timeout)
 
 
 async def main():
@@ -35,11 +95,21 @@ async def main():
     network_manager = NetworkManager()
     # 初始化全局变量
 
-    process_pool = concurrent.futures.ProcessPoolExecutor()
+    GlobalVariable.init_config() # 初始化全局 config
     manager = Manager()
     GlobalVariable.init_queues(manager) # 初始化通信队列
+    Metrics.bind(GlobalVariable.metrics_store, 'main') # 主进程汇总工作进程 flush 的指标（/system_manager 与运行时统计）
+    # 主进程中的优先级调度把送入分片失败的消息写入死信，同样需要通知 socket 客户端并确认持久化队列
+    ReplyChannel.bind(GlobalVariable.reply_queue)
+    Acknowledger.bind(GlobalVariable.ack_queue)
     GlobalVariable.init_handler_registry() # 初始化动态模块加载器
-    GlobalVariable.init_config() # 初始化全局 config
+    message_queue = GlobalVariable.to_message_get_queue
+    # multiprocessing.Queue 只能在创建进程时继承，不能作为进程池任务参数传递，因此每个分片直接启动一个进程
+    workers = [Process(target=dialogue_task, args=(shard_id, shard, GlobalVariable.metrics_store, GlobalVariable.ack_queue,
+                                                   GlobalVariable.reply_queue),
+                       name=f"dialogue-{shard_id}", daemon=True)
+               for shard_id, shard in enumerate(message_queue.shards)]
+    logger.info(f"启动 {message_queue.shard_count} 个对话工作进程，分片队列深度 {message_queue.maxsize or '不限制'}")
 
     try:
         # 启动所有服务器
@@ -48,16 +118,24 @@ async def main():
                 不用线程的原因： 受限于 python 设计 GIL(全局解释锁) 无法同时在两个线程中同时执行cpu密集任务, 因此使用 **双进程** 的方式实现在单一程序内双线处理
                 通信方式 消息接受进程「http接收」 -> to_message_send_queue -> 消息发送进程
                         消息发送进程 -> to_message_get_queue -> 消息接受进程
+                对话工作进程共 worker_count 个，to_message_get_queue 按 sender_id 哈希分片，每个进程消费一个分片
         """
+        for worker in workers:
+            worker.start()
+        replay = []
+        if isinstance(message_queue, DurableQueue):
+            # 重放上次退出时未确认的消息，队列已满时会阻塞，因此放在线程中执行
+            replay.append(asyncio.get_running_loop().run_in_executor(None, message_queue.replay))
         await asyncio.gather(
             network_manager.start_servers(),
-            asyncio.get_event_loop().run_in_executor(process_pool, dialogue_task, GlobalVariable.to_message_send_queue, GlobalVariable.to_message_get_queue)
+            report_stats(GlobalVariable.get_setting('dialogue_setting', 'stats_interval', 60)),
+            *replay,
         )
         
     except asyncio.CancelledError:
         print("Received Ctrl+C, exiting gracefully.")
-        # 确保进程池关闭  
-        process_pool.shutdown(wait=True, cancel_futures=True)
+        # 确保对话工作进程关闭
+        stop_workers(workers)
         # 关闭事件循环
         asyncio.get_running_loop().stop()
     except Exception as e:
@@ -66,7 +144,7 @@ async def main():
     finally:
         if hasattr(network_manager, '_flask_task') and not network_manager._flask_task.done():
             await network_manager.shutdown()
-        process_pool.shutdown(wait=True, cancel_futures=True) 
+        stop_workers(workers)
             
 
 if __name__ == '__main__':    
@@ -0,0 +1,72 @@
+import queue
+
+import pytest
+from flask import Flask
+
+from dispatch import AdmissionController, ShardedQueue
+from dispatch.admission import ACCEPTED, QUEUE_FULL, REJECTED, SHED
+from globals.global_variable import GlobalVariable
+from models.message import TextMessage
+from network.routes.http_routes.message_routes import MessageRoutes
+
+
+class LocalManager:
+    Queue = queue.Queue
+
+
+def make_message(sender_id, chat_type="private"):
+    return TextMessage(sender_id=sender_id, sender="susu", chat_type=chat_type, character=1,
+                       message_type="text", message_send_time="2025-04-21 12:00:00", content="你好")
+
+
+def drain(sharded, count):
+    for shard in sharded.shards:
+        while count and not shard.empty():
+            shard.get()
+            count -= 1
+
+
+def test_watermark_hysteresis():
+    sharded = ShardedQueue(LocalManager(), shard_count=2, maxsize=100)
+    admission = AdmissionController(sharded, high_watermark=5, low_watermark=2)
+    assert [admission.admit(make_message(i))[0] for i in range(6)] == [ACCEPTED] * 5 + [REJECTED]
+    drain(sharded, 2)  # 深度 3，仍高于低水位
+    assert admission.admit(make_message(1))[0] == REJECTED
+    drain(sharded, 1)  # 深度 2，恢复接收
+    assert admission.admit(make_message(1))[0] == ACCEPTED
+
+
+def test_shed_policy_keeps_private_chats():
+    sharded = ShardedQueue(LocalManager(), shard_count=1, maxsize=100)
+    admission = AdmissionController(sharded, high_watermark=2, policy='shed')
+    for i in range(2):
+        admission.admit(make_message(i))
+    assert admission.admit(make_message(9, "group"))[0] == SHED
+    assert admission.admit(make_message(9, "private"))[0] == ACCEPTED
+    assert admission.stats()['overloaded']
+
+
+def test_full_shard_does_not_block():
+    sharded = ShardedQueue(LocalManager(), shard_count=1, maxsize=1)
+    admission = AdmissionController(sharded)
+    assert admission.admit(make_message(1))[0] == ACCEPTED
+    assert admission.admit(make_message(1))[0] == QUEUE_FULL
+
+
+def test_route_returns_429_with_retry_after(monkeypatch):
+    app = Flask(__name__)
+    MessageRoutes(app)
+    sharded = ShardedQueue(LocalManager(), shard_count=1, maxsize=100)
+    monkeypatch.setattr(GlobalVariable, 'admission', AdmissionController(sharded, high_watermark=1, retry_after=7))
+    body = {'sender_id': 1, 'sender': 'susu', 'chat_type': 'private', 'character': 1,
+            'message_type': 'text', 'message_send_time': '2025-04-21 12:00:00', 'content': '你好'}
+    client = app.test_client()
+    assert client.post('/message/text', json=body).status_code == 200
+    response = client.post('/message/text', json=body)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
+    assert response.headers['X-Queue-Depth'] == '1'
+    # 与 socket 接口共用同一套校验规则
+    response = client.post('/message/text', json=dict(body, content=123))
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'content必须为字符串'
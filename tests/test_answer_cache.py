@@ -0,0 +1,77 @@
+import pytest
+
+from api.RagClient import RagClient
+from models.message import TextMessage
+from processors.dialogue import AnswerCache
+from processors.dialogue.dialogue import dialogueProcessor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalized_text_and_character_share_an_entry():
+    cache = AnswerCache(ttl=60, capacity=10)
+    cache.set(cache.key(1, "你好！"), {'content': '你好呀'})
+    assert cache.get(cache.key(1, " 你好~ ")) == {'content': '你好呀'}
+    assert cache.get(cache.key(2, "你好")) is None
+    assert cache.key(1, "这是一条很长的消息，" * 5) is None
+    assert AnswerCache(exclude_characters=[1]).key(1, "你好") is None
+
+
+def test_entries_expire_and_are_evicted_lru():
+    clock = FakeClock()
+    cache = AnswerCache(ttl=10, capacity=2, clock=clock)
+    cache.set(cache.key(1, "你好"), 'a')
+    cache.set(cache.key(1, "在吗"), 'b')
+    assert cache.get(cache.key(1, "你好")) == 'a'
+    cache.set(cache.key(1, "你是谁"), 'c')
+    assert cache.get(cache.key(1, "在吗")) is None
+    clock.now = 11
+    assert cache.get(cache.key(1, "你好")) is None
+    assert len(cache) == 1
+
+
+def test_disabled_by_default():
+    assert AnswerCache.from_setting({}) is None
+    assert AnswerCache.from_setting({'answer_cache': True, 'answer_cache_ttl': 5}).ttl == 5
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class FakeMapper:
+    def get_route(self, sender_id):
+        return 1, 'default'
+
+
+@pytest.mark.parametrize('status_code, body, cached', [
+    (200, {"code": 200, "data": {"content": "你好呀"}}, True),
+    (500, {"code": 500, "message": "internal error"}, False),
+    (429, {"code": 429, "message": "too many requests"}, False),
+    (200, {"code": 500, "message": "rag 内部错误"}, False),
+])
+def test_only_successful_rag_replies_are_cached(monkeypatch, status_code, body, cached):
+    processor = object.__new__(dialogueProcessor)
+    processor.answer_cache = AnswerCache()
+    processor.llm_fast_path = None
+    processor.stream_reply = False
+    processor.context_rag_mapper = FakeMapper()
+    published = []
+    monkeypatch.setattr(processor, '_publish_reply', lambda message, reply: published.append(reply), raising=False)
+    monkeypatch.setattr(RagClient, 'post_chat', lambda chat_message, backend=None: FakeResponse(status_code, body))
+    message = TextMessage(sender_id=1, sender="susu", chat_type="private", character=1,
+                          message_type="text", message_send_time="2025-04-21 12:00:00", content="你好")
+    processor.processMessage(message)
+    assert published == [body]
+    assert (processor.answer_cache.get(processor._cache_key(message)) is not None) == cached
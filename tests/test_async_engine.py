@@ -0,0 +1,116 @@
+import asyncio
+import queue
+import threading
+
+from models.message import TextMessage
+from processors.dialogue import AsyncDialogueEngine
+
+
+def make_message(sender_id, content):
+    return TextMessage(sender_id=sender_id, sender="susu", chat_type="private", character=1,
+                       message_type="text", message_send_time="2025-04-21 12:00:00", content=content)
+
+
+class FakeProcessor:
+    """模拟耗时的 rag 请求，记录处理顺序与最大并发数"""
+
+    def __init__(self):
+        self.handled = []
+        self.running = 0
+        self.peak = 0
+        self.running_senders = set()
+        self.overlapped_sender = False
+
+    async def async_processMessage(self, message):
+        if message.sender_id in self.running_senders:
+            self.overlapped_sender = True
+        self.running_senders.add(message.sender_id)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        self.running_senders.discard(message.sender_id)
+        self.handled.append((message.sender_id, message.content))
+
+
+def run_engine(messages, max_concurrency):
+    message_queue = queue.Queue()
+    for message in messages:
+        message_queue.put(message)
+    processor = FakeProcessor()
+    engine = AsyncDialogueEngine(processor, message_queue, max_concurrency=max_concurrency)
+    runner = threading.Thread(target=engine.run)
+    runner.start()
+    while len(processor.handled) < len(messages):
+        threading.Event().wait(0.01)
+    engine.stop()
+    runner.join(timeout=5)
+    return processor
+
+
+def test_messages_of_one_sender_stay_in_order():
+    messages = [make_message(sender_id, str(i)) for i in range(5) for sender_id in (1, 2, 3)]
+    processor = run_engine(messages, max_concurrency=10)
+    for sender_id in (1, 2, 3):
+        contents = [content for sender, content in processor.handled if sender == sender_id]
+        assert contents == [str(i) for i in range(5)]
+    assert not processor.overlapped_sender
+
+
+def test_different_senders_run_concurrently_within_limit():
+    messages = [make_message(sender_id, "你好") for sender_id in range(20)]
+    processor = run_engine(messages, max_concurrency=4)
+    assert processor.peak == 4
+
+
+def test_cancelled_sender_task_returns_its_slots():
+    class BlockingProcessor:
+        async def async_processMessage(self, message):
+            await asyncio.Event().wait()
+
+    async def main():
+        engine = AsyncDialogueEngine(BlockingProcessor(), queue.Queue(), max_concurrency=2, max_pending=3)
+        engine.loop = asyncio.get_running_loop()
+        engine._semaphore = asyncio.Semaphore(engine.max_concurrency)
+        for i in range(3):
+            # 读取线程每投递一条消息占用一个名额
+            assert engine._slots.acquire(blocking=False)
+            engine._dispatch(make_message(1, str(i)))
+        await asyncio.sleep(0.01)
+        task = engine._tasks[1]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return engine
+
+    engine = asyncio.run(main())
+    assert not engine._tasks
+    assert all(engine._slots.acquire(blocking=False) for _ in range(3))
+
+
+def test_failure_bookkeeping_errors_do_not_stop_the_engine():
+    class FailingProcessor:
+        def __init__(self):
+            self.handled = []
+
+        async def async_processMessage(self, message):
+            if isinstance(message, str):
+                raise ValueError("不是 TextMessage")
+            self.handled.append(message.content)
+
+    def on_failure(message, error):
+        raise AttributeError("'str' object has no attribute 'retry_attempt'")
+
+    message_queue = queue.Queue()
+    message_queue.put("测试消息")
+    message_queue.put(make_message(None, "之后的消息"))
+    processor = FailingProcessor()
+    engine = AsyncDialogueEngine(processor, message_queue, max_concurrency=2, on_failure=on_failure)
+    runner = threading.Thread(target=engine.run)
+    runner.start()
+    for _ in range(500):
+        if processor.handled:
+            break
+        threading.Event().wait(0.01)
+    engine.stop()
+    runner.join(timeout=5)
+    assert processor.handled == ["之后的消息"]
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import pytest
+
+from api.RagClient import AsyncRagClient, RagClient
+from api.RagClient.models import ChatMessage, CreateChat
+from benchmarks.stubs import RagServerStub
+from globals.global_variable import GlobalVariable
+
+
+@pytest.fixture
+def rag_server(monkeypatch):
+    server = RagServerStub(delay=0.3).start()
+    monkeypatch.setattr(GlobalVariable, 'config', {'categories': {'rag_setting': {'url': server.url, 'pool_size': 4}}})
+    monkeypatch.setattr(RagClient, '_pool', None)
+    yield server
+    server.stop()
+
+
+def test_concurrent_calls_share_the_pool(rag_server):
+    async def main():
+        results = await asyncio.gather(*(AsyncRagClient.create_conversation(CreateChat("测试")) for _ in range(4)))
+        await AsyncRagClient.close()
+        return results
+
+    start = time.monotonic()
+    assert asyncio.run(main()) == [(1, 'default')] * 4
+    # 4 个请求并发进行，而不是依次等待 4 × 0.3 秒
+    assert time.monotonic() - start < 1.0
+    assert rag_server.connections == 4
+
+
+def test_deadline_and_cancellation(rag_server):
+    async def main():
+        assert await AsyncRagClient.post_chat(ChatMessage(1, "你好"), timeout=0.05) is None
+        assert await AsyncRagClient.list_chats(deadline=time.monotonic() - 1) is None
+        task = asyncio.ensure_future(AsyncRagClient.post_chat(ChatMessage(1, "你好")))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        res = await AsyncRagClient.list_chats()
+        await AsyncRagClient.close()
+        return res
+
+    assert asyncio.run(main()).json()['data']['id'] == 1
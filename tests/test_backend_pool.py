@@ -0,0 +1,42 @@
+from api.RagClient import RagClient
+from api.RagClient.BackendPool import BackendPool
+from api.RagClient.models import ChatMessage, CreateChat
+from benchmarks.stubs import RagServerStub
+from globals.global_variable import GlobalVariable
+
+
+def make_pool(*weights):
+    backends = [{'name': f'rag-{i}', 'url': f'http://127.0.0.1:{9000 + i}', 'weight': weight}
+                for i, weight in enumerate(weights)]
+    return BackendPool.from_setting({'backends': backends, 'health_check_interval': 0})
+
+
+def test_pick_prefers_least_outstanding_per_weight_and_skips_unavailable():
+    pool = make_pool(1, 2)
+    first, second = pool.backends
+    first.outstanding, second.outstanding = 1, 2
+    assert pool.pick() is second  # (2 + 1) / 2 < (1 + 1) / 1
+    second.healthy = False
+    assert pool.pick() is first
+    first.healthy = False
+    assert pool.pick() is first  # 全部不可用时交给默认后端的熔断器处理
+    assert pool.get('rag-1') is second
+    assert pool.get(None) is first and pool.get('removed') is first
+
+
+def test_conversations_stick_to_the_backend_that_created_them(monkeypatch):
+    servers = [RagServerStub().start(), RagServerStub().start()]
+    try:
+        backends = [{'name': f'rag-{i}', 'url': server.url} for i, server in enumerate(servers)]
+        setting = {'url': '', 'backends': backends, 'health_check_interval': 0}
+        monkeypatch.setattr(GlobalVariable, 'config', {'categories': {'rag_setting': setting}})
+        monkeypatch.setattr(RagClient, '_pool', None)
+        routes = [RagClient.create_conversation(CreateChat("测试")) for _ in range(2)]
+        assert sorted(backend for _, backend in routes) == ['rag-0', 'rag-1']
+        for _ in range(3):
+            assert RagClient.post_chat(ChatMessage(1, "你好"), 'rag-1').status_code == 200
+        assert RagClient.stats()['rag-1']['requests'] == 4
+        assert RagClient.stats()['rag-0']['requests'] == 1
+    finally:
+        for server in servers:
+            server.stop()
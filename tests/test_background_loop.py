@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import BackgroundLoop
+
+
+async def current_thread(delay=0.0):
+    await asyncio.sleep(delay)
+    return threading.current_thread().name
+
+
+def test_sync_callers_share_one_loop_thread_with_bounded_concurrency():
+    peak = []
+
+    async def work():
+        peak.append(BackgroundLoop._running)
+        return await current_thread(0.01)
+
+    with ThreadPoolExecutor(max_workers=BackgroundLoop.max_concurrency + 20) as pool:
+        names = set(pool.map(lambda _: BackgroundLoop.run(work(), timeout=5), range(BackgroundLoop.max_concurrency + 20)))
+    assert names == {'background-loop'}
+    assert max(peak) <= BackgroundLoop.max_concurrency
+
+
+def test_call_from_running_loop_does_not_deadlock():
+    async def caller():
+        return BackgroundLoop.run(current_thread(), timeout=5)
+
+    assert asyncio.run(caller()) == 'background-loop'
+
+
+def test_timeout_cancels_and_reentry_is_rejected():
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        BackgroundLoop.run(slow(), timeout=0.05)
+    assert time.monotonic() - start < 1
+    assert cancelled.wait(1)
+
+    async def reenter():
+        with pytest.raises(RuntimeError):
+            BackgroundLoop.run(current_thread())
+        return True
+
+    assert BackgroundLoop.run(reenter(), timeout=5)
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from api.RagClient import AsyncRagClient, CircuitBreaker, RagClient
+from api.RagClient.models import ChatMessage
+from benchmarks.stubs import RagServerStub
+from globals.global_variable import GlobalVariable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_on_errors_and_recovers_through_half_open_probes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(window=10, min_requests=4, error_rate=0.5, open_duration=5, half_open_probes=2, clock=clock)
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success, 0.1)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    clock.now = 6
+    assert breaker.allow() and breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record(True, 0.1)
+    breaker.record(True, 0.1)
+    assert breaker.state == 'closed'
+
+    clock.now = 20
+    for _ in range(4):
+        breaker.allow()
+        breaker.record(True, 0.1)
+    assert breaker.p95() == 0.1
+
+
+def test_opens_on_slow_calls_and_failed_probe_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_requests=2, slow_call_duration=1, slow_call_rate=0.5, open_duration=5, clock=clock)
+    breaker.record(True, 0.1)
+    breaker.record(True, 2.0)
+    assert breaker.state == 'open'
+    clock.now = 6
+    assert breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+
+
+@pytest.fixture
+def slow_rag(monkeypatch):
+    server = RagServerStub(delay=0.3).start()
+    setting = {'url': server.url, 'hedge': True, 'breaker_min_requests': 1}
+    monkeypatch.setattr(GlobalVariable, 'config', {'categories': {'rag_setting': setting}})
+    monkeypatch.setattr(RagClient, '_pool', None)
+    yield server
+    server.stop()
+
+
+def test_open_breaker_fails_fast_and_hedge_sends_second_request(slow_rag):
+    breaker = RagClient.pool().get().breaker
+    breaker.record(True, 0.05)  # p95 = 0.05 秒，请求 0.3 秒未返回时发送对冲请求
+
+    async def main():
+        chats = await AsyncRagClient.list_chats()
+        reply = await AsyncRagClient.post_chat(ChatMessage(1, "你好"))
+        await AsyncRagClient.close()
+        return chats, reply
+
+    chats, reply = asyncio.run(main())
+    assert chats.status_code == 200 and reply.status_code == 200
+    # 读请求被对冲，对话请求不是幂等的，只发送一次
+    assert slow_rag.requests == 3
+
+    breaker = RagClient.pool().get().breaker = CircuitBreaker(min_requests=1)
+    breaker.record(True, 0.05)
+    assert RagClient._get_chat_list().status_code == 200
+    assert RagClient.post_chat(ChatMessage(1, "你好")).status_code == 200
+    assert slow_rag.requests == 6
+
+    for _ in range(4):
+        breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+    assert RagClient.post_chat(ChatMessage(1, "你好")) is None
@@ -0,0 +1,70 @@
+import queue
+
+from models.message import TextMessage
+from processors.dialogue import CoalescingQueue, MessageCoalescer
+from utils.metrics import Metrics
+
+
+def make_message(sender_id, content, message_type="text"):
+    return TextMessage(sender_id=sender_id, sender="susu", chat_type="private", character=1,
+                       message_type=message_type, message_send_time="2025-04-21 12:00:00", content=content)
+
+
+def test_burst_is_merged_after_quiet_window():
+    coalescer = MessageCoalescer(window=1.0, max_wait=5.0)
+    assert coalescer.add(make_message(1, "在吗"), now=0.0) == []
+    assert coalescer.add(make_message(1, "我今天好累"), now=0.5) == []
+    assert coalescer.pop_due(now=1.2) == []
+    merged = coalescer.pop_due(now=1.5)
+    assert [message.content for message in merged] == ["在吗\n我今天好累"]
+    assert coalescer.next_deadline() is None
+
+
+def test_senders_are_coalesced_separately():
+    coalescer = MessageCoalescer(window=1.0)
+    coalescer.add(make_message(1, "a"), now=0.0)
+    coalescer.add(make_message(2, "b"), now=0.1)
+    assert [message.sender_id for message in coalescer.pop_due(now=1.05)] == [1]
+    assert [message.sender_id for message in coalescer.pop_due(now=1.1)] == [2]
+
+
+def test_max_wait_and_max_messages_bound_the_delay():
+    coalescer = MessageCoalescer(window=1.0, max_wait=2.0, max_messages=3)
+    for i, now in enumerate([0.0, 0.9, 1.8]):
+        ready = coalescer.add(make_message(1, str(i)), now=now)
+    assert [message.content for message in ready] == ["0\n1\n2"]
+
+    coalescer.add(make_message(2, "x"), now=10.0)
+    coalescer.add(make_message(2, "y"), now=11.5)
+    assert coalescer.next_deadline() == 12.0
+
+
+def test_non_text_message_flushes_pending_text_first():
+    coalescer = MessageCoalescer(window=1.0)
+    coalescer.add(make_message(1, "看看这个"), now=0.0)
+    ready = coalescer.add(make_message(1, "", message_type="image"), now=0.2)
+    assert [message.message_type for message in ready] == ["text", "image"]
+
+
+def test_saved_calls_are_counted():
+    Metrics.reset()
+    coalescer = MessageCoalescer(window=1.0)
+    for content in ["1", "2", "3"]:
+        coalescer.add(make_message(1, content), now=0.0)
+    coalescer.pop_due(now=2.0)
+    counters = Metrics.snapshot()['counters']
+    assert counters['coalesce.merged'] == 1
+    assert counters['coalesce.saved_calls'] == 2
+
+
+def test_coalescing_queue_passes_through_when_disabled():
+    source = queue.Queue()
+    assert CoalescingQueue.wrap(source, {'coalesce_window': 0}) is source
+
+
+def test_coalescing_queue_merges_burst():
+    source = queue.Queue()
+    for content in ["1", "2"]:
+        source.put(make_message(1, content))
+    wrapped = CoalescingQueue.wrap(source, {'coalesce_window': 0.05})
+    assert wrapped.get(timeout=1).content == "1\n2"
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.RagClient import RagClient
+from api.RagClient.models import CreateChat
+from benchmarks.stubs import RagServerStub
+from globals.global_variable import GlobalVariable
+from utils import AdaptiveLimiter
+from utils.concurrency_limiter import TokenBudget
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_waiters_are_granted_in_order_when_slots_free():
+    limiter = AdaptiveLimiter('test', initial=1, adaptive=False)
+    first = limiter.acquire()
+    order = []
+
+    def wait(name):
+        permit = limiter.acquire(timeout=2)
+        order.append(name)
+        limiter.release(permit)
+
+    threads = [threading.Thread(target=wait, args=(name,)) for name in 'ab']
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    assert limiter.stats()['waiting'] == 2
+    with pytest.raises(TimeoutError):
+        limiter.acquire(timeout=0.01)
+    limiter.release(first)
+    for thread in threads:
+        thread.join(2)
+    assert order == ['a', 'b']
+    assert limiter.stats()['inflight'] == 0
+
+
+def test_limit_grows_when_used_and_backs_off_on_overload():
+    limiter = AdaptiveLimiter('test', initial=4, max_limit=8, backoff=0.5)
+    for _ in range(40):
+        permits = [limiter.acquire() for _ in range(limiter.limit)]
+        for permit in permits:
+            limiter.release(permit, True, latency=0.1)
+    assert limiter.limit == 8
+    limiter.release(limiter.acquire(), False)
+    assert limiter.limit == 4
+    # 同一耗时周期内的过载只降一次
+    limiter.release(limiter.acquire(), True, latency=1.0)
+    assert limiter.limit == 4
+    limiter._last_decrease = 0
+    limiter.release(limiter.acquire(), True, latency=1.0)
+    assert limiter.limit == 2
+
+
+def test_cancelled_async_waiter_gives_its_slot_back():
+    limiter = AdaptiveLimiter('test', initial=1, adaptive=False)
+
+    async def main():
+        held = await limiter.acquire_async()
+        waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        next_waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        limiter.release(held)
+        limiter.release(await asyncio.wait_for(next_waiter, 1))
+        assert waiter.cancelled()
+
+    asyncio.run(main())
+    assert limiter.stats() == {'limit': 1, 'inflight': 0, 'waiting': 0, 'baseline': None}
+
+
+def test_token_budget_delays_once_spent():
+    clock = FakeClock()
+    budget = TokenBudget(600, clock=clock)
+    assert budget.reserve(500) == 0
+    assert budget.reserve(200) == pytest.approx(10)
+    budget.adjust(-300)
+    clock.now = 5
+    assert budget.available() == pytest.approx(250)
+
+
+@pytest.fixture
+def rag_server(monkeypatch):
+    server = RagServerStub(delay=0.1).start()
+    monkeypatch.setattr(GlobalVariable, 'config', {'categories': {'rag_setting': {
+        'url': server.url, 'adaptive_concurrency': True, 'concurrency_initial': 2, 'concurrency_max': 2}}})
+    monkeypatch.setattr(RagClient, '_pool', None)
+    yield server
+    server.stop()
+
+
+def test_rag_client_queues_above_the_limit(rag_server):
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda _: RagClient.create_conversation(CreateChat("测试")), range(6)))
+    assert results == [(1, 'default')] * 6
+    assert rag_server.connections == 2
+    assert RagClient.stats()['default']['limiter']['limit'] == 2
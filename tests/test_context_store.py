@@ -0,0 +1,51 @@
+import multiprocessing
+
+from processors.dialogue import MemoryContextStore, SQLiteContextStore
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryContextStore(capacity=2)
+    store[1] = 101
+    store[2] = 102
+    assert store[1] == 101  # 1 变为最近使用
+    store[3] = 103
+    assert 2 not in store
+    assert store.get(1) == 101 and store.get(3) == 103
+
+
+def test_sqlite_store_survives_restart_and_lru_eviction(tmp_path):
+    path = str(tmp_path / "conversations.db")
+    store = SQLiteContextStore(path, capacity=1)
+    store[1] = 101
+    store[2] = 102  # 1 被挤出 LRU，但仍在数据库中
+    assert store[1] == 101
+    assert SQLiteContextStore(path)[2] == 102
+    assert len(SQLiteContextStore(path)) == 2
+
+
+def _write_mapping(path, sender_id, conversation_id):
+    SQLiteContextStore(path)[sender_id] = conversation_id
+
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "conversations.db")
+    store = SQLiteContextStore(path)
+    assert store.get(42) is None
+    worker = multiprocessing.Process(target=_write_mapping, args=(path, 42, 4242))
+    worker.start()
+    worker.join()
+    assert store[42] == 4242
+
+
+def test_sqlite_store_keeps_backend_and_migrates_old_table(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "conversations.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE conversations (sender_id TEXT PRIMARY KEY, conversation_id INTEGER NOT NULL)")
+    conn.execute("INSERT INTO conversations VALUES ('1', 101)")
+    conn.commit()
+    conn.close()
+    store = SQLiteContextStore(path)
+    assert store.get_route(1) == (101, None)
+    store.set(2, 202, 'rag-2')
+    assert SQLiteContextStore(path).get_route(2) == (202, 'rag-2')
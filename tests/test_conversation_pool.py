@@ -0,0 +1,27 @@
+import itertools
+import time
+
+from processors.dialogue import ConversationPool
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_pool_hands_out_precreated_conversations_and_refills():
+    ids = itertools.count(100)
+    pool = ConversationPool(lambda: next(ids), size=2)
+    pool.start()
+    assert wait_for(lambda: pool.spare() == 2)
+    assert pool.take() == 100
+    assert wait_for(lambda: pool.spare() == 2)
+    assert pool.take() == 101
+
+
+def test_disabled_or_failing_pool_returns_none():
+    assert ConversationPool(lambda: 1, size=0).take() is None
+    failing = ConversationPool(lambda: None, size=2, retry_delay=0.01)
+    assert failing.take() is None
@@ -0,0 +1,48 @@
+import asyncio
+
+from utils import EmbeddingBatcher
+
+
+class FakeEmbeddings:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def create(self, model, input):
+        self.calls.append((model, list(input)))
+        await asyncio.sleep(0)
+        if self.error:
+            raise self.error
+        return {'data': [{'index': i, 'embedding': [float(len(text))]} for i, text in enumerate(input)]}
+
+
+def test_concurrent_calls_share_one_request_and_dedupe():
+    fake = FakeEmbeddings()
+    batcher = EmbeddingBatcher(fake.create, max_batch=64, max_wait=0.01)
+
+    async def run():
+        return await asyncio.gather(*(batcher.embed(text, 'm') for text in ['a', 'bb', 'a', 'ccc']))
+
+    assert asyncio.run(run()) == [[1.0], [2.0], [1.0], [3.0]]
+    assert fake.calls == [('m', ['a', 'bb', 'ccc'])]
+
+
+def test_full_batches_are_sent_without_waiting_and_models_are_separate():
+    fake = FakeEmbeddings()
+    batcher = EmbeddingBatcher(fake.create, max_batch=2, max_wait=10)
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(
+            *(batcher.embed(str(i), 'm') for i in range(4)), batcher.embed('x', 'n'), batcher.embed('y', 'n')), 1)
+
+    assert len(asyncio.run(run())) == 6
+    assert sorted(fake.calls) == [('m', ['0', '1']), ('m', ['2', '3']), ('n', ['x', 'y'])]
+
+
+def test_failure_reaches_every_caller():
+    batcher = EmbeddingBatcher(FakeEmbeddings(error=RuntimeError('boom')).create, max_wait=0.01)
+
+    async def run():
+        return await asyncio.gather(batcher.embed('a', 'm'), batcher.embed('b', 'm'), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(run())] == ['boom', 'boom']
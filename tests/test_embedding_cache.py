@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+from utils import APIWrapper, EmbeddingCache
+from utils.embedding_cache import slot_size
+
+
+def test_vectors_round_trip_across_instances(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    assert cache.get('m', '你好') is None
+    cache.put('m', '你好', [0.5, 0.25, -1.0])
+    cache.put('m', '在吗', [1.0, 2.0])
+    assert cache.get('m', '你好') == [0.5, 0.25, -1.0]
+    assert cache.get('other', '你好') is None
+    cache.close()
+
+    reader = EmbeddingCache(str(tmp_path), readonly=True)
+    assert reader.get('m', '在吗') == [1.0, 2.0]
+    reader.put('m', '新文本', [1.0])
+    assert reader.get('m', '新文本') is None
+    assert EmbeddingCache(str(tmp_path / 'missing'), readonly=True).get('m', '你好') is None
+
+
+def test_least_recently_used_vectors_are_evicted_and_slots_reused(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_bytes=slot_size(4) * 2)
+    cache.put('m', 'a', [1.0] * 4)
+    cache.put('m', 'b', [2.0] * 4)
+    assert cache.get('m', 'a') is not None
+    cache.put('m', 'c', [3.0] * 4)
+    assert cache.get('m', 'b') is None
+    assert cache.get('m', 'a') == [1.0] * 4
+    assert cache.get('m', 'c') == [3.0] * 4
+    assert cache.stats()['entries'] == 2
+    assert (tmp_path / 'vectors-4.f32').stat().st_size == slot_size(4) * 2
+
+
+def test_api_wrapper_skips_the_request_on_cache_hit(tmp_path):
+    wrapper = APIWrapper('test', 'http://127.0.0.1:9', embedding_cache=EmbeddingCache(str(tmp_path)))
+    wrapper.embedding_cache.put('m', '你好', [0.5])
+    assert asyncio.run(wrapper.async_embedding('你好', 'm')) == [0.5]
+
+
+def test_api_wrapper_reads_and_writes_the_cache_off_the_event_loop(tmp_path):
+    threads = []
+
+    class RecordingCache(EmbeddingCache):
+        def get(self, model, text):
+            threads.append(threading.get_ident())
+            return super().get(model, text)
+
+        def put(self, model, text, vector):
+            threads.append(threading.get_ident())
+            super().put(model, text, vector)
+
+    wrapper = APIWrapper('test', 'http://127.0.0.1:9', embedding_cache=RecordingCache(str(tmp_path)))
+
+    async def embed(text, model_name):
+        return [1.0]
+
+    wrapper.embedding_batcher.embed = embed
+
+    async def main():
+        loop_thread = threading.get_ident()
+        assert await wrapper.async_embedding('你好', 'm') == [1.0]
+        return loop_thread
+
+    loop_thread = asyncio.run(main())
+    assert len(threads) == 2 and loop_thread not in threads
+    assert wrapper.embedding_cache.get('m', '你好') == [1.0]
@@ -0,0 +1,61 @@
+import queue
+
+from benchmarks.stubs import RagServerStub
+from api.HttpUtil import Http
+from dispatch import ShardedQueue
+from utils.metrics import Metrics
+
+
+class LocalManager:
+    Queue = queue.Queue
+
+
+def test_pooled_http_reuses_one_connection():
+    server = RagServerStub().start()
+    try:
+        http = Http(server.url, pool_size=2)
+        for _ in range(5):
+            assert http.post('/api/chat/conversation_chat', json={'content': 'hi'}).json()['data']['id'] == 1
+        stats = http.stats()
+        assert stats['requests'] == 5
+        assert stats['connections_opened'] == 1
+        assert stats['idle_connections'] == 1
+        assert server.connections == 1
+        http.close()
+    finally:
+        server.stop()
+
+
+def test_pool_figures_are_published_through_metrics():
+    Metrics.reset()
+    server = RagServerStub().start()
+    try:
+        http = Http(server.url, pool_size=2, metrics_prefix='rag.backend.rag-0')
+        for _ in range(3):
+            http.post('/api/chat/conversation_chat', json={'content': 'hi'})
+        http.close()
+    finally:
+        server.stop()
+    counters = Metrics.snapshot()['counters']
+    assert counters['rag.backend.rag-0.requests'] == 3
+    assert counters['rag.backend.rag-0.connections_opened'] == 1
+
+    # 工作进程中的指标按 dialogue-<分片> 汇总到 /system_manager/dialogue_stats
+    Metrics.bind(None, 'dialogue-0')
+    try:
+        backend = ShardedQueue(LocalManager()).stats()['shards'][0]['backends']['rag-0']
+    finally:
+        Metrics.bind(None, 'main')
+    assert (backend['requests'], backend['connections_opened'], backend['latency']['count']) == (3, 1, 3)
+    Metrics.reset()
+
+
+def test_http2_falls_back_without_h2():
+    try:
+        import h2  # noqa: F401
+        expected = 'httpx-http2'
+    except ImportError:
+        expected = 'requests'
+    http = Http('http://127.0.0.1', http2=True)
+    assert http.backend == expected
+    http.close()
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from benchmarks.stubs import STREAM_CHUNKS, RagServerStub
+from models.message import TextMessage
+from processors.dialogue import LlmFastPath, LlmRouter
+
+
+def text_message(content):
+    return TextMessage(sender_id=1, sender="u", chat_type="private", character=1, message_type="text",
+                       message_send_time="2024-04-21 12:00:00", content=content)
+
+
+def test_router_sends_chit_chat_to_llm():
+    router = LlmRouter(max_length=10)
+    assert router.route("你好呀") == 'llm'
+    assert router.route("哈哈哈，晚安") == 'llm'
+    assert router.route("你还记得我养的猫吗") == 'rag'
+    assert router.route("今天天气怎么样") == 'rag'
+    assert router.route("这是一条超过十个字的比较长的消息") == 'rag'
+    assert LlmRouter(rag_keywords=["猫"]).route("我的猫") == 'rag'
+
+
+def test_fast_path_is_disabled_without_setting_or_key():
+    llm_settings = {'settings': {'api_key': {'value': ''}, 'model': {'value': 'm'}}}
+    assert LlmFastPath.from_setting({}, llm_settings) is None
+    assert LlmFastPath.from_setting({'llm_fast_path': True}, llm_settings) is None
+
+
+@pytest.fixture
+def llm_server():
+    server = RagServerStub().start()
+    yield server
+    server.stop()
+
+
+def test_fast_path_streams_from_configured_model(llm_server):
+    llm_settings = {'settings': {'api_key': {'value': 'k'}, 'base_url': {'value': llm_server.url + '/v1'},
+                                 'model': {'value': 'deepseek-ai/DeepSeek-V3'}}}
+    fast_path = LlmFastPath.from_setting({'llm_fast_path': True, 'llm_fast_path_system_prompt': '你是小助手'}, llm_settings)
+    assert fast_path.accepts(text_message("你好"))
+    assert not fast_path.accepts(text_message("你还记得我吗"))
+
+    async def main():
+        deltas = [delta async for delta in fast_path.stream(text_message("你好"), timeout=5)]
+        await fast_path.client.async_client.close()
+        return deltas
+
+    assert asyncio.run(main()) == STREAM_CHUNKS
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from processors.memory import MemoryRetrieval, VectorIndex
+
+
+def random_vectors(count, dim=16, seed=1):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def clustered_vectors(count, dim=16, clusters=50, seed=1):
+    """接近真实嵌入的分布：围绕若干主题中心的向量"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    return (centers[rng.integers(clusters, size=count)] + 0.3 * rng.standard_normal((count, dim))).astype(np.float32)
+
+
+def test_exact_search_insert_update_and_delete():
+    index = VectorIndex(dim=3)
+    index.add(1, [1, 0, 0])
+    index.add(2, [0, 1, 0])
+    index.add(3, [1, 1, 0])
+    assert [memory_id for memory_id, _ in index.search([1, 0.1, 0], k=2)] == [1, 3]
+    index.add(1, [0, 0, 1])
+    assert index.search([0, 0, 5], k=1)[0][0] == 1
+    assert index.search([0, 0, 5], k=1)[0][1] == pytest.approx(1.0)
+    assert index.remove(3) and not index.remove(3)
+    assert len(index) == 2 and 3 not in index
+    assert {memory_id for memory_id, _ in index.search([1, 1, 1], k=10)} == {1, 2}
+
+
+def test_switches_to_ivf_above_threshold_and_keeps_recall():
+    vectors = clustered_vectors(3000)
+    index = VectorIndex(dim=16, threshold=1000, nprobe=8)
+    index.add_many(range(3000), vectors)
+    assert index.approximate and len(index) == 3000
+    exact = VectorIndex(dim=16, threshold=10 ** 6)
+    exact.add_many(range(3000), vectors)
+    queries = vectors[::150] + 0.1 * random_vectors(20, seed=2)
+    hits = sum(len({i for i, _ in index.search(q, 10)} & {i for i, _ in exact.search(q, 10)}) for q in queries)
+    assert hits / 200 >= 0.8
+    assert index.search(vectors[42], 1)[0][0] == 42
+    for memory_id in range(2600):
+        index.remove(memory_id)
+    assert not index.approximate and len(index) == 400
+
+
+def test_indexes_persist_per_user(tmp_path):
+    vectors = random_vectors(300)
+    retrieval = MemoryRetrieval(str(tmp_path), dim=16, threshold=100)
+    retrieval.add_many('u1', range(300), vectors)
+    retrieval.add('u2', 7, vectors[0])
+    retrieval.flush()
+
+    reloaded = MemoryRetrieval(str(tmp_path), dim=16, threshold=100)
+    assert reloaded.index('u1').approximate
+    assert reloaded.search('u1', vectors[5], 1)[0][0] == 5
+    assert reloaded.search('u2', vectors[0], 1)[0][0] == 7
+    assert reloaded.search('u3', vectors[0], 1) == []
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from api.MqttClient import MqttPublisher
+from benchmarks.stubs import MqttBrokerStub
+from globals.global_variable import GlobalVariable
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def broker():
+    broker = MqttBrokerStub().start()
+    yield broker
+    broker.stop()
+
+
+def test_messages_buffered_before_connect_are_replayed_and_acked(broker):
+    publisher = MqttPublisher(broker.host, broker.port)
+    acked = []
+    for i in range(5):
+        assert publisher.publish('1', str(i), on_ack=lambda i=i: acked.append(i))
+    assert publisher.pending() == 5
+    publisher.start()
+    try:
+        assert wait_for(lambda: len(acked) == 5)
+        assert sorted(acked) == [0, 1, 2, 3, 4]
+        assert publisher.pending() == 0
+        assert broker.published == 5
+    finally:
+        publisher.stop()
+
+
+def test_full_buffer_drops_oldest_and_calls_on_drop():
+    publisher = MqttPublisher('127.0.0.1', 1, buffer_size=2)
+    dropped = []
+    assert publisher.publish('1', 'a', on_drop=lambda: dropped.append('a'))
+    assert publisher.publish('1', 'b', on_drop=lambda: dropped.append('b'))
+    assert not publisher.publish('1', 'c', on_drop=lambda: dropped.append('c'))
+    assert dropped == ['a']
+    assert [item[1] for item in publisher.buffer] == ['b', 'c']
+
+
+def test_reconnects_and_flushes_messages_published_while_broker_was_down(broker):
+    publisher = MqttPublisher(broker.host, broker.port, reconnect_max_delay=1)
+    publisher.start()
+    try:
+        assert wait_for(publisher.is_connected)
+        port = broker.port
+        broker.stop()
+        assert wait_for(lambda: not publisher.is_connected())
+        acked = []
+        publisher.publish('1', 'offline', on_ack=lambda: acked.append(True))
+        assert publisher.pending() == 1
+
+        restarted = MqttBrokerStub(port=port).start()
+        try:
+            assert wait_for(lambda: acked == [True], timeout=15)
+            assert restarted.published == 1
+        finally:
+            restarted.stop()
+    finally:
+        publisher.stop()
+
+
+def test_failed_start_is_not_cached(broker, monkeypatch):
+    monkeypatch.setattr(MqttPublisher, '_instance', None)
+    monkeypatch.setattr(MqttPublisher, '_pid', None)
+    monkeypatch.setattr(GlobalVariable, 'config', {'categories': {'mqtt_setting': {'ip': ''}}})
+    with pytest.raises(ValueError):
+        MqttPublisher.get_instance()
+    assert MqttPublisher._instance is None
+
+    monkeypatch.setattr(GlobalVariable, 'config',
+                        {'categories': {'mqtt_setting': {'ip': broker.host, 'port': broker.port}}})
+    publisher = MqttPublisher.get_instance()
+    try:
+        assert wait_for(publisher.is_connected)
+    finally:
+        publisher.stop()
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from dispatch import PriorityDispatcher, ShardedQueue
+from models.message import TextMessage
+from utils.metrics import Metrics
+
+
+class LocalManager:
+    Queue = queue.Queue
+
+
+def make_message(sender_id, chat_type, content="你好"):
+    return TextMessage(sender_id=sender_id, sender="susu", chat_type=chat_type, character=1,
+                       message_type="text", message_send_time="2025-04-21 12:00:00", content=content)
+
+
+def make_dispatcher(**kwargs):
+    sharded = ShardedQueue(LocalManager(), shard_count=1, maxsize=1)
+    dispatcher = PriorityDispatcher(sharded, **kwargs)
+    dispatcher._ensure_started = lambda: None  # 测试中手动调度
+    return dispatcher
+
+
+def drain_order(dispatcher, count):
+    order = []
+    shard = dispatcher.shards[0]
+    for _ in range(count):
+        assert dispatcher.dispatch_once() == 1
+        order.append(shard.get_nowait())
+    return order
+
+
+def test_private_chats_overtake_group_flood():
+    dispatcher = make_dispatcher(class_weights={'private': 4, 'group': 1})
+    for i in range(20):
+        dispatcher.put(make_message(100 + i, 'group'))
+    for i in range(4):
+        dispatcher.put(make_message(i, 'private'))
+    order = [message.chat_type for message in drain_order(dispatcher, 8)]
+    # 群聊先到，但私聊权重更高，仍能很快插队；群聊也不会饿死
+    assert order.count('private') == 4
+    assert order.count('group') == 4
+    assert dispatcher.qsize() == 16
+
+
+def test_sender_weight_and_fifo_within_class():
+    dispatcher = make_dispatcher(class_weights={'private': 1}, sender_weights={42: 3})
+    for i in range(3):
+        dispatcher.put(make_message(1, 'private', str(i)))
+        dispatcher.put(make_message(42, 'private', str(i)))
+    order = drain_order(dispatcher, 6)
+    assert [m.content for m in order if m.sender_id == 1] == ['0', '1', '2']
+    assert [m.sender_id for m in order[:3]].count(42) >= 2
+    assert dispatcher.classify(make_message(42, 'private')) == 'sender:42'
+
+
+def test_pending_limit_and_wait_percentiles():
+    Metrics.reset()
+    dispatcher = make_dispatcher(maxsize=2)
+    dispatcher.put(make_message(1, 'private'))
+    dispatcher.put(make_message(2, 'group'))
+    with pytest.raises(queue.Full):
+        dispatcher.put(make_message(3, 'group'), block=False)
+    drain_order(dispatcher, 2)
+    classes = dispatcher.stats()['classes']
+    assert classes['private']['wait']['count'] == 1
+    assert classes['group']['wait']['count'] == 1
+
+
+class BrokenShard(queue.Queue):
+    def put(self, item, block=True, timeout=None):
+        if item.content == "坏消息":
+            raise TypeError("cannot pickle")
+        super().put(item, block, timeout)
+
+
+class DeadLetters:
+    def __init__(self):
+        self.messages = []
+
+    def add(self, message, error, attempts):
+        self.messages.append((message, error))
+
+
+def test_failed_put_goes_to_dead_letters_and_is_not_counted():
+    Metrics.reset()
+    dead_letters = DeadLetters()
+    dispatcher = make_dispatcher(dead_letters=dead_letters)
+    dispatcher.sharded.shards[0] = BrokenShard(1)
+    dispatcher.put(make_message(1, 'private', "坏消息"))
+    dispatcher.put(make_message(2, 'private'))
+    assert dispatcher.dispatch_once() == 1
+    assert dispatcher.shards[0].get_nowait().sender_id == 2
+    assert [message.content for message, _ in dead_letters.messages] == ["坏消息"]
+    assert dispatcher.qsize() == 0
+    assert dispatcher.stats()['classes']['private']['wait']['count'] == 1
+
+
+def test_dispatch_thread_blocks_until_shard_has_room():
+    dispatcher = PriorityDispatcher(ShardedQueue(LocalManager(), shard_count=2, maxsize=1))
+    for i in range(3):
+        dispatcher.put(make_message(1, 'private', str(i)))
+    shard = dispatcher.shards[dispatcher.sharded.shard_of(make_message(1, 'private'))]
+    received = []
+    consumer = threading.Thread(target=lambda: received.extend(shard.get(timeout=5).content for _ in range(3)))
+    consumer.start()
+    consumer.join(10)
+    assert received == ['0', '1', '2']
+    deadline = time.monotonic() + 5
+    while dispatcher.qsize() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert dispatcher.qsize() == 0
+    dispatcher.stop()
+
+
+def test_only_dead_dispatch_threads_are_replaced():
+    dispatcher = PriorityDispatcher(ShardedQueue(LocalManager(), shard_count=2, maxsize=1))
+    dispatcher.put(make_message(1, 'private'))
+    first, second = dispatcher._threads
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    dispatcher._threads[1] = dead  # 模拟 1 号分片的调度线程已退出
+    dispatcher.put(make_message(2, 'private'))
+    assert dispatcher._threads[0] is first
+    assert dispatcher._threads[1] not in (dead, second) and dispatcher._threads[1].is_alive()
+    threads = list(dispatcher._threads)
+    dispatcher.put(make_message(3, 'private'))
+    assert dispatcher._threads == threads  # 全部在运行时不重新启动
+    dispatcher.stop()
+    second.join(5)
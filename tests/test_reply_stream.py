@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+from api.RagClient import AsyncRagClient, RagClient
+from api.RagClient.RagClient import STREAM_DONE, parse_stream_line, text_of
+from api.RagClient.models import ChatMessage
+from benchmarks.stubs import RagServerStub, STREAM_CHUNKS
+from globals.global_variable import GlobalVariable
+from processors.dialogue import ReplyStream, SentenceSplitter
+
+REPLY = ['你好呀，今天过得怎么样？', '我刚刚在看书，是一本关于星空的书。', '要一起聊聊吗？']
+
+
+def test_splitter_waits_for_trailing_punctuation():
+    splitter = SentenceSplitter(max_chars=10)
+    assert splitter.feed("你好！") == []
+    assert splitter.feed("？今天") == ["你好！？"]
+    assert splitter.feed("一二三四五六七八九十") == ["今天一二三四五六七八"]
+    assert splitter.flush() == "九十"
+
+
+def test_reply_stream_numbers_sentences_and_ends_with_final_marker():
+    published = []
+    stream = ReplyStream(lambda payload, on_ack: published.append((json.loads(payload), on_ack)))
+    for chunk in STREAM_CHUNKS:
+        stream.feed(chunk)
+    on_ack = object()
+    assert stream.finish(on_ack) == REPLY
+    assert [payload for payload, _ in published] == [
+        {'seq': 0, 'content': REPLY[0], 'final': False},
+        {'seq': 1, 'content': REPLY[1], 'final': False},
+        {'seq': 2, 'content': REPLY[2], 'final': False},
+        {'seq': 3, 'content': '', 'final': True},
+    ]
+    assert [ack for _, ack in published] == [None, None, None, on_ack]
+
+
+def test_parse_stream_line():
+    assert parse_stream_line('data: {"content": "你好"}', True) == "你好"
+    assert parse_stream_line('data: {"choices": [{"delta": {"content": " hi"}}]}', True) == " hi"
+    assert parse_stream_line('data: [DONE]', True) is STREAM_DONE
+    assert parse_stream_line('event: ping', True) == ''
+    assert parse_stream_line('{"data": {"content": "好"}}', False) == "好"
+    # rag 返回完整 JSON 信封时取 data.content，而不是状态说明 message
+    assert text_of({"code": 200, "message": "success", "data": {"content": "你好呀"}}) == "你好呀"
+    assert text_of({"code": 500, "message": "internal error"}) == ""
+
+
+@pytest.fixture
+def rag_server(monkeypatch):
+    server = RagServerStub().start()
+    monkeypatch.setattr(GlobalVariable, 'config', {'categories': {'rag_setting': {'url': server.url}}})
+    monkeypatch.setattr(RagClient, '_pool', None)
+    yield server
+    server.stop()
+
+
+def test_clients_stream_chat(rag_server):
+    assert ''.join(RagClient.stream_chat(ChatMessage(1, "你好"))) == ''.join(STREAM_CHUNKS)
+
+    async def main():
+        chunks = [chunk async for chunk in AsyncRagClient.stream_chat(ChatMessage(1, "你好"))]
+        await AsyncRagClient.close()
+        return chunks
+
+    assert asyncio.run(main()) == STREAM_CHUNKS
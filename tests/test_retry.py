@@ -0,0 +1,66 @@
+import queue
+
+import pytest
+
+from dispatch import DeadLetterStore, DeliveryError, RetryingQueue, RetryScheduler
+from models.message import TextMessage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_message(sender_id, content="你好"):
+    return TextMessage(sender_id=sender_id, sender="susu", chat_type="private", character=1,
+                       message_type="text", message_send_time="2025-04-21 12:00:00", content=content)
+
+
+def test_backoff_grows_exponentially_with_jitter():
+    scheduler = RetryScheduler(base_delay=1, max_delay=10, jitter=0.5)
+    for attempt, delay in [(1, 1), (2, 2), (3, 4), (4, 8), (6, 10)]:
+        assert delay * 0.5 <= scheduler.backoff(attempt) <= delay
+
+
+def test_retry_is_returned_when_due():
+    clock = FakeClock()
+    scheduler = RetryScheduler(base_delay=2, jitter=0, clock=clock)
+    source = queue.Queue()
+    retrying = RetryingQueue(source, scheduler)
+    message = make_message(1)
+    scheduler.failed(message, DeliveryError("rag 超时"))
+    assert retrying.qsize() == 1
+    with pytest.raises(queue.Empty):
+        retrying.get(block=False)
+    clock.now = 2
+    assert retrying.get(block=False) is message
+    assert message.retry_attempt == 1
+
+
+def test_dead_letter_after_max_attempts_and_replay(tmp_path):
+    store = DeadLetterStore(str(tmp_path / "dead_letters.db"))
+    scheduler = RetryScheduler(max_attempts=2, base_delay=0, dead_letters=store)
+    message = make_message(7, "在吗")
+    scheduler.failed(message, DeliveryError("rag 超时"))
+    assert scheduler.pending() == 1
+    scheduler.failed(scheduler.pop_due(), DeliveryError("rag 超时"))
+    assert scheduler.pending() == 0
+
+    items = store.list()
+    assert len(items) == 1
+    assert items[0]['attempts'] == 2
+    assert items[0]['message']['content'] == "在吗"
+    assert "rag 超时" in items[0]['error']
+    assert [m.content for m in store.pop([items[0]['id']])] == ["在吗"]
+    assert store.count() == 0
+
+
+def test_non_message_failure_goes_straight_to_dead_letters(tmp_path):
+    store = DeadLetterStore(str(tmp_path / "dead_letters.db"))
+    scheduler = RetryScheduler(dead_letters=store)
+    scheduler.failed("测试消息", Exception("无法处理"))
+    assert scheduler.pending() == 0
+    assert store.pop() == ["测试消息"]
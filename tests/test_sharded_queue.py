@@ -0,0 +1,75 @@
+import multiprocessing
+import queue
+
+import pytest
+
+from dispatch import ShardedQueue
+from models.message import TextMessage
+from utils.metrics import Metrics
+
+
+class LocalManager:
+    """用线程队列代替 Manager，避免测试时启动 manager 进程"""
+    Queue = queue.Queue
+
+
+def make_message(sender_id, content="你好"):
+    return TextMessage(sender_id=sender_id, sender="susu", chat_type="private", character=1,
+                       message_type="text", message_send_time="2025-04-21 12:00:00", content=content)
+
+
+@pytest.fixture
+def sharded():
+    return ShardedQueue(LocalManager(), shard_count=4, maxsize=100)
+
+
+def test_same_sender_same_shard(sharded):
+    for content in ["1", "2", "3"]:
+        sharded.put(make_message(42, content))
+    shard = sharded.shards[sharded.shard_of(make_message(42))]
+    assert [shard.get().content for _ in range(3)] == ["1", "2", "3"]
+    assert sharded.qsize() == 0
+
+
+def test_senders_spread_over_shards(sharded):
+    for sender_id in range(200):
+        sharded.put(make_message(sender_id))
+    depths = sharded.depths()
+    assert sum(depths) == 200
+    assert all(depth > 0 for depth in depths)
+
+
+def test_message_without_sender_goes_to_first_shard(sharded):
+    sharded.put("测试消息")
+    assert sharded.depths()[0] == 1
+
+
+def test_stats_reports_every_shard(sharded):
+    sharded.put(make_message(1))
+    stats = sharded.stats()
+    assert stats['worker_count'] == 4
+    assert stats['queue_size'] == 100
+    assert [shard['shard'] for shard in stats['shards']] == [0, 1, 2, 3]
+    assert sum(shard['depth'] for shard in stats['shards']) == 1
+
+
+def _worker(shared):
+    Metrics.reset()  # fork 继承了测试进程中的指标
+    Metrics.bind(shared, "dialogue-1")
+    for _ in range(3):
+        Metrics.mark('dialogue.throughput')
+    Metrics.flush()
+
+
+def test_stats_reads_processed_count_flushed_by_worker(sharded, monkeypatch):
+    with multiprocessing.Manager() as manager:
+        shared = manager.dict()
+        worker = multiprocessing.get_context('fork').Process(target=_worker, args=(shared,))
+        worker.start()
+        worker.join(10)
+        monkeypatch.setattr(Metrics, '_shared', None)
+        monkeypatch.setattr(Metrics, '_scope', 'main')
+        Metrics.bind(shared, 'main')
+        stats = sharded.stats()
+    assert stats['shards'][1]['processed'] == 3
+    assert stats['shards'][0]['processed'] == 0
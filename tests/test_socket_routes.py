@@ -0,0 +1,152 @@
+import asyncio
+import json
+import queue
+
+import pytest
+
+from dispatch import ReplyChannel
+from globals.global_variable import GlobalVariable
+from network.routes.socket_routes import (ERROR, HELLO, MESSAGE, PING, PONG, REPLY, RESULT, WELCOME,
+                                          SocketAdapter, encode_frame, read_frame)
+
+
+def make_data(sender_id, content="你好"):
+    return {"sender_id": sender_id, "sender": "susu", "chat_type": "private", "character": 1,
+            "message_type": "text", "message_send_time": "2025-04-21 12:00:00", "content": content}
+
+
+@pytest.fixture
+def inbox(monkeypatch):
+    messages = queue.Queue()
+    monkeypatch.setattr(GlobalVariable, 'to_message_get_queue', messages)
+    monkeypatch.setattr(GlobalVariable, 'admission', None)
+    return messages
+
+
+@pytest.fixture
+def replies():
+    reply_queue = queue.Queue()
+    ReplyChannel.bind(reply_queue)
+    yield reply_queue
+    ReplyChannel.bind(None)
+
+
+async def connect(adapter, client_id="wechat-1"):
+    reader, writer = await asyncio.open_connection('127.0.0.1', adapter.port)
+    writer.write(encode_frame(HELLO, 0, {"client_id": client_id}))
+    kind, _, payload = await read_frame(reader, 1 << 20)
+    assert kind == WELCOME
+    return reader, writer
+
+
+def test_batch_is_enqueued_and_replies_are_pushed_on_the_same_connection(inbox, replies):
+    async def main():
+        adapter = SocketAdapter(port=0)
+        await adapter.start({}, replies)
+        reader, writer = await connect(adapter)
+        # 流水线：连续发送两帧，不等待 RESULT
+        writer.write(encode_frame(MESSAGE, 7, [make_data(1), make_data(2, "")]))
+        writer.write(encode_frame(PING, 8))
+        kind, request_id, payload = await read_frame(reader, 1 << 20)
+        assert (kind, request_id) == (RESULT, 7)
+        results = json.loads(payload)['results']
+        assert results[0] == {'status': 'ok'}
+        assert results[1]['code'] == 400
+        assert (await read_frame(reader, 1 << 20))[:2] == (PONG, 8)
+
+        # 工作进程一侧发送回复
+        message = inbox.get_nowait()
+        assert message.reply_to == 'socket:wechat-1:7'
+        ReplyChannel.publish(message, json.dumps({"code": 200, "data": {"content": "你好呀"}}, ensure_ascii=False))
+        kind, request_id, payload = await asyncio.wait_for(read_frame(reader, 1 << 20), 5)
+        assert (kind, request_id) == (REPLY, 7)
+        assert json.loads(payload) == {"sender_id": 1, "reply": {"code": 200, "data": {"content": "你好呀"}}}
+        writer.close()
+        await adapter.close()
+
+    asyncio.run(main())
+
+
+def test_reading_pauses_at_max_inflight(inbox, replies):
+    async def main():
+        adapter = SocketAdapter(port=0)
+        await adapter.start({'max_inflight': 1}, replies)
+        reader, writer = await connect(adapter)
+        writer.write(encode_frame(MESSAGE, 1, make_data(1)))
+        writer.write(encode_frame(MESSAGE, 2, make_data(1)))
+        assert (await read_frame(reader, 1 << 20))[:2] == (RESULT, 1)
+        # 第一条消息回复之前不读取第二帧
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(read_frame(reader, 1 << 20), 0.3)
+        assert inbox.qsize() == 1
+        ReplyChannel.publish(inbox.get_nowait(), '"ok"')
+        frames = [(await asyncio.wait_for(read_frame(reader, 1 << 20), 5))[:2] for _ in range(2)]
+        assert sorted(frames) == [(RESULT, 2), (REPLY, 1)]
+        writer.close()
+        await adapter.close()
+
+    asyncio.run(main())
+
+
+def test_replies_are_buffered_until_the_client_reconnects(inbox, replies):
+    async def main():
+        adapter = SocketAdapter(port=0)
+        await adapter.start({}, replies)
+        reader, writer = await connect(adapter)
+        writer.write(encode_frame(MESSAGE, 3, make_data(1)))
+        assert (await read_frame(reader, 1 << 20))[:2] == (RESULT, 3)
+        writer.close()
+        while adapter.clients:
+            await asyncio.sleep(0.01)
+
+        ReplyChannel.publish(inbox.get_nowait(), '"ok"')
+        while 'wechat-1' not in adapter._offline:
+            await asyncio.sleep(0.01)
+        reader, writer = await connect(adapter)
+        assert (await asyncio.wait_for(read_frame(reader, 1 << 20), 5))[:2] == (REPLY, 3)
+        writer.close()
+        await adapter.close()
+
+    asyncio.run(main())
+
+
+def test_first_frame_must_be_hello(inbox):
+    async def main():
+        adapter = SocketAdapter(port=0)
+        await adapter.start({'auth_token': 'secret'})
+        reader, writer = await asyncio.open_connection('127.0.0.1', adapter.port)
+        writer.write(encode_frame(HELLO, 0, {"client_id": "qq-1", "token": "wrong"}))
+        assert (await read_frame(reader, 1 << 20))[0] == ERROR
+        assert await reader.read() == b''
+        await adapter.close()
+
+    asyncio.run(main())
+
+
+class BrokenQueue:
+    def put(self, message, block=True, timeout=None):
+        if message.sender_id == 2:
+            raise OSError("磁盘已满")
+
+
+def test_bad_items_get_per_item_errors_and_do_not_leak_inflight(monkeypatch, replies):
+    monkeypatch.setattr(GlobalVariable, 'to_message_get_queue', BrokenQueue())
+    monkeypatch.setattr(GlobalVariable, 'admission', None)
+
+    async def main():
+        adapter = SocketAdapter(port=0)
+        await adapter.start({}, replies)
+        reader, writer = await connect(adapter)
+        writer.write(encode_frame(MESSAGE, 5, [make_data(1, 123), make_data(2), make_data(3)]))
+        kind, request_id, payload = await asyncio.wait_for(read_frame(reader, 1 << 20), 5)
+        assert (kind, request_id) == (RESULT, 5)
+        results = json.loads(payload)['results']
+        assert (results[0]['code'], results[0]['message']) == (400, 'content必须为字符串')
+        assert results[1]['code'] == 500
+        assert results[2] == {'status': 'ok'}
+        # 只有入队成功的一条占用在途配额
+        assert adapter._pending('wechat-1') == 1
+        writer.close()
+        await adapter.close()
+
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+import multiprocessing
+
+from dispatch import EncodedQueue, MessageCodec, QueueTransport
+from models.message import TextMessage
+
+
+def make_message(**overrides):
+    data = dict(sender_id=12345, sender='小明', chat_type='private', character=1,
+                message_type='text', message_send_time='2024-01-01 12:00:00', content='你好\n在吗')
+    data.update(overrides)
+    return TextMessage(**data)
+
+
+def test_codec_round_trip():
+    codec = MessageCodec()
+    message = make_message()
+    data = codec.encode(message)
+    assert data[:1] == MessageCodec.TEXT
+    assert codec.decode(data) == message
+
+
+def test_codec_falls_back_to_pickle():
+    codec = MessageCodec()
+    # 非 TextMessage 对象以及字段类型与声明不符的消息都退回 pickle
+    for message in ("测试消息", make_message(sender_id='abc')):
+        data = codec.encode(message)
+        assert data[:1] == MessageCodec.PICKLE
+        assert codec.decode(data) == message
+
+
+def test_codec_non_str_fields_fall_back_to_pickle():
+    codec = MessageCodec()
+    for message in (make_message(content=123, message_send_time=456), make_message(content='\ud800')):
+        data = codec.encode(message)
+        assert data[:1] == MessageCodec.PICKLE
+        assert codec.decode(data) == message
+
+
+def test_encoded_queue():
+    message_queue = QueueTransport('queue').Queue(10)
+    assert isinstance(message_queue, EncodedQueue)
+    message_queue.put(make_message(content='第一条'))
+    message_queue.put(make_message(content='第二条'))
+    assert message_queue.get(timeout=5).content == '第一条'
+    assert message_queue.get(timeout=5).content == '第二条'
+
+
+def _consume(message_queue):
+    message_queue.get(timeout=5)
+
+
+def test_encoded_queue_depth_without_sem_getvalue():
+    message_queue = QueueTransport('queue').Queue(10)
+
+    def unsupported():
+        raise NotImplementedError  # macOS 上 multiprocessing.Queue.qsize() 的行为
+
+    message_queue.queue.qsize = unsupported
+    for i in range(3):
+        message_queue.put(make_message(content=str(i)))
+    assert message_queue.qsize() == 3
+    # 其他进程取走消息后深度同步减少
+    worker = multiprocessing.Process(target=_consume, args=(message_queue,))
+    worker.start()
+    worker.join(10)
+    assert worker.exitcode == 0
+    assert message_queue.qsize() == 2
@@ -0,0 +1,79 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from dispatch import Acknowledger, DurableQueue, MessageLog, ShardedQueue
+from models.message import TextMessage
+from processors.dialogue import MessageCoalescer
+
+
+class LocalManager:
+    Queue = queue.Queue
+
+
+def make_message(sender_id, content="你好"):
+    return TextMessage(sender_id=sender_id, sender="susu", chat_type="private", character=1,
+                       message_type="text", message_send_time="2025-04-21 12:00:00", content=content)
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / "queue" / "messages.db")
+
+
+def test_unacked_messages_survive_restart(log_path):
+    log = MessageLog(log_path)
+    ids = [log.append(make_message(1, str(i))) for i in range(3)]
+    log.ack([ids[1]])
+    log.close()
+
+    log = MessageLog(log_path)
+    replayed = log.unacked()
+    assert [(m.message_id, m.content) for m in replayed] == [(ids[0], '0'), (ids[2], '2')]
+    assert log.append(make_message(1)) > ids[-1]
+    log.close()
+
+
+def test_concurrent_appends_are_group_committed(log_path):
+    log = MessageLog(log_path)
+    threads = [threading.Thread(target=lambda: [log.append(make_message(i)) for i in range(20)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert log.pending() == 160
+    log.close()
+
+
+def test_durable_queue_acks_rejected_messages(log_path):
+    sharded = ShardedQueue(LocalManager(), shard_count=1, maxsize=1)
+    durable = DurableQueue(sharded, MessageLog(log_path))
+    durable.put(make_message(1), block=False)
+    with pytest.raises(queue.Full):
+        durable.put(make_message(1), block=False)
+    durable.log.close()
+    assert [m.sender_id for m in MessageLog(log_path).unacked()] == [1]
+
+
+def test_merged_message_acks_every_source(log_path):
+    log = MessageLog(log_path)
+    ack_queue = queue.Queue()
+    log.attach_ack_queue(ack_queue)
+    Acknowledger.bind(ack_queue)
+    try:
+        coalescer = MessageCoalescer(window=1, max_messages=3)
+        merged = []
+        for i in range(3):
+            message = make_message(1, str(i))
+            log.append(message)
+            merged = coalescer.add(message, now=0)
+        Acknowledger.ack(merged[0])
+    finally:
+        Acknowledger.bind(None)
+    deadline = time.monotonic() + 5
+    while log.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    log.close()
+    assert MessageLog(log_path).unacked() == []
@@ -0,0 +1,72 @@
+import http.client
+import threading
+import time
+
+import pytest
+
+from network.routes.wsgi_server import WsgiServer, create_wsgi_server
+
+
+slow_started = threading.Event()
+
+
+def slow_app(environ, start_response):
+    if environ['PATH_INFO'] == '/slow':
+        slow_started.set()
+        time.sleep(0.5)
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+    return [b'ok']
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', path)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+@pytest.mark.parametrize('kind', ['waitress', 'threaded'])
+def test_serve_and_graceful_shutdown(kind):
+    if kind == 'waitress':
+        pytest.importorskip('waitress')
+    server = create_wsgi_server(slow_app, '127.0.0.1', 0, {'server': kind, 'threads': 4})
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    assert get(server.port, '/') == (200, b'ok')
+
+    # 停止时进行中的请求正常完成
+    results = []
+    slow = threading.Thread(target=lambda: results.append(get(server.port, '/slow')))
+    slow_started.clear()
+    slow.start()
+    assert slow_started.wait(5)
+    assert server.shutdown(timeout=5)
+    slow.join(5)
+    assert results == [(200, b'ok')]
+    serving.join(5)
+    assert not serving.is_alive()
+
+    with pytest.raises(OSError):
+        get(server.port, '/')
+
+
+def test_waitress_stops_accepting_before_shutdown_waits():
+    pytest.importorskip('waitress')
+    server = create_wsgi_server(slow_app, '127.0.0.1', 0, {'server': 'waitress'})
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    assert get(server.port, '/') == (200, b'ok')
+    # 返回时监听套接字已在 I/O 循环中关闭
+    server._stop_accepting()
+    with pytest.raises(OSError):
+        get(server.port, '/')
+    assert server.shutdown(timeout=5)
+    serving.join(5)
+    assert not serving.is_alive()
+
+
+def test_unknown_server():
+    with pytest.raises(TypeError):
+        WsgiServer(slow_app, '127.0.0.1', 0)
+    with pytest.raises(ValueError):
+        create_wsgi_server(slow_app, '127.0.0.1', 0, {'server': 'gunicorn'})
@@ -10,6 +10,11 @@ from .Io_util import IoUtil
 from .logger_util import LoggerConfig, debuggerLogger, infoLogger
 from .Io_util import IoUtil
 from .api_client import APIWrapper, APIEmbeddings
+from .background_loop import BackgroundLoop
+from .concurrency_limiter import AdaptiveLimiter
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache
+from .metrics import Metrics
 
 def dir_path():
     """获取项目根目录路径
@@ -39,4 +44,9 @@ __all__ = [
     'dir_path',  # 目录路径验证函数
     'APIWrapper',  # API封装类
     'APIEmbeddings',  # API嵌入类
+    'BackgroundLoop',  # 同步调用异步接口的后台事件循环
+    'AdaptiveLimiter',  # 自适应并发限制类
+    'EmbeddingBatcher',  # 嵌入请求合并类
+    'EmbeddingCache',  # 嵌入向量磁盘缓存类
+    'Metrics',  # 运行时指标收集类
 ]
\ No newline at end of file
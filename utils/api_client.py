@@ -6,9 +6,16 @@ import logging
 import json
 import openai
 import asyncio
+import contextlib
 import re
+import time
 from typing import Any, Dict, List, Optional, Union
 
+from utils.background_loop import BackgroundLoop
+from utils.concurrency_limiter import AdaptiveLimiter, estimate_tokens
+from utils.embedding_batcher import EmbeddingBatcher
+from utils.embedding_cache import EmbeddingCache
+
 # 设置日志
 logger = logging.getLogger('api_wrapper')
 
@@ -17,16 +24,31 @@ class APIWrapper:
     API调用包装器类，提供统一的API调用接口
     """
     
-    def __init__(self, api_key: str, base_url: str = None):
+    def __init__(self, api_key: str, base_url: str = None, embedding_batch_size: int = 64,
+                 embedding_batch_wait: float = 0.005, embedding_cache: Optional[EmbeddingCache] = None,
+                 sync_timeout: float = 30, model: str = "gpt-3.5-turbo",
+                 limiter: Optional[AdaptiveLimiter] = None):
         """
         初始化API包装器
         
         Args:
             api_key: API密钥
             base_url: API基础URL，默认为OpenAI官方API
+            embedding_batch_size: 单次嵌入请求最多合并的文本数
+            embedding_batch_wait: 嵌入请求合并的最长等待时间（秒）
+            embedding_cache: 嵌入向量磁盘缓存，命中时不再请求API
+            sync_timeout: 同步接口等待结果的最长时间（秒）
+            model: 对话补全默认使用的模型
+            limiter: 该服务商的自适应并发限制器（含每分钟 token 预算），为空时不限制
         """
         self.api_key = api_key
         self.base_url = base_url
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_batch_wait = embedding_batch_wait
+        self.embedding_cache = embedding_cache
+        self.sync_timeout = sync_timeout
+        self.model = model
+        self.limiter = limiter
         
         # 初始化OpenAI客户端
         self._init_client()
@@ -47,16 +69,25 @@ class APIWrapper:
                 api_key=self.api_key,
                 base_url=self.base_url
             )
+            # 异步客户端，等待响应时不阻塞事件循环
+            self.async_client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url
+            )
             logger.info(f"成功初始化API客户端，基础URL: {self.base_url or '默认OpenAI'}")
         except Exception as e:
             logger.error(f"初始化API客户端失败: {str(e)}")
             # 创建一个空客户端，避免程序崩溃
             self.client = object()
+            self.async_client = object()
             
     def _create_interfaces(self):
         """创建API接口"""
         # 嵌入API
         self.embeddings = APIEmbeddings(self)
+        # 合并并发的嵌入请求
+        self.embedding_batcher = EmbeddingBatcher(
+            self.embeddings.create, self.embedding_batch_size, self.embedding_batch_wait)
         
     def handle_api_error(self, error: Exception) -> Dict:
         """
@@ -78,10 +109,38 @@ class APIWrapper:
         except:
             return {"error": str(error)}
             
+    @contextlib.asynccontextmanager
+    async def _limited(self, tokens: int):
+        """
+        经过并发限制器发送一次请求，未设置限制器时直接发送
+        
+        yield 的字典中可以写入 tokens_used（实际用量）与 latency（计入限制器的耗时，默认为整个请求）
+        """
+        if self.limiter is None:
+            yield {}
+            return
+        permit = await self.limiter.acquire_async(tokens)
+        usage = {}
+        success = True
+        try:
+            yield usage
+        except (openai.RateLimitError, openai.APITimeoutError):
+            success = False
+            raise
+        except BaseException:
+            success = None
+            raise
+        finally:
+            self.limiter.release(permit, success, usage.get('tokens_used'), usage.get('latency'))
+            
     async def async_embedding(self, text: str, model_name: str = "text-embedding-3-large") -> List[float]:
         """
         异步获取嵌入向量
         
+        设置了 embedding_cache 时先查询磁盘缓存，未命中的结果写入缓存
+        缓存的读写（SQLite 索引与向量文件）在线程池中执行，不阻塞事件循环
+        并发的调用在 embedding_batch_wait 时间内合并为一次 embeddings.create(input=[...]) 请求
+        
         Args:
             text: 输入文本
             model_name: 模型名称
@@ -90,17 +149,17 @@ class APIWrapper:
             List[float]: 嵌入向量
         """
         try:
-            # 调用嵌入API
-            response = await self.embeddings.create(model=model_name, input=text)
-            
-            # 解析结果
-            if hasattr(response, 'data') and len(response.data) > 0:
-                return response.data[0].embedding
-            elif isinstance(response, dict) and 'data' in response:
-                return response['data'][0]['embedding']
-            else:
-                logger.error(f"无法解析嵌入向量响应: {response}")
-                return None
+            loop = asyncio.get_running_loop()
+            if self.embedding_cache is not None:
+                embedding = await loop.run_in_executor(None, self.embedding_cache.get, model_name, text)
+                if embedding is not None:
+                    return embedding
+            embedding = await self.embedding_batcher.embed(text, model_name)
+            if embedding is None:
+                logger.error(f"嵌入向量响应中没有该文本的结果")
+            elif self.embedding_cache is not None:
+                await loop.run_in_executor(None, self.embedding_cache.put, model_name, text, embedding)
+            return embedding
         except Exception as e:
             logger.error(f"获取嵌入向量失败: {str(e)}")
             return None
@@ -109,6 +168,9 @@ class APIWrapper:
         """
         同步获取嵌入向量
         
+        在进程共用的后台事件循环线程中执行 async_embedding，可以在任何线程中调用，
+        但不能在后台事件循环的协程中调用（请直接 await async_embedding）
+        
         Args:
             text: 输入文本
             model_name: 模型名称
@@ -117,28 +179,13 @@ class APIWrapper:
             List[float]: 嵌入向量
         """
         try:
-            # 获取或创建事件循环
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-            # 在事件循环中运行异步方法
-            if loop.is_running():
-                # 如果循环正在运行，使用run_coroutine_threadsafe
-                future = asyncio.run_coroutine_threadsafe(
-                    self.async_embedding(text, model_name), loop)
-                return future.result()
-            else:
-                # 否则直接运行直到完成
-                return loop.run_until_complete(
-                    self.async_embedding(text, model_name))
+            return BackgroundLoop.run(self.async_embedding(text, model_name), self.sync_timeout)
         except Exception as e:
             logger.error(f"同步获取嵌入向量失败: {str(e)}")
             return None
 
-    async def async_completion(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1000) -> Dict:
+    async def async_completion(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1000,
+                               model: Optional[str] = None) -> Dict:
         """
         异步获取完成响应
         
@@ -146,19 +193,21 @@ class APIWrapper:
             prompt: 提示词
             temperature: 温度参数
             max_tokens: 最大token数
+            model: 模型名称，默认为构造时指定的模型
             
         Returns:
             Dict: 包含响应内容的字典
         """
         try:
-            # 调用OpenAI API
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+            # 调用OpenAI API（异步客户端，等待响应时不占用线程）
+            async with self._limited(estimate_tokens(prompt) + max_tokens) as usage:
+                response = await self.async_client.chat.completions.create(
+                    model=model or self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+                usage['tokens_used'] = getattr(getattr(response, 'usage', None), 'total_tokens', None)
             
             # 解析结果
             if hasattr(response, 'choices') and len(response.choices) > 0:
@@ -178,6 +227,48 @@ class APIWrapper:
             logger.error(f"获取完成响应失败: {str(e)}")
             return {"content": f"API调用错误: {str(e)}"}
 
+    async def async_stream_completion(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                                      max_tokens: int = 1000, model: Optional[str] = None,
+                                      timeout: Optional[float] = None):
+        """
+        流式获取完成响应，逐段返回生成的文本
+        
+        所有调用共用异步客户端的连接池；请求失败时抛出异常
+        
+        Args:
+            messages: 对话消息列表 [{"role": ..., "content": ...}]
+            temperature: 温度参数
+            max_tokens: 最大token数
+            model: 模型名称，默认为构造时指定的模型
+            timeout: 建立连接与相邻两段文本之间的最长等待时间（秒）
+            
+        Yields:
+            str: 新生成的文本
+        """
+        prompt_tokens = sum(estimate_tokens(message.get("content", "")) for message in messages)
+        async with self._limited(prompt_tokens + max_tokens) as usage:
+            start = time.monotonic()
+            stream = await self.async_client.chat.completions.create(
+                model=model or self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                timeout=timeout
+            )
+            generated = []
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not generated:
+                            # 总耗时取决于回复长度，限制器按首段文本的耗时判断是否过载
+                            usage['latency'] = time.monotonic() - start
+                        generated.append(chunk.choices[0].delta.content)
+                        yield generated[-1]
+            finally:
+                usage['tokens_used'] = prompt_tokens + estimate_tokens(''.join(generated))
+                await stream.close()
+
 class APIEmbeddings:
     """嵌入API接口"""
     
@@ -202,11 +293,14 @@ class APIEmbeddings:
             Any: API响应
         """
         try:
-            # 调用OpenAI API
-            response = self.wrapper.client.embeddings.create(
-                model=model,
-                input=input
-            )
+            # 调用OpenAI API（异步客户端）
+            texts = [input] if isinstance(input, str) else input
+            async with self.wrapper._limited(sum(estimate_tokens(text) for text in texts)) as usage:
+                response = await self.wrapper.async_client.embeddings.create(
+                    model=model,
+                    input=input
+                )
+                usage['tokens_used'] = getattr(getattr(response, 'usage', None), 'total_tokens', None)
             return response
         except Exception as e:
             logger.error(f"创建嵌入向量失败: {str(e)}")
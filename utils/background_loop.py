@@ -0,0 +1,85 @@
+"""后台事件循环：
+    同步代码调用异步接口时使用，每个进程只启动一个后台线程运行事件循环，所有同步调用方共用
+    - 不会在调用方线程创建新的事件循环，也不会在调用方所在的事件循环上阻塞等待（避免死锁）
+    - 同时在后台循环中执行的协程数量不超过 max_concurrency，超出的调用排队等待
+    - 每次调用可指定超时，超时后取消协程并抛出 TimeoutError
+    fork 出的子进程不会继承线程，首次调用时在子进程中重新启动
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Any, Coroutine, Optional
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger("BackgroundLoop")
+
+
+class BackgroundLoop(object):
+    max_concurrency = 64  # 同时执行的协程数量上限
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _thread: Optional[threading.Thread] = None
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _running = 0  # 正在执行的协程数量（只在后台线程中修改）
+    _pid = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _ensure(cls) -> asyncio.AbstractEventLoop:
+        """返回当前进程的后台事件循环，尚未启动时启动"""
+        if cls._pid == os.getpid():
+            return cls._loop
+        with cls._lock:
+            if cls._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    cls._semaphore = asyncio.Semaphore(cls.max_concurrency)
+                    cls._running = 0
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                cls._thread = threading.Thread(target=run, name="background-loop", daemon=True)
+                cls._thread.start()
+                ready.wait()
+                cls._loop = loop
+                cls._pid = os.getpid()
+        return cls._loop
+
+    @classmethod
+    async def _bounded(cls, coro: Coroutine) -> Any:
+        async with cls._semaphore:
+            cls._running += 1
+            Metrics.gauge('background_loop.running', cls._running)
+            try:
+                return await coro
+            finally:
+                cls._running -= 1
+                Metrics.gauge('background_loop.running', cls._running)
+
+    @classmethod
+    def run(cls, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """在后台事件循环中执行协程并阻塞等待结果
+
+        Args:
+            coro: 要执行的协程
+            timeout: 最长等待时间（秒，含排队时间），None 为不限制
+
+        Raises:
+            RuntimeError: 在后台事件循环线程中调用（会导致死锁）
+            TimeoutError: 超时，协程已被取消
+        """
+        if threading.current_thread() is cls._thread and cls._pid == os.getpid():
+            coro.close()
+            raise RuntimeError("不能在后台事件循环线程中同步等待，请直接 await")
+        future = asyncio.run_coroutine_threadsafe(cls._bounded(coro), cls._ensure())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            Metrics.incr('background_loop.timeout')
+            raise TimeoutError(f"后台事件循环中的调用超过 {timeout} 秒未完成")
@@ -0,0 +1,260 @@
+"""自适应并发限制：
+    固定的并发上限不是太低（后端没有用满）就是太高（触发服务商限流 429 与超时），
+    AdaptiveLimiter 根据观测到的耗时与限流自动调整同时在途的请求数（AIMD）：
+    - 耗时不超过基线耗时（近期最小耗时）的 latency_tolerance 倍且在途请求接近上限时，上限加 1 / 上限（约每轮加 1）
+    - 耗时超过基线的 latency_tolerance 倍，或请求被限流（429）、超时，上限乘以 backoff，每个耗时周期最多减一次
+    - 达到上限的请求按先后顺序排队等待，排队时间计入 limiter.<名称>.queue_seconds
+    同时可以按服务商设置每分钟 token 预算（tokens_per_minute），请求前按估算的 token 数预留，超出预算时等待，
+    返回后按实际用量修正
+    同步调用（线程）与异步调用（事件循环）可以共用同一个限制器
+"""
+import asyncio
+import collections
+import threading
+import time
+from typing import Any, Deque, Dict, Optional
+
+from utils.metrics import Metrics
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数：中文约 1 字 1 token（3 字节），英文约 4 字符 1 token"""
+    return max(1, len((text or '').encode('utf-8')) // 3)
+
+
+class TokenBudget:
+    """每分钟 token 预算（令牌桶，允许预支，预支的部分由之后的请求等待补足）"""
+
+    def __init__(self, tokens_per_minute: float, clock=time.monotonic):
+        self.rate = float(tokens_per_minute) / 60
+        self.capacity = float(tokens_per_minute)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        """预留 tokens 个 token，返回需要等待的时间（秒）"""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, tokens: int) -> None:
+        """按实际用量修正预留的数量（正数为多用，负数为退还）"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - tokens)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class Permit:
+    """一次获得的并发许可，请求结束后交给 AdaptiveLimiter.release"""
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.start = time.monotonic()
+
+
+class AdaptiveLimiter:
+    """按耗时与限流自动调整的并发限制器（线程安全）"""
+
+    def __init__(self, name: str, initial: int = 10, min_limit: int = 1, max_limit: int = 100,
+                 latency_tolerance: float = 2.0, backoff: float = 0.7, tokens_per_minute: float = 0,
+                 adaptive: bool = True):
+        """
+        Args:
+            name: 指标名前缀（limiter.<name>.*）
+            initial: 初始并发上限
+            min_limit: 并发上限的下限
+            max_limit: 并发上限的上限
+            latency_tolerance: 耗时超过基线耗时的多少倍视为过载
+            backoff: 过载时上限乘以该值
+            tokens_per_minute: 每分钟 token 预算，0 为不限制
+            adaptive: False 时固定为 initial，只排队不调整
+        """
+        self.name = name
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.latency_tolerance = float(latency_tolerance)
+        self.backoff = float(backoff)
+        self.adaptive = adaptive
+        self.budget = TokenBudget(tokens_per_minute) if tokens_per_minute else None
+        self._limit = float(min(max(int(initial), self.min_limit), self.max_limit))
+        self._inflight = 0
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._waiters: Deque[Any] = collections.deque()  # threading.Event 或 (事件循环, future)
+        self._lock = threading.Lock()
+        Metrics.gauge(f'limiter.{name}.limit', self.limit)
+
+    @classmethod
+    def from_setting(cls, setting: dict, name: str) -> Optional['AdaptiveLimiter']:
+        """根据配置创建，adaptive_concurrency 为 false 且没有 token 预算时返回 None"""
+        setting = setting or {}
+        adaptive = bool(setting.get('adaptive_concurrency', False))
+        tokens_per_minute = setting.get('tokens_per_minute', 0) or 0
+        if not adaptive and not tokens_per_minute:
+            return None
+        if not adaptive:
+            # 只限制 token 预算，不限制并发
+            return cls(name, initial=10 ** 6, max_limit=10 ** 6, tokens_per_minute=tokens_per_minute, adaptive=False)
+        return cls(
+            name,
+            initial=setting.get('concurrency_initial', 10),
+            min_limit=setting.get('concurrency_min', 1),
+            max_limit=setting.get('concurrency_max', 100),
+            latency_tolerance=setting.get('latency_tolerance', 2.0),
+            tokens_per_minute=tokens_per_minute,
+        )
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self, tokens: int = 0, timeout: Optional[float] = None) -> Permit:
+        """阻塞直到获得许可，timeout 秒内未获得时抛出 TimeoutError"""
+        start = time.monotonic()
+        delay = self._budget_delay(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        event = None
+        with self._lock:
+            if not self._waiters and self._inflight < self.limit:
+                self._grant()
+            else:
+                event = threading.Event()
+                self._waiters.append(event)
+        if event is not None and not event.wait(timeout):
+            with self._lock:
+                if event in self._waiters:
+                    self._waiters.remove(event)
+                    Metrics.incr(f'limiter.{self.name}.timeout')
+                    raise TimeoutError(f"等待 {self.name} 并发许可超过 {timeout} 秒")
+            # 超时的同时获得了许可，按获得处理
+        return self._permit(tokens, start)
+
+    async def acquire_async(self, tokens: int = 0) -> Permit:
+        """异步等待许可，被取消时放弃排队（已获得的许可归还）"""
+        start = time.monotonic()
+        delay = self._budget_delay(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        loop = asyncio.get_running_loop()
+        future = None
+        with self._lock:
+            if not self._waiters and self._inflight < self.limit:
+                self._grant()
+            else:
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+        if future is not None:
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+                        raise
+                # 已获得许可：future 被取消时由 _resolve 归还，否则在这里归还
+                if not future.cancelled():
+                    self._release_slot()
+                raise
+        return self._permit(tokens, start)
+
+    def release(self, permit: Permit, success: Optional[bool] = True, tokens_used: Optional[int] = None,
+                latency: Optional[float] = None) -> None:
+        """请求结束后归还许可
+
+        Args:
+            success: True 为正常返回（计入耗时），False 为限流或超时（降低上限），None 为与负载无关的失败（不计入）
+            tokens_used: 实际用量，用于修正 token 预算
+            latency: 用于调整上限的耗时，默认为获得许可到归还的时间（流式请求可以传入首段文本的耗时）
+        """
+        if latency is None:
+            latency = time.monotonic() - permit.start
+        if self.budget is not None and tokens_used is not None:
+            self.budget.adjust(tokens_used - permit.tokens)
+        with self._lock:
+            if self.adaptive and success is not None:
+                self._update(latency, success)
+        self._release_slot()
+        Metrics.observe(f'limiter.{self.name}.latency', latency)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {'limit': self.limit, 'inflight': self._inflight, 'waiting': len(self._waiters),
+                     'baseline': self._baseline}
+        if self.budget is not None:
+            stats['tokens_available'] = int(self.budget.available())
+        return stats
+
+    def _budget_delay(self, tokens: int) -> float:
+        """预留 token 预算，返回需要等待的时间"""
+        delay = self.budget.reserve(tokens) if self.budget is not None and tokens else 0.0
+        if delay > 0:
+            Metrics.incr(f'limiter.{self.name}.budget_waits')
+        return delay
+
+    def _permit(self, tokens: int, start: float) -> Permit:
+        Metrics.observe(f'limiter.{self.name}.queue_seconds', time.monotonic() - start)
+        return Permit(tokens)
+
+    def _grant(self) -> None:
+        """占用一个许可（调用方需持有 _lock）"""
+        self._inflight += 1
+        Metrics.gauge(f'limiter.{self.name}.inflight', self._inflight)
+
+    def _release_slot(self) -> None:
+        """归还许可，并按上限唤醒排队的请求（许可直接转交，不会被新请求插队）"""
+        with self._lock:
+            self._inflight -= 1
+            while self._waiters and self._inflight < self.limit:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    self._grant()
+                    waiter.set()
+                    continue
+                loop, future = waiter
+                if loop.is_closed():
+                    continue
+                self._grant()
+                loop.call_soon_threadsafe(self._resolve, future)
+            Metrics.gauge(f'limiter.{self.name}.inflight', self._inflight)
+
+    def _resolve(self, future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(None)
+        else:
+            # 等待者已被取消，许可交给下一个
+            self._release_slot()
+
+    def _update(self, latency: float, success: bool) -> None:
+        """AIMD 调整上限（调用方需持有 _lock）"""
+        now = time.monotonic()
+        if success:
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            else:
+                # 基线缓慢上浮，适应后端正常的耗时变化
+                self._baseline += (latency - self._baseline) * 0.01
+        overloaded = not success or latency > self._baseline * self.latency_tolerance
+        if overloaded:
+            # 同一批在途请求只降一次，避免一次拥塞被重复惩罚
+            if now - self._last_decrease >= (self._baseline or latency):
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+                self._last_decrease = now
+                Metrics.incr(f'limiter.{self.name}.decreased')
+        elif self._inflight >= self.limit / 2:
+            # 只在并发确实被用到时增加，空闲时上限不会无限增长
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+        Metrics.gauge(f'limiter.{self.name}.limit', self.limit)
@@ -0,0 +1,75 @@
+"""嵌入请求合并模块
+
+把短时间内并发到达的 async_embedding 调用合并为一次 embeddings.create(input=[...]) 请求：
+- 第一条文本到达后最多等待 max_wait 秒，期间到达的同模型文本进入同一批
+- 一批达到 max_batch 条时立即发送，不再等待
+- 同一批中的重复文本只请求一次
+- 请求失败时该批所有调用方收到同一个异常
+每个事件循环有独立的待发送批次，不同事件循环之间互不影响
+"""
+
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from utils.metrics import Metrics
+
+
+class EmbeddingBatcher:
+    """合并并发的嵌入请求"""
+
+    def __init__(self, create: Callable[..., Awaitable[Any]], max_batch: int = 64, max_wait: float = 0.005):
+        """
+        Args:
+            create: 异步的 embeddings.create(model=..., input=[...])
+            max_batch: 单次请求最多包含的文本数
+            max_wait: 第一条文本到达后最多等待多久再发送（秒）
+        """
+        self.create = create
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait))
+        # 事件循环 -> {模型: [(文本, future)]}
+        self._pending: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, List[Tuple[str, asyncio.Future]]]]" = weakref.WeakKeyDictionary()
+
+    async def embed(self, text: str, model: str) -> List[float]:
+        """获取单条文本的嵌入向量，与同时到达的其他文本合并请求"""
+        loop = asyncio.get_running_loop()
+        pending = self._pending.setdefault(loop, {})
+        future = loop.create_future()
+        batch = pending.get(model)
+        if batch is None:
+            batch = pending[model] = []
+            loop.call_later(self.max_wait, self._flush, loop, model, batch)
+        batch.append((text, future))
+        if len(batch) >= self.max_batch:
+            self._flush(loop, model, batch)
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop, model: str, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """发送一批（定时器与批次已满可能各触发一次，只有第一次生效）"""
+        pending = self._pending.get(loop, {})
+        if pending.get(model) is not batch:
+            return
+        del pending[model]
+        loop.create_task(self._send(model, batch))
+
+    async def _send(self, model: str, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        Metrics.incr('embedding.requests')
+        Metrics.observe('embedding.batch_size', len(batch))
+        try:
+            response = await self.create(model=model, input=texts)
+            data = response.data if hasattr(response, 'data') else response['data']
+            vectors = {}
+            for position, item in enumerate(data):
+                index = getattr(item, 'index', None) if not isinstance(item, dict) else item.get('index')
+                embedding = item.embedding if hasattr(item, 'embedding') else item['embedding']
+                vectors[texts[position if index is None else index]] = embedding
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors.get(text))
@@ -0,0 +1,205 @@
+"""嵌入向量磁盘缓存：
+    以 (模型, 文本) 的哈希为键缓存嵌入向量，重复的记忆 / 知识查询不再请求远程 API
+    - 向量以 float32 存放在按维度划分的定长槽位文件（vectors-<维度>.f32）中，读取时通过 mmap 直接访问页缓存
+    - 键到槽位的索引保存在 SQLite（index.db，WAL 模式）中，记录最近使用时间
+    - 缓存总大小超过 max_bytes 时淘汰最久未使用的向量，空出的槽位留给之后的同维度向量复用
+    - 多个工作进程可以同时打开同一目录：写入在 SQLite 写事务中分配槽位，先写向量再提交索引
+      readonly 为 True 时只读，不写入也不更新使用时间
+    每个槽位以键的摘要开头，读取前后各校验一次，槽位被其他进程淘汰复用时视为未命中
+    本模块供调用方按需创建并传给 APIWrapper(embedding_cache=...)，服务本身目前没有调用嵌入接口，不会创建缓存
+"""
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger("EmbeddingCache")
+
+_KEY_SIZE = 16  # 槽位开头的键摘要长度（字节）
+_FLOAT_SIZE = array('f').itemsize
+
+
+def cache_key(model: str, text: str) -> bytes:
+    """(模型, 文本) 的摘要"""
+    return hashlib.blake2b(f"{model}\0{text}".encode('utf-8'), digest_size=_KEY_SIZE).digest()
+
+
+def slot_size(dim: int) -> int:
+    """维度为 dim 的向量占用的槽位大小（字节）"""
+    return _KEY_SIZE + dim * _FLOAT_SIZE
+
+
+class EmbeddingCache:
+    """基于 mmap 与 SQLite 索引的嵌入向量缓存（线程安全，可在多个进程间共享）"""
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024, readonly: bool = False):
+        """
+        Args:
+            path: 缓存目录
+            max_bytes: 缓存向量的总大小上限（字节）
+            readonly: 只读打开，目录不存在时所有查询均未命中
+        """
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._files: Dict[int, int] = {}  # 维度 -> 文件描述符
+        self._maps: Dict[int, mmap.mmap] = {}  # 维度 -> 只读映射
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """按进程打开索引与向量文件，fork 出的子进程不能复用父进程的连接（调用方需持有 _lock）"""
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        self._files, self._maps = {}, {}
+        index = os.path.join(self.path, 'index.db')
+        if self.readonly:
+            if not os.path.exists(index):
+                return None
+            self._conn = sqlite3.connect(f"file:{index}?mode=ro", uri=True, check_same_thread=False, timeout=10)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            self._conn = sqlite3.connect(index, check_same_thread=False, timeout=10, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, slot INTEGER NOT NULL, last_used REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS slots (dim INTEGER PRIMARY KEY, next INTEGER NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS free_slots (dim INTEGER NOT NULL, slot INTEGER NOT NULL, PRIMARY KEY (dim, slot))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('bytes', 0)")
+        self._pid = os.getpid()
+        return self._conn
+
+    def _file(self, dim: int) -> int:
+        fd = self._files.get(dim)
+        if fd is None:
+            name = os.path.join(self.path, f'vectors-{dim}.f32')
+            fd = self._files[dim] = os.open(name, os.O_RDONLY if self.readonly else os.O_RDWR | os.O_CREAT, 0o644)
+        return fd
+
+    def _map(self, dim: int, end: int) -> Optional[mmap.mmap]:
+        """返回至少覆盖到 end 字节的只读映射，文件已被其他进程扩展时重新映射"""
+        mapped = self._maps.get(dim)
+        if mapped is not None and len(mapped) >= end:
+            return mapped
+        try:
+            fd = self._file(dim)
+        except FileNotFoundError:
+            return None
+        size = os.fstat(fd).st_size
+        if size < end:
+            return None
+        if mapped is not None:
+            mapped.close()
+        mapped = self._maps[dim] = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        return mapped
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """返回缓存的向量，未命中时返回 None"""
+        key = cache_key(model, text)
+        with self._lock:
+            conn = self._connect()
+            row = None if conn is None else conn.execute("SELECT dim, slot FROM entries WHERE key = ?", (key,)).fetchone()
+            vector = None if row is None else self._read(key, *row)
+            if vector is not None and not self.readonly:
+                conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        Metrics.incr('embedding.cache_hit' if vector is not None else 'embedding.cache_miss')
+        return vector
+
+    def _read(self, key: bytes, dim: int, slot: int) -> Optional[List[float]]:
+        offset = slot * slot_size(dim)
+        mapped = self._map(dim, offset + slot_size(dim))
+        if mapped is None or mapped[offset:offset + _KEY_SIZE] != key:
+            return None
+        view = memoryview(mapped)[offset + _KEY_SIZE:offset + slot_size(dim)]
+        try:
+            vector = view.cast('f').tolist()
+        finally:
+            view.release()
+        # 读取期间槽位被其他进程复用时摘要会改变
+        return vector if mapped[offset:offset + _KEY_SIZE] == key else None
+
+    def put(self, model: str, text: str, vector: Sequence[float]) -> None:
+        """写入向量，已存在或只读时忽略"""
+        dim = len(vector)
+        if self.readonly or not dim or slot_size(dim) > self.max_bytes:
+            return
+        key = cache_key(model, text)
+        data = array('f', vector).tobytes()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is None:
+                    self._evict(conn, slot_size(dim))
+                    slot = self._allocate(conn, dim)
+                    fd = self._file(dim)
+                    offset = slot * slot_size(dim)
+                    # 先清除摘要再写向量，最后写摘要，读取方不会把写了一半的槽位当作命中
+                    os.pwrite(fd, bytes(_KEY_SIZE), offset)
+                    os.pwrite(fd, data, offset + _KEY_SIZE)
+                    os.pwrite(fd, key, offset)
+                    conn.execute("INSERT INTO entries (key, model, dim, slot, last_used) VALUES (?, ?, ?, ?, ?)",
+                                 (key, model, dim, slot, time.time()))
+                    conn.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (slot_size(dim),))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, conn: sqlite3.Connection, size: int) -> None:
+        """淘汰最久未使用的向量，直到能放下 size 字节（在写事务中调用）"""
+        used = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        while used + size > self.max_bytes:
+            rows = conn.execute("SELECT key, dim, slot FROM entries ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, dim, slot in rows:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                conn.execute("INSERT OR IGNORE INTO free_slots (dim, slot) VALUES (?, ?)", (dim, slot))
+                used -= slot_size(dim)
+                Metrics.incr('embedding.cache_evicted')
+                if used + size <= self.max_bytes:
+                    break
+        conn.execute("UPDATE meta SET value = ? WHERE name = 'bytes'", (used,))
+
+    @staticmethod
+    def _allocate(conn: sqlite3.Connection, dim: int) -> int:
+        """优先复用已淘汰的槽位，否则在文件末尾追加（在写事务中调用）"""
+        row = conn.execute("SELECT slot FROM free_slots WHERE dim = ? LIMIT 1", (dim,)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM free_slots WHERE dim = ? AND slot = ?", (dim, row[0]))
+            return row[0]
+        row = conn.execute("SELECT next FROM slots WHERE dim = ?", (dim,)).fetchone()
+        slot = 0 if row is None else row[0]
+        conn.execute("INSERT OR REPLACE INTO slots (dim, next) VALUES (?, ?)", (dim, slot + 1))
+        return slot
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {'entries': 0, 'bytes': 0, 'max_bytes': self.max_bytes}
+            entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            used = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        return {'entries': entries, 'bytes': used, 'max_bytes': self.max_bytes}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                for mapped in self._maps.values():
+                    mapped.close()
+                for fd in self._files.values():
+                    os.close(fd)
+                if self._conn is not None:
+                    self._conn.close()
+            self._conn, self._pid, self._files, self._maps = None, None, {}, {}
@@ -0,0 +1,163 @@
+"""运行时指标模块
+
+提供进程内的计数器、瞬时值、速率与延迟分布统计，并支持跨进程汇总：
+- 每个进程先在本地累计指标（无锁竞争开销极低）
+- 工作进程通过 bind() 绑定 Manager().dict()，定期 flush() 快照
+- 主进程通过 collect() 汇总本地与所有工作进程的快照
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class _Meter:
+    """滑动窗口速率统计（按秒分桶）"""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self.count = 0
+        self.start = time.monotonic()
+        self.buckets = deque()  # (秒, 数量)
+
+    def mark(self, n: int = 1, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        second = int(now)
+        self.count += n
+        if self.buckets and self.buckets[-1][0] == second:
+            self.buckets[-1][1] += n
+        else:
+            self.buckets.append([second, n])
+        self._trim(second)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """窗口内的平均速率（次/秒）"""
+        now = time.monotonic() if now is None else now
+        self._trim(int(now))
+        span = min(self.window, max(now - self.start, 1.0))
+        return sum(n for _, n in self.buckets) / span
+
+    def _trim(self, second: int) -> None:
+        while self.buckets and self.buckets[0][0] <= second - self.window:
+            self.buckets.popleft()
+
+
+class Metrics:
+    """全局指标收集器
+
+    用法：
+        Metrics.incr('dialogue.processed')
+        Metrics.mark('dialogue.throughput')
+        Metrics.observe('dispatch.wait.private', 0.12)
+        Metrics.gauge('dispatch.depth', 10)
+    """
+    _lock = threading.Lock()
+    _counters: Dict[str, float] = {}
+    _gauges: Dict[str, Any] = {}
+    _meters: Dict[str, _Meter] = {}
+    _samples: Dict[str, deque] = {}
+    _shared = None  # Manager().dict() 跨进程快照
+    _scope = 'main'
+    _last_flush = 0.0
+    flush_interval = 1.0
+    sample_size = 1024
+
+    @classmethod
+    def bind(cls, shared, scope: str) -> None:
+        """绑定跨进程共享字典，scope 为当前进程在汇总结果中的名称"""
+        cls._shared = shared
+        cls._scope = scope
+
+    @classmethod
+    def incr(cls, name: str, value: float = 1) -> None:
+        with cls._lock:
+            cls._counters[name] = cls._counters.get(name, 0) + value
+
+    @classmethod
+    def gauge(cls, name: str, value: Any) -> None:
+        with cls._lock:
+            cls._gauges[name] = value
+
+    @classmethod
+    def mark(cls, name: str, n: int = 1) -> None:
+        """记录一次事件，用于计算吞吐量"""
+        with cls._lock:
+            meter = cls._meters.get(name)
+            if meter is None:
+                meter = cls._meters[name] = _Meter()
+            meter.mark(n)
+
+    @classmethod
+    def observe(cls, name: str, value: float) -> None:
+        """记录一个样本（如等待时间），用于计算分位数"""
+        with cls._lock:
+            samples = cls._samples.get(name)
+            if samples is None:
+                samples = cls._samples[name] = deque(maxlen=cls.sample_size)
+            samples.append(value)
+
+    @staticmethod
+    def _percentiles(values) -> Dict[str, float]:
+        ordered = sorted(values)
+        if not ordered:
+            return {'count': 0}
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return {
+            'count': len(ordered),
+            'p50': round(pick(0.50), 6),
+            'p90': round(pick(0.90), 6),
+            'p99': round(pick(0.99), 6),
+            'max': round(ordered[-1], 6),
+        }
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Any]:
+        """当前进程的指标快照"""
+        with cls._lock:
+            return {
+                'counters': dict(cls._counters),
+                'gauges': dict(cls._gauges),
+                'rates': {name: {'total': meter.count, 'per_second': round(meter.rate(), 3)}
+                          for name, meter in cls._meters.items()},
+                'percentiles': {name: cls._percentiles(samples)
+                                for name, samples in cls._samples.items()},
+            }
+
+    @classmethod
+    def flush(cls) -> None:
+        """将当前进程的快照写入共享字典"""
+        if cls._shared is None:
+            return
+        cls._last_flush = time.monotonic()
+        try:
+            cls._shared[cls._scope] = cls.snapshot()
+        except Exception:
+            # Manager 进程退出时忽略写入失败
+            pass
+
+    @classmethod
+    def maybe_flush(cls) -> None:
+        """距离上次 flush 超过 flush_interval 时才写入，避免每条消息一次 RPC"""
+        if time.monotonic() - cls._last_flush >= cls.flush_interval:
+            cls.flush()
+
+    @classmethod
+    def collect(cls) -> Dict[str, Any]:
+        """汇总本进程与所有已绑定进程的指标"""
+        result = {}
+        if cls._shared is not None:
+            try:
+                result.update(dict(cls._shared))
+            except Exception:
+                pass
+        result[cls._scope] = cls.snapshot()
+        return result
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._counters.clear()
+            cls._gauges.clear()
+            cls._meters.clear()
+            cls._samples.clear()